@@ -0,0 +1,148 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+import simplejson as json
+
+# states of the temperature control on the Arduino that drive the heater or the cooler
+heatingStates = (3, 9)  # HEATING, HEATING_MIN_TIME
+coolingStates = (4, 8)  # COOLING, COOLING_MIN_TIME
+
+# temperature columns with min, max and mean statistics
+statsColumns = ('BeerTemp', 'FridgeTemp')
+
+
+class BeerStats:
+	"""
+	Statistics of a beer that are updated with each logged sample, so they never have to be computed from the data
+	files. The time between two samples is counted for the state of the first sample. Gaps longer than maxGap
+	seconds, for example when the script was not running, are not counted.
+	"""
+
+	def __init__(self, maxGap=600):
+		self.maxGap = maxGap
+		self.rows = 0
+		self.firstTime = None
+		self.lastTime = None
+		self.lastState = None
+		self.count = dict((name, 0) for name in statsColumns)
+		self.sum = dict((name, 0.0) for name in statsColumns)
+		self.min = dict((name, None) for name in statsColumns)
+		self.max = dict((name, None) for name in statsColumns)
+		self.stateSeconds = {}
+		self.maxDeviation = None  # largest difference between BeerTemp and BeerSet
+		self.maxDeviationTime = None
+
+	def add(self, row, timestamp):
+		"""
+		Updates the statistics with a logged row, rows should be added in time order
+		"""
+		if self.lastTime is not None and self.lastState is not None:
+			interval = timestamp - self.lastTime
+			if 0 < interval <= self.maxGap:
+				self.stateSeconds[self.lastState] = self.stateSeconds.get(self.lastState, 0) + interval
+		if self.firstTime is None:
+			self.firstTime = timestamp
+		self.lastTime = timestamp
+		self.lastState = row.get('State')
+		if self.lastState is not None:
+			self.lastState = int(self.lastState)
+		self.rows += 1
+
+		for name in statsColumns:
+			value = row.get(name)
+			if value is None:
+				continue
+			value = float(value)
+			self.count[name] += 1
+			self.sum[name] += value
+			if self.min[name] is None or value < self.min[name]:
+				self.min[name] = value
+			if self.max[name] is None or value > self.max[name]:
+				self.max[name] = value
+
+		if row.get('BeerTemp') is not None and row.get('BeerSet') is not None:
+			deviation = float(row['BeerTemp']) - float(row['BeerSet'])
+			if self.maxDeviation is None or abs(deviation) > abs(self.maxDeviation):
+				self.maxDeviation = deviation
+				self.maxDeviationTime = timestamp
+
+	def dutyCycle(self, states):
+		"""
+		Returns the fraction of the counted time that the control was in one of states, None when nothing was counted
+		"""
+		total = sum(self.stateSeconds.values())
+		if not total:
+			return None
+		return sum(self.stateSeconds.get(state, 0) for state in states) / float(total)
+
+	def toDict(self):
+		"""
+		Returns the statistics as a dict that can be sent as JSON
+		"""
+		result = dict(rows=self.rows,
+					  firstTime=self.firstTime,
+					  lastTime=self.lastTime,
+					  stateSeconds=dict((str(state), seconds) for state, seconds in self.stateSeconds.items()),
+					  heatingDutyCycle=self.dutyCycle(heatingStates),
+					  coolingDutyCycle=self.dutyCycle(coolingStates),
+					  maxBeerDeviation=self.maxDeviation,
+					  maxBeerDeviationTime=self.maxDeviationTime)
+		for name in statsColumns:
+			mean = self.sum[name] / self.count[name] if self.count[name] else None
+			result[name] = dict(min=self.min[name], max=self.max[name], mean=mean)
+		return result
+
+	def save(self, fileName):
+		"""
+		Saves the state of the statistics, the file is replaced atomically
+		"""
+		state = dict(self.__dict__)
+		state['stateSeconds'] = self.stateSeconds.items()  # JSON keys are strings, keep the states as numbers
+		tmpName = fileName + '.tmp'
+		f = open(tmpName, 'wb')
+		f.write(json.dumps(state) + '\n')  # a complete line, so the file is never truncated on recovery
+		f.close()
+		if sys.platform.startswith('win') and os.path.exists(fileName):
+			os.remove(fileName)  # rename does not replace existing files on Windows
+		os.rename(tmpName, fileName)
+
+
+def load(fileName, store=None):
+	"""
+	Loads the statistics saved by BeerStats.save. When the file does not exist, cannot be read or does not include all
+	rows of the store, the statistics are computed again from the rows in store.
+
+	Params:
+	fileName: path of the saved statistics
+	store: TimeSeriesStore of the beer or None
+	"""
+	stats = BeerStats()
+	expectedRows = None if store is None else len(store)
+	try:
+		state = json.load(open(fileName, 'rb'))
+		if expectedRows is None or state['rows'] == expectedRows:
+			stats.__dict__.update(state)
+			stats.stateSeconds = dict(state['stateSeconds'])
+			return stats
+	except (IOError, ValueError, KeyError, TypeError):
+		pass
+	if store is not None:
+		for row in store.rows():
+			stats.add(row, row['Time'])
+	return stats
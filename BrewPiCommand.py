@@ -0,0 +1,307 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+import time
+
+# type of the line the Arduino sends in reply to each command, by the first character of the command
+replyTypes = {'c': 'C',  # control constants
+              's': 'S',  # control settings
+              'v': 'V',  # control variables
+              'l': 'L',  # lcd text
+              't': 'T',  # temperatures
+              'n': 'N',  # version
+              'd': 'd',  # installed devices
+              'h': 'h',  # available devices
+              'U': 'U'}  # device update
+
+defaultTimeout = 2  # seconds to wait for a reply
+maxCommandLength = 60  # longer commands can overrun the 64 byte serial receive buffer of the Arduino
+minGap = 0.1  # seconds to wait after a command without a reply before the next command is written
+
+
+def parseSettings(command):
+	"""
+	Splits a settings command like j{mode:b, beerSet:20.0} or j{"mode": "b"} into a list of (key, value) strings.
+	Returns None when the command cannot be split safely, because it contains nested objects, arrays or strings
+	with commas.
+	"""
+	if not (command.startswith('j{') and command.rstrip().endswith('}')):
+		return None
+	body = command.rstrip()[2:-1]
+	if '{' in body or '[' in body:
+		return None
+	settings = []
+	for item in body.split(','):
+		if not item.strip():
+			continue
+		if ':' not in item or item.count('"') % 2:
+			return None  # not a key value pair, or a string with a comma in it
+		key, value = item.split(':', 1)
+		settings.append((key.strip().strip('"'), value.strip()))
+	return settings
+
+
+def settingsCommands(settings, maxLength=maxCommandLength):
+	"""
+	Formats a list of (key, value) settings as few j{} commands as possible that each fit in maxLength bytes
+	"""
+	commands = []
+	items = []
+	for key, value in settings:
+		item = "%s:%s" % (key, value)
+		if items and len("j{" + ",".join(items + [item]) + "}") > maxLength:
+			commands.append("j{" + ",".join(items) + "}")
+			items = []
+		items.append(item)
+	if items:
+		commands.append("j{" + ",".join(items) + "}")
+	return commands
+
+
+class CommandFuture:
+	"""
+	The reply to a command sent to the Arduino, which arrives later
+	"""
+
+	def __init__(self, command, replyType, timeout):
+		self.command = command
+		self.replyType = replyType
+		self.timeout = timeout
+		self.deadline = None  # set when the command is written
+		self.writeTime = None
+		self.line = None
+		self.receivedTime = None
+		self.event = threading.Event()
+
+	def written(self, now):
+		self.writeTime = now
+		self.deadline = now + self.timeout
+
+	def done(self):
+		return self.event.isSet()
+
+	def expired(self, now=None):
+		return not self.done() and self.deadline is not None and (now or time.time()) > self.deadline
+
+	def complete(self, line, receivedTime):
+		self.line = line
+		self.receivedTime = receivedTime
+		self.event.set()
+
+	def cancel(self):
+		"""
+		Completes the command without a reply, when it will never be written or answered
+		"""
+		self.event.set()
+
+	def wait(self, timeout=None):
+		"""
+		Waits for the reply until the timeout of the command has passed after it was written, or for at most timeout
+		seconds.
+
+		Returns:
+		the reply line, or None when no reply was received in time
+		"""
+		end = None if timeout is None else time.time() + timeout
+		while not self.done():
+			now = time.time()
+			deadline = self.deadline if self.deadline is not None else now + self.timeout
+			if end is not None:
+				deadline = min(deadline, end)
+			if deadline <= now:
+				break
+			self.event.wait(min(deadline - now, 0.1))  # check again when the command is still waiting to be written
+		return self.line
+
+
+class ArduinoCommands(threading.Thread):
+	"""
+	Sends commands to the Arduino and matches the lines it sends back to the commands they reply to.
+	The Arduino replies to commands of the same type in the order they were sent, so each reply completes the
+	oldest command of its type that is still waiting. Commands that were not answered in time are dropped.
+
+	Commands are queued and written by a background thread, which paces them so the Arduino can keep up. Only one
+	command that expects a reply is in flight at a time: the next command is written when its reply arrives or when
+	it times out. After a command without a reply, the thread waits for the average reply time of recent commands.
+	While commands are queued, consecutive j{} commands are merged into one and a request that is already queued is
+	not queued again.
+	handleLine can be called from the serial reader thread, while commands are sent from the main thread.
+	"""
+
+	def __init__(self, ser, timeout=defaultTimeout):
+		threading.Thread.__init__(self, name='ArduinoCommands')
+		self.daemon = True
+		self.ser = ser
+		self.timeout = timeout
+		self.pending = dict((replyType, []) for replyType in replyTypes.values())
+		self.outbox = []  # list of [command, future] that are not written yet
+		self.inFlight = None  # future of the last written command that expects a reply
+		self.busyUntil = 0.0  # time the last written command without a reply is expected to be processed
+		self.replyTime = minGap  # moving average of the time the Arduino takes to reply
+		self.condition = threading.Condition()
+		self.running = True
+		self.written = {}  # number of commands and bytes written, by the first character of the command
+
+	def send(self, command, timeout=None):
+		"""
+		Queues a command for the serial port.
+
+		Returns:
+		a CommandFuture that completes when the reply arrives, None when the Arduino does not reply to the command
+		or when the writer thread was stopped
+		"""
+		replyType = replyTypes.get(command[:1])
+		with self.condition:
+			if not self.running:
+				return None  # the serial port is closed, nothing will be written
+			if replyType:
+				for queued, future in self.outbox:
+					if queued == command:
+						return future  # the same request is already waiting to be written
+				future = CommandFuture(command, replyType, timeout or self.timeout)
+				queue = self.pending[replyType]
+				while queue and queue[0].expired():
+					queue.pop(0)  # the Arduino did not reply, do not keep these forever
+				queue.append(future)
+				self.outbox.append([command, future])
+			else:
+				future = None
+				settings = parseSettings(command)
+				if settings and len(command) > maxCommandLength:
+					for part in settingsCommands(settings):
+						self.outbox.append([part, None])
+					self.condition.notify()
+					return None
+				last = self.outbox[-1] if self.outbox else None
+				lastSettings = parseSettings(last[0]) if last else None
+				if settings is not None and lastSettings is not None:
+					merged = dict(lastSettings)
+					order = [key for key, value in lastSettings]
+					for key, value in settings:
+						if key in merged:
+							order.remove(key)  # applied after the keys written before it, like the separate commands
+						order.append(key)
+						merged[key] = value
+					mergedCommands = settingsCommands([(key, merged[key]) for key in order])
+					if len(mergedCommands) == 1:
+						last[0] = mergedCommands[0]
+						return None
+				self.outbox.append([command, None])
+			self.condition.notify()
+		return future
+
+	def nextWrite(self, now):
+		"""
+		Returns the number of seconds until the next queued command can be written, 0 when it can be written now and
+		None when nothing is queued. Call with the lock held.
+		"""
+		if not self.outbox:
+			return None
+		if self.inFlight is not None:
+			if self.inFlight.done() or self.inFlight.expired(now):
+				self.inFlight = None
+			else:
+				return self.inFlight.deadline - now
+		return max(0.0, self.busyUntil - now)
+
+	def pump(self, now=None):
+		"""
+		Writes the queued commands that flow control allows to be written now.
+
+		Returns:
+		number of seconds until the next command can be written, or None when nothing is queued
+		"""
+		if now is None:
+			now = time.time()
+		while True:
+			with self.condition:
+				delay = self.nextWrite(now)
+				if delay is None or delay > 0:
+					return delay
+				command, future = self.outbox.pop(0)
+				if future:
+					future.written(now)
+					self.inFlight = future
+				else:
+					self.busyUntil = now + max(minGap, self.replyTime)
+				self.ser.write(command)
+				written = self.written.setdefault(command[:1], dict(count=0, bytes=0))
+				written['count'] += 1
+				written['bytes'] += len(command)
+
+	def run(self):
+		while self.running:
+			delay = self.pump()
+			with self.condition:
+				if self.running and self.nextWrite(time.time()) != 0:
+					self.condition.wait(delay if delay is not None else 1)
+
+	def stop(self):
+		"""
+		Stops the writer thread. Queued commands are dropped and the commands waiting for a reply are cancelled, so
+		deferred replies to clients that wait for them are sent with the current values.
+		"""
+		with self.condition:
+			self.running = False
+			for queue in self.pending.values():
+				for future in queue:
+					future.cancel()
+				del queue[:]
+			self.outbox = []
+			self.inFlight = None
+			self.condition.notify()
+		if self.isAlive() and threading.currentThread() is not self:
+			self.join()
+
+	def handleLine(self, line, receivedTime=None):
+		"""
+		Completes the oldest waiting command that the line replies to.
+
+		Returns:
+		the completed CommandFuture or None
+		"""
+		queue = self.pending.get(line[:1])
+		if queue is None:
+			return None
+		now = receivedTime or time.time()
+		with self.condition:
+			while queue and queue[0].expired(now):
+				queue.pop(0)
+			if not queue or queue[0].writeTime is None:
+				return None  # not a reply to a command that was sent by this class
+			future = queue.pop(0)
+			self.replyTime = 0.8 * self.replyTime + 0.2 * max(0.0, now - future.writeTime)
+			future.complete(line, now)
+			self.condition.notify()  # the next command can be written
+		return future
+
+	def writeStats(self):
+		"""
+		Returns the number of commands and bytes written for each type of command
+		"""
+		with self.condition:
+			return dict((commandType, dict(written)) for commandType, written in self.written.items())
+
+	def waiting(self, replyType):
+		"""
+		Returns the last command of a reply type that is still waiting for its reply, or None
+		"""
+		with self.condition:
+			for future in reversed(self.pending.get(replyType, [])):
+				if not future.expired():
+					return future
+		return None
@@ -0,0 +1,866 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import socket
+import time
+import urllib
+
+import serial
+import simplejson as json
+
+import temperatureProfile
+import programArduino as programmer
+import BrewPiUtil as util
+from brewpiVersion import AvrInfo
+import pinList
+import expandLogMessage
+import BrewPiRollup
+import BrewPiDataLogger
+import BrewPiSerial
+import BrewPiCommand
+import BrewPiDispatcher
+import BrewPiDecoder
+import BrewPiPoller
+import BrewPiRecorder
+import BrewPiSocket
+import BrewPiReplyCache
+import BrewPiEvents
+import BrewPiHttp
+import BrewPiMetrics
+
+compatibleBrewpiVersion = "0.2.0"
+
+serialCheckInterval = 0.5  # seconds between checks of the serial port
+
+versionRetries = 5  # number of times the version is requested before the Arduino is considered not programmed
+
+# seconds before the serial port is opened again after it failed, doubled after each failed attempt up to the maximum
+serialRetryDelay = 5
+maxSerialRetryDelay = 300
+
+# attributes with the state that socket clients can subscribe to, and their topics
+stateTopics = dict(prevTempJson='temperatures', lcdText='lcd', cs='cs', cc='cc', cv='cv')
+
+invalidMessage = object()  # returned by handleRequest for messages of an unknown type
+
+
+class Controller:
+	"""
+	One Arduino running BrewPi, with its own config file, serial port, socket, beer and data files.
+	The script can run several controllers in one process. The main loop passes the messages received on the socket
+	of a controller to handleMessage and calls poll every serialCheckInterval seconds to do the serial communication.
+	"""
+
+	def __init__(self, configFile, name=None):
+		"""
+		Args:
+		configFile: path of the config file of the controller, or None for the default config
+		name: name that is added to the log messages of the controller, when several controllers run in one process
+		"""
+		self.configFile = configFile
+		self.config = util.readCfgWithDefaults(configFile)
+		self.name = name
+		self.dontRunFilePath = self.config['wwwPath'] + 'do_not_run_brewpi'
+		# the data files are copied to the www directory, unless the web server reads them from the HTTP server
+		self.copyDataToWww = str(self.config.get('copyDataToWww', True)).lower() == 'true'
+
+		# Settings will be read from Arduino, initialize with same defaults as Arduino
+		# This is mainly to show what's expected. Will all be overwritten on the first update from the arduino
+
+		# Control Settings
+		self.cs = dict(mode='b', beerSetting=20.0, fridgeSetting=20.0, heatEstimator=0.2, coolEstimator=5)
+
+		# Control Constants
+		self.cc = dict(tempFormat="C", tempSetMin=1.0, tempSetMax=30.0, Kp=20.000, Ki=0.600, Kd=-3.000, iMaxErr=0.500,
+					   idleRangeH=1.000, idleRangeL=-1.000, heatTargetH=0.301, heatTargetL=-0.199, coolTargetH=0.199,
+					   coolTargetL=-0.301, maxHeatTimeForEst="600", maxCoolTimeForEst="1200", fridgeFastFilt="1",
+					   fridgeSlowFilt="4", fridgeSlopeFilt="3", beerFastFilt="3", beerSlowFilt="5",
+					   beerSlopeFilt="4", lah=0, hs=0)
+
+		# Control variables
+		self.cv = dict(beerDiff=0.000, diffIntegral=0.000, beerSlope=0.000, p=0.000, i=0.000, d=0.000, estPeak=0.000,
+					   negPeakEst=0.000, posPeakEst=0.000, negPeak=0.000, posPeak=0.000)
+
+		# listState = "", "d", "h", "dh" to reflect whether the list is up to date for installed (d) and available (h)
+		self.deviceList = dict(listState="", installed=[], available=[])
+
+		self.lcdText = ['Script starting up', ' ', ' ', ' ']
+
+		self.prevTempJson = {
+			"BeerTemp": 0,
+			"FridgeTemp": 0,
+			"BeerAnn": None,
+			"FridgeAnn": None,
+			"RoomTemp": None,
+			"State": None,
+			"BeerSet": 0,
+			"FridgeSet": 0}
+		self.outputTemperature = True
+
+		self.day = ""
+		# timings and counters of this controller, reported by getStats and written every statsInterval seconds
+		self.metrics = BrewPiMetrics.Metrics()
+		self.statsInterval = float(self.config.get('statsInterval', 0))
+		self.nextStatsDump = time.time() + self.statsInterval
+		# all logged data goes through the data logger, which writes it to disk in batches
+		self.dataLogger = BrewPiDataLogger.DataLogger(self.config.get('dataFlushRows', 1),
+													  self.config.get('dataFlushInterval', 0),
+													  str(self.config.get('dataFsync', True)).lower() == 'true',
+													  int(self.config.get('chartPoints', 1000)),
+													  self.metrics)
+		self.poller = BrewPiPoller.DemandPoller(serialCheckInterval, self.config.get('idlePollInterval', 60))
+
+		self.ser = None
+		self.commands = None
+		self.serialReader = None
+		self.socket = None  # BrewPiSocket with the listening socket
+		self.httpSocket = None  # listening socket of the HTTP server, when httpPort is set
+
+		self.avrVersion = None
+		self.brewpiVersion = None
+		self.versionRequests = 0
+		self.startTime = None  # time the Arduino is expected to be ready after a reset
+		self.nextVersionRequest = None
+		self.serialRetryTime = None  # time to open the serial port again after it failed
+		self.serialRetryDelay = serialRetryDelay
+
+		self.prevDataTime = 0.0  # keep track of time between new data requests
+		self.prevTimeOut = time.time()
+		self.pollNow = False  # set to do the serial communication right after handling a message
+		self.running = True
+		self.restart = False  # set when the script should restart, after programming the Arduino
+		self.stopProcess = False  # set when all controllers of the process should stop, not only this one
+
+		# encoded replies to the getters, invalidated when the state they are built from changes
+		self.replyCache = BrewPiReplyCache.ReplyCache()
+		# socket clients that subscribed to changes of the state
+		self.publisher = BrewPiEvents.Publisher()
+
+		# handlers of the lines received from the Arduino, by their first character
+		self.lineDispatcher = BrewPiDispatcher.LineDispatcher(self.handleDecodeError, self.handleUnknownLine)
+		self.lineDispatcher.register('T', self.handleTemperatures, BrewPiDecoder.decodeTemperatures)
+		self.lineDispatcher.register('D', self.handleDebugMessage, None)
+		self.lineDispatcher.register('L', self.handleLcd, BrewPiDecoder.decodeLcd)
+		self.lineDispatcher.register('C', self.handleControlConstants)
+		self.lineDispatcher.register('S', self.handleControlSettings)
+		self.lineDispatcher.register('V', self.handleControlVariables)
+		self.lineDispatcher.register('N', self.handleVersion, AvrInfo)
+		self.lineDispatcher.register('h', self.handleDeviceList)
+		self.lineDispatcher.register('d', self.handleDeviceList)
+		self.lineDispatcher.register('U', self.handleDeviceUpdate, None)
+
+	def logMessage(self, message):
+		if self.name:
+			message = self.name + ": " + message
+		util.logMessage(message)
+
+	def changeWwwSetting(self, settingName, value):
+		# wwwSettings.json is a copy of some of the settings for the web server
+		wwwSettingsFile = open(self.config['wwwPath'] + 'wwwSettings.json', 'r+b')
+		wwwSettings = json.load(wwwSettingsFile)
+		wwwSettings[settingName] = value
+		wwwSettingsFile.seek(0)
+		wwwSettingsFile.write(json.dumps(wwwSettings))
+		wwwSettingsFile.truncate()
+		wwwSettingsFile.close()
+
+	def startBeer(self, beerName):
+		config = self.config
+
+		# create directory for the data if it does not exist
+		dataPath = util.addSlash(config['scriptPath']) + 'data/' + beerName + '/'
+		wwwDataPath = util.addSlash(config['wwwPath']) + 'data/' + beerName + '/'
+
+		if not os.path.exists(dataPath):
+			os.makedirs(dataPath)
+			os.chmod(dataPath, 0775)  # give group all permissions
+		if not self.copyDataToWww:
+			wwwDataPath = None
+		elif not os.path.exists(wwwDataPath):
+			os.makedirs(wwwDataPath)
+			os.chmod(wwwDataPath, 0775)  # sudgive group all permissions
+
+		# Keep track of day and make new data tabe for each day
+		# This limits data table size, which can grow very big otherwise
+		self.day = time.strftime("%Y-%m-%d")
+		# define a JSON file to store the data table
+		jsonFileName = config['beerName'] + '-' + self.day
+		#if a file for today already existed, add suffix
+		if os.path.isfile(dataPath + jsonFileName + '.json'):
+			i = 1
+			while os.path.isfile(dataPath + jsonFileName + '-' + str(i) + '.json'):
+				i += 1
+			jsonFileName = jsonFileName + '-' + str(i)
+		# open the JSON data table and the CSV file, the data logger copies them to the web server after writing
+		self.dataLogger.startBeer(dataPath, wwwDataPath, beerName, jsonFileName + '.json')
+		self.changeWwwSetting('beerName', beerName)
+
+	def openSerial(self):
+		"""
+		Opens the serial port, or replays the data read in a recorded session when serialReplay is set, and starts
+		the threads that read and write it.
+
+		Returns:
+		False when the port cannot be opened
+		"""
+		config = self.config
+		try:
+			port = config['port']
+			if config.get('serialReplay'):
+				self.ser = BrewPiRecorder.ReplaySerial(config['serialReplay'], config.get('serialReplaySpeed', 1))
+				self.logMessage("Replaying serial capture " + config['serialReplay'] + " instead of reading " + port)
+			else:
+				self.ser = serial.Serial(port, 57600, timeout=0.1)  # use non blocking serial.
+		except (serial.SerialException, IOError, ValueError), e:
+			self.logMessage("Error opening serial port: %s" % e)
+			return False
+
+		# record the serial traffic in both directions with timestamps, print a capture with BrewPiRecorder.py
+		captureFileName = config.get('serialCapture')
+		if not captureFileName and config.get('dumpSerial', False):
+			captureFileName = util.addSlash(config['scriptPath']) + 'logs/serial.capture'
+		if captureFileName:
+			self.ser = BrewPiRecorder.RecordingSerial(self.ser, captureFileName)
+			self.logMessage("Recording serial traffic to " + captureFileName)
+
+		# commands that expect a reply are sent through commands, which matches the replies to the commands
+		self.commands = BrewPiCommand.ArduinoCommands(self.ser)
+		# read the serial port in a background thread, lines are taken from its queue without waiting
+		self.serialReader = BrewPiSerial.SerialReader(self.ser, self.commands.handleLine)
+		self.serialReader.start()
+		self.commands.start()
+
+		# wait for 10 seconds to allow an Uno to reboot (in case an Uno is being used)
+		self.startTime = time.time() + float(config.get('startupDelay', 10))
+		self.nextVersionRequest = self.startTime
+		return True
+
+	def reopenSerial(self, now):
+		"""
+		Opens the serial port again after it failed. When it cannot be opened, the next attempt is scheduled with a
+		longer delay. The other controllers of the process keep running meanwhile.
+		"""
+		if self.openSerial():
+			self.logMessage("Serial port reopened")
+			self.serialRetryTime = None
+			self.serialRetryDelay = serialRetryDelay
+			self.brewpiVersion = None  # the Arduino may have been reset or replaced, recognize it again
+			self.versionRequests = 0
+		else:
+			self.serialRetryTime = now + self.serialRetryDelay
+			self.serialRetryDelay = min(self.serialRetryDelay * 2, maxSerialRetryDelay)
+
+	def closeSerial(self):
+		if self.ser:
+			self.commands.stop()
+			self.serialReader.stop()  # stop reading before the port is closed
+			self.ser.close()
+			self.ser = None
+
+	def openSocket(self):
+		"""
+		Creates the listening socket to communicate with PHP, messages are passed to handleMessage by a SocketServer
+		"""
+		self.socket = BrewPiSocket.BrewPiSocket(self.config)
+		self.socket.create()
+		self.socket.sock.listen(10)  # Create a backlog queue for up to 10 connections
+
+	def openHttp(self):
+		"""
+		Creates the listening socket of the HTTP server when httpPort is set. The script also runs without it when
+		the port cannot be used.
+		"""
+		port = self.config.get('httpPort')
+		if not port:
+			return
+		host = self.config.get('httpHost', '127.0.0.1')
+		try:
+			self.httpSocket = BrewPiHttp.listen(host, port)
+			self.logMessage("HTTP server listening on %s:%s" % (host, port))
+		except (socket.error, ValueError), e:
+			self.logMessage("Error: cannot start HTTP server on %s:%s: %s" % (host, port, e))
+
+	def listeners(self):
+		"""
+		Returns the listening sockets of the controller for a SocketServer, as (socket, handler, connection class)
+		"""
+		listeners = [(self.socket.sock, self.handleMessage, None)]
+		if self.httpSocket:
+			listeners.append((self.httpSocket, BrewPiHttp.HttpHandler(self).handle, BrewPiHttp.HttpConnection))
+		return listeners
+
+	def liveState(self):
+		"""
+		Returns the state that socket clients can subscribe to, by topic
+		"""
+		return dict((topic, getattr(self, name)) for name, topic in stateTopics.items())
+
+	def start(self):
+		"""
+		Starts logging the beer in the config and opens the serial port and the socket.
+
+		Returns:
+		False when the serial port cannot be opened
+		"""
+		self.startBeer(self.config['beerName'])
+		if not self.openSerial():
+			return False
+		self.openSocket()
+		self.openHttp()
+		self.logMessage("Notification: Script started for beer '" + self.config['beerName'] + "'")
+		return True
+
+	def close(self):
+		self.dataLogger.close()  # write buffered data
+		self.closeSerial()
+		if self.socket:
+			self.socket.sock.close()
+			if self.socket.file and os.path.exists(self.socket.file):
+				os.remove(self.socket.file)
+			self.socket = None
+		if self.httpSocket:
+			self.httpSocket.close()
+			self.httpSocket = None
+
+	def freshReply(self, replyType, name):
+		"""
+		Returns the reply to a get request for the settings in attribute name. When a refresh command was sent
+		earlier, the reply is deferred until the new values are received, so a get request that follows a refresh
+		request returns them. The current values are sent when no valid reply is received in time, or when the serial
+		port is closed before the reply arrives.
+		"""
+		future = self.commands.waiting(replyType)
+		if future is None:
+			return self.encodedState(name)
+
+		def result():
+			line = future.line
+			if line:
+				try:
+					self.updateState(name, json.loads(line[2:]))
+				except json.JSONDecodeError:
+					self.logMessage("JSON decode error in reply to '" + future.command + "': " + line)
+			return self.encodedState(name)
+		return BrewPiSocket.DeferredReply(lambda: future.done() or future.expired(), result)
+
+	def encodedState(self, name):
+		"""
+		Returns attribute name encoded as JSON, from the reply cache when it did not change since it was encoded
+		"""
+		return self.replyCache.get(name, lambda: json.dumps(getattr(self, name)))
+
+	def updateState(self, name, value):
+		"""
+		Sets attribute name to a value received from the Arduino. The cached reply is only dropped when the value
+		differs from the current one, the Arduino sends the same values over and over.
+		"""
+		old = getattr(self, name)
+		if value != old:
+			setattr(self, name, value)
+			self.replyCache.invalidate(name)
+			self.publisher.publish(stateTopics[name], old, value)
+
+	def updateControlSettings(self, **settings):
+		"""
+		Changes the local copy of the control settings, after sending the new settings to the Arduino
+		"""
+		old = dict(self.cs)
+		self.cs.update(settings)
+		self.replyCache.invalidate('cs')
+		self.publisher.publish('cs', old, self.cs)
+
+	def invalidateDeviceList(self):
+		self.deviceList['listState'] = ""
+		self.replyCache.invalidate('deviceList')
+
+	def encodedDeviceList(self):
+		"""
+		Returns the reply to getDeviceList. The pin list of a board only depends on the board and shield type, so it
+		is cached separately and kept when the device list changes.
+		"""
+		avrVersion = self.avrVersion
+		pinListKey = ('pinList', avrVersion.board, avrVersion.shield)
+		pins = self.replyCache.get(pinListKey, lambda: pinList.getPinList(avrVersion.board, avrVersion.shield))
+		response = dict(board=avrVersion.board,
+						shield=avrVersion.shield,
+						deviceList=self.deviceList,
+						pinList=pins)
+		return json.dumps(response)
+
+	def handleTemperatures(self, newData, line, lineTime):
+		# print it to stdout
+		if self.outputTemperature:
+			print time.strftime("%b %d %Y %H:%M:%S  ") + line[2:].rstrip('\r\n')
+		# copy keys, these were renamed by the decoder
+		oldRow = dict(self.prevTempJson)
+		self.prevTempJson.update(newData)
+
+		newRow = self.prevTempJson
+		try:
+			self.dataLogger.add(newRow, lineTime)
+			self.publisher.publish('temperatures', oldRow, newRow, lineTime)
+		except KeyError, e:
+			self.logMessage("KeyError in line from Arduino: %s" % e)
+		# store time of last new data for interval check
+		self.prevDataTime = time.time()
+
+	def handleDebugMessage(self, data, line, lineTime):
+		try:
+			expandedMessage = expandLogMessage.expandLogMessage(data)
+			self.logMessage("Arduino debug message: " + expandedMessage)
+		except Exception, e:  # catch all exceptions, because out of date file could cause errors
+			self.logMessage("Error while expanding log message '" + data + "'" + str(e))
+
+	def handleLcd(self, lcdText, line, lineTime):
+		self.updateState('lcdText', lcdText)
+
+	def handleControlConstants(self, cc, line, lineTime):
+		self.updateState('cc', cc)
+
+	def handleControlSettings(self, cs, line, lineTime):
+		self.updateState('cs', cs)
+
+	def handleControlVariables(self, cv, line, lineTime):
+		self.updateState('cv', cv)
+
+	def handleVersion(self, avrVersion, line, lineTime):
+		if self.brewpiVersion is not None:
+			return  # version number received again. Do nothing, just ignore
+		self.avrVersion = avrVersion
+		self.brewpiVersion = avrVersion.version
+		self.replyCache.invalidate('deviceList')  # contains the board and shield type
+		self.logMessage("Found Arduino " + str(avrVersion.board) +
+						" with a " + str(avrVersion.shield) + " shield, " +
+						"running BrewPi version " + str(self.brewpiVersion) +
+						" build " + str(avrVersion.build))
+		if self.brewpiVersion != compatibleBrewpiVersion:
+			self.logMessage("Warning: BrewPi version compatible with this script is " +
+							compatibleBrewpiVersion +
+							" but version number received is " + str(self.brewpiVersion))
+		if int(avrVersion.log) != int(expandLogMessage.getVersion()):
+			self.logMessage("Warning: version number of local copy of logMessages.h " +
+							"does not match log version number received from Arduino." +
+							"Arduino version = " + str(avrVersion.log) +
+							", local copy version = " + str(expandLogMessage.getVersion()))
+		# request settings from Arduino, processed later when reply is received
+		self.commands.send('s')  # request control settings cs
+		self.commands.send('c')  # request control constants cc
+
+	def handleDeviceList(self, devices, line, lineTime):
+		listType = line[0]  # 'h' for available devices, 'd' for installed devices
+		self.deviceList['available' if listType == 'h' else 'installed'] = devices
+		self.deviceList['listState'] = self.deviceList['listState'].strip(listType) + listType
+		self.replyCache.invalidate('deviceList')
+		self.logMessage(("Available" if listType == 'h' else "Installed") + " devices received: " + str(devices))
+
+	def handleDeviceUpdate(self, data, line, lineTime):
+		self.logMessage("Device updated to: " + data)
+
+	def handleDecodeError(self, line, e):
+		self.metrics.count('decodeErrors')
+		self.logMessage("JSON decode error: %s" % e)
+		self.logMessage("Line received was: " + line)
+
+	def handleUnknownLine(self, line):
+		self.logMessage("Cannot process line from Arduino: " + line)
+
+	def handleMessage(self, message):
+		"""
+		Handles a message received on the socket of the controller, and records the time it took by message type.
+
+		Returns:
+		the reply to send back, or None when the message has no reply
+		"""
+		start = time.time()
+		reply = None
+		try:
+			reply = self.handleRequest(message)
+			return None if reply is invalidMessage else reply
+		finally:
+			messageType = 'invalid' if reply is invalidMessage else message.split("=", 1)[0]
+			self.metrics.add('request.' + messageType, time.time() - start)
+
+	def handleRequest(self, message):
+		"""
+		Returns the reply to a message like handleMessage, or invalidMessage when the type of the message is unknown
+		"""
+		config = self.config
+		commands = self.commands
+		cs = self.cs
+		cc = self.cc
+		if "=" in message:
+			messageType, value = message.split("=", 1)
+		else:
+			messageType = message
+			value = ""
+		if messageType == "ack":  # acknowledge request
+			return 'ack'
+		elif messageType == "lcd":  # lcd contents requested
+			self.poller.demand('l')
+			return self.encodedState('lcdText')
+		elif messageType == "getMode":  # echo cs['mode'] setting
+			self.poller.demand('s')
+			return cs['mode']
+		elif messageType == "getFridge":  # echo fridge temperature setting
+			self.poller.demand('s')
+			return str(cs['fridgeSet'])
+		elif messageType == "getBeer":  # echo fridge temperature setting
+			self.poller.demand('s')
+			return str(cs['beerSet'])
+		elif messageType == "getControlConstants":
+			return self.freshReply('C', 'cc')
+		elif messageType == "getControlSettings":
+			self.poller.demand('s')
+			return self.freshReply('S', 'cs')
+		elif messageType == "getControlVariables":
+			return self.freshReply('V', 'cv')
+		elif messageType == "refreshControlConstants":
+			commands.send("c")
+		elif messageType == "refreshControlSettings":
+			commands.send("s")
+		elif messageType == "refreshControlVariables":
+			commands.send("v")
+		elif messageType == "loadDefaultControlSettings":
+			commands.send("S")
+			self.pollNow = True
+		elif messageType == "loadDefaultControlConstants":
+			commands.send("C")
+			self.pollNow = True
+		elif messageType == "setBeer":  # new constant beer temperature received
+			newTemp = float(value)
+			if cc['tempSetMin'] < newTemp < cc['tempSetMax']:
+				# round to 2 dec, python will otherwise produce 6.999999999
+				self.updateControlSettings(mode='b', beerSet=round(newTemp, 2))
+				commands.send("j{mode:b, beerSet:" + str(cs['beerSet']) + "}")
+				self.logMessage("Notification: Beer temperature set to " +
+								str(cs['beerSet']) +
+								" degrees in web interface")
+				self.pollNow = True  # go to serial communication to update Arduino
+			else:
+				self.logMessage("Beer temperature setting " + str(newTemp) +
+								" is outside allowed range " +
+								str(cc['tempSetMin']) + "-" + str(cc['tempSetMax']))
+		elif messageType == "setFridge":  # new constant fridge temperature received
+			newTemp = float(value)
+			if cc['tempSetMin'] < newTemp < cc['tempSetMax']:
+				self.updateControlSettings(mode='f', fridgeSet=round(newTemp, 2))
+				commands.send("j{mode:f, fridgeSet:" + str(cs['fridgeSet']) + "}")
+				self.logMessage("Notification: Fridge temperature set to " +
+								str(cs['fridgeSet']) +
+								" degrees in web interface")
+				self.pollNow = True  # go to serial communication to update Arduino
+		elif messageType == "setProfile":  # cs['mode'] set to profile
+			# read temperatures from currentprofile.csv
+			self.updateControlSettings(mode='p', beerSet=temperatureProfile.getNewTemp(config['scriptPath']))
+			commands.send("j{mode:p, beerSet:" + str(cs['beerSet']) + "}")
+			self.logMessage("Notification: Profile mode enabled")
+			self.pollNow = True  # go to serial communication to update Arduino
+		elif messageType == "setOff":  # cs['mode'] set to OFF
+			self.updateControlSettings(mode='o')
+			commands.send("j{mode:o}")
+			self.logMessage("Notification: Temperature control disabled")
+			self.pollNow = True
+		elif messageType == "setParameters":
+			# receive JSON key:value pairs to set parameters on the Arduino
+			try:
+				decoded = json.loads(value)
+				commands.send("j" + json.dumps(decoded))
+				if 'tempFormat' in decoded:
+					self.changeWwwSetting('tempFormat', decoded['tempFormat'])  # change in web interface settings too.
+			except json.JSONDecodeError:
+				self.logMessage("Error: invalid JSON parameter string received: " + value[:100])
+			self.pollNow = True
+		elif messageType == "stopScript":  # exit instruction received. Stop script.
+			# voluntary shutdown.
+			# write a file to prevent the cron job from restarting the script
+			self.logMessage("stopScript message received on socket. " +
+							"Stopping script and writing dontrunfile to prevent automatic restart")
+			# the other controllers of the process stop too, the cron job starts the ones without a dontrunfile
+			self.running = False
+			self.stopProcess = True
+			dontrunfile = open(self.dontRunFilePath, "w")
+			dontrunfile.write("1")
+			dontrunfile.close()
+		elif messageType == "quit":  # quit instruction received. Probably sent by another brewpi script instance
+			self.logMessage("quit message received on socket. Stopping script.")
+			# brewpi.py --quit only reaches the socket of the first config, so quit stops the whole process
+			self.running = False
+			self.stopProcess = True
+			# Leave dontrunfile alone.
+			# This instruction is meant to restart the script or replace it with another instance.
+		elif messageType == "eraseLogs":
+			# erase the log files for stderr and stdout
+			open(util.scriptPath() + '/logs/stderr.txt', 'wb').close()
+			open(util.scriptPath() + '/logs/stdout.txt', 'wb').close()
+			self.logMessage("Fresh start! Log files erased.")
+		elif messageType == "interval":  # new interval received
+			newInterval = int(value)
+			if 5 < newInterval < 5000:
+				self.config = util.configSet(self.configFile, 'interval', float(newInterval))
+				self.logMessage("Notification: Interval changed to " +
+								str(newInterval) + " seconds")
+		elif messageType == "name":  # new beer name
+			newName = value
+			if len(newName) > 3:     # shorter names are probably invalid
+				self.config = util.configSet(self.configFile, 'beerName', newName)
+				self.startBeer(newName)
+				self.logMessage("Notification: restarted for beer: " + newName)
+		elif messageType == "profileKey":
+			self.config = util.configSet(self.configFile, 'profileKey', value)
+			self.changeWwwSetting('profileKey', value)
+		elif messageType == "uploadProfile":
+			# use urllib to download the profile as a CSV file
+			profileUrl = ("https://spreadsheets.google.com/tq?key=" +
+						  config['profileKey'] +
+						  "&tq=select D,E&tqx=out:csv")  # select the right cells and CSV format
+			profileFileName = config['scriptPath'] + 'settings/tempProfile.csv'
+			if os.path.isfile(profileFileName + '.old'):
+				os.remove(profileFileName + '.old')
+			os.rename(profileFileName, profileFileName + '.old')
+			urllib.urlretrieve(profileUrl, profileFileName)
+			if os.path.isfile(profileFileName):
+				return "Profile successfuly updated"
+			else:
+				return "Failed to update profile"
+		elif messageType == "programArduino":
+			self.closeSerial()  # close serial port before programming
+			try:
+				programParameters = json.loads(value)
+				hexFile = programParameters['fileName']
+				boardType = programParameters['boardType']
+				restoreSettings = programParameters['restoreSettings']
+				restoreDevices = programParameters['restoreDevices']
+				programmer.programArduino(config, boardType, hexFile,
+										  {'settings': restoreSettings, 'devices': restoreDevices})
+				self.logMessage("New program uploaded to Arduino, script will restart")
+			except json.JSONDecodeError:
+				self.logMessage("Error: cannot decode programming parameters: " + value)
+				self.logMessage("Restarting script without programming.")
+			# the script is restarted by the main loop when all controllers are closed
+			self.running = False
+			self.restart = True
+		elif messageType == "refreshDeviceList":
+			self.invalidateDeviceList()  # invalidate local copy
+			if value.find("readValues") != -1:
+				# reading the values of the devices takes a while
+				commands.send("d{r:1}", 10)  # request installed devices
+				commands.send("h{u:-1,v:1}", 10)  # request available, but not installed devices
+			else:
+				commands.send("d{}")  # request installed devices
+				commands.send("h{u:-1}")  # request available, but not installed devices
+		elif messageType == "getData":  # logged data of the current beer in a time range
+			try:
+				query = json.loads(value) if value else {}
+				return BrewPiRollup.queryJson(self.dataLogger.store, query.get('from'), query.get('to'),
+											  query.get('resolution', 0))
+			except (ValueError, TypeError, AttributeError):
+				self.logMessage("Error: invalid data query received: " + value[:100])
+		elif messageType == "batch":  # several messages at once, the replies are sent back together
+			return self.handleBatch(value)
+		elif messageType == "subscribe":  # keep the connection open and push changes of the state
+			try:
+				return self.publisher.subscribe(value, self.liveState())
+			except ValueError, e:
+				self.logMessage("Error: invalid subscription received: %s" % e)
+		elif messageType == "getBeerStats":  # statistics of the current beer
+			if self.dataLogger.stats:
+				return json.dumps(self.dataLogger.stats.toDict())
+			else:
+				return json.dumps({})
+		elif messageType == "getDeviceList":
+			if self.deviceList['listState'] in ["dh", "hd"]:
+				return self.replyCache.get('deviceList', self.encodedDeviceList)
+			else:
+				return "device-list-not-up-to-date"
+		elif messageType == "applyDevice":
+			try:
+				configStringJson = json.loads(value)  # load as JSON to check syntax
+			except json.JSONDecodeError:
+				self.logMessage("Error: invalid JSON parameter string received: " + value[:100])
+				return None
+			commands.send("U" + value)
+			self.invalidateDeviceList()  # invalidate local copy
+		elif messageType == "getStats":  # timings and counters, to find out where the time goes
+			return json.dumps(self.stats())
+		else:
+			self.logMessage("Error: Received invalid message on socket: " + message[:100])
+			return invalidMessage
+		return None
+
+	def stats(self):
+		"""
+		Returns the metrics of the process and of this controller as a dict that can be sent as JSON.
+		Lines received are counted by type by the line dispatcher, commands written by the first character.
+		"""
+		return dict(process=BrewPiMetrics.processDict(),
+					controller=self.metrics.toDict(),
+					serialIn=self.lineDispatcher.statsDict(),
+					serialOut=self.commands.writeStats() if self.commands else {},
+					replyCache=self.replyCache.toDict(),
+					subscriptions=len(self.publisher.subscriptions))
+
+	def dumpStatsIfDue(self, now):
+		"""
+		Writes the stats to statsFile every statsInterval seconds, when statsInterval is set
+		"""
+		if not self.statsInterval or now < self.nextStatsDump:
+			return
+		self.nextStatsDump = now + self.statsInterval
+		statsFileName = self.config.get('statsFile', util.addSlash(self.config['scriptPath']) + 'logs/stats.json')
+		try:
+			statsFile = open(statsFileName + '.tmp', 'w')
+			json.dump(self.stats(), statsFile, indent=1, sort_keys=True)
+			statsFile.close()
+			os.rename(statsFileName + '.tmp', statsFileName)  # readers never see a partly written file
+		except (IOError, OSError), e:
+			self.logMessage("Error: cannot write stats to %s: %s" % (statsFileName, e))
+
+	def handleBatch(self, value):
+		"""
+		Handles the messages in a JSON list, like ["lcd", "getMode", "setBeer=20"], and returns their replies as one
+		JSON list in the same order, with null for messages without a reply. The messages are handled one after the
+		other without reading from the Arduino in between, and their replies are encoded right away, so they are
+		taken from the same state. Only a getter that waits for fresh values after a refresh is answered later, with
+		the values received then, and the reply to the whole batch waits for it.
+		The time of the batch is recorded as one request.batch, not per message.
+		"""
+		try:
+			messages = json.loads(value)
+			if not isinstance(messages, list) or not all(isinstance(message, basestring) for message in messages):
+				raise ValueError("batch is not a list of messages")
+		except ValueError, e:
+			self.logMessage("Error: invalid batch received: %s" % e)
+			return None
+		replies = []  # encoded replies, or DeferredReply for fresh getters
+		deferred = []
+		for message in messages:
+			message = message.encode('utf-8')
+			reply = None
+			if message.split("=", 1)[0] in ["batch", "subscribe"]:
+				self.logMessage("Error: message not allowed in a batch: " + message[:100])
+			else:
+				reply = self.handleRequest(message)
+			if isinstance(reply, BrewPiSocket.DeferredReply):
+				deferred.append(reply)
+				replies.append(reply)
+			else:
+				replies.append(json.dumps(None if reply is invalidMessage else reply))
+		if not deferred:
+			return "[" + ", ".join(replies) + "]"
+
+		def result():
+			return "[" + ", ".join(json.dumps(reply.result()) if isinstance(reply, BrewPiSocket.DeferredReply) else reply
+								   for reply in replies) + "]"
+		return BrewPiSocket.DeferredReply(lambda: all(reply.ready() for reply in deferred), result)
+
+	def pollDue(self, now):
+		"""
+		Returns the number of seconds until poll should be called, 0 or less when it should be called now
+		"""
+		if self.pollNow:
+			return 0
+		return self.prevTimeOut + serialCheckInterval - now
+
+	def poll(self, now=None):
+		"""
+		Does the serial communication and updates the settings, called every serialCheckInterval seconds
+		"""
+		if now is None:
+			now = time.time()
+		self.prevTimeOut = now
+		self.pollNow = False
+		config = self.config
+
+		# Check whether it is a new day
+		lastDay = self.day
+		self.day = time.strftime("%Y-%m-%d")
+		if lastDay != self.day:
+			self.logMessage("Notification: New day, dropping data table and creating new JSON file.")
+			jsonFileName = config['beerName'] + '/' + config['beerName'] + '-' + self.day
+			wwwJsonFileName = None
+			if self.copyDataToWww:
+				wwwJsonFileName = util.addSlash(config['wwwPath']) + 'data/' + jsonFileName + '.json'
+			# create new empty json file
+			self.dataLogger.newDataTable(util.addSlash(config['scriptPath']) + 'data/' + jsonFileName + '.json',
+										 wwwJsonFileName)
+
+		self.dataLogger.commitIfDue()  # write logged data that has been waiting for dataFlushInterval
+		self.dumpStatsIfDue(now)
+
+		if self.ser is None:
+			if self.serialRetryTime is not None and now >= self.serialRetryTime:
+				self.reopenSerial(now)
+			return
+		if self.serialReader.error or not self.serialReader.isAlive():
+			# the port is gone, for example when the Arduino was unplugged. Open it again in place.
+			self.logMessage("Serial port reader stopped: %s. Reopening the serial port." % self.serialReader.error)
+			self.closeSerial()
+			self.reopenSerial(now)
+			return
+		if now < self.startTime:
+			return  # the Arduino is still starting up
+
+		# all lines received since the last check
+		messages = self.serialReader.readMessages()
+		if messages:
+			# time the oldest line waited in the queue of the serial reader
+			self.metrics.add('serialQueueDelay', max(0.0, now - messages[0][0]))
+			with self.metrics.time('serialLines'):
+				self.lineDispatcher.dispatchLines(messages)
+
+		if self.brewpiVersion is None:
+			# do nothing else with the serial port when the arduino has not been recognized
+			if self.versionRequests <= versionRetries and now >= self.nextVersionRequest:
+				if self.versionRequests == versionRetries:
+					self.logMessage("Warning: Cannot receive version number from Arduino. " +
+									"Your Arduino is either not programmed or running a very old version of BrewPi. " +
+									"Please upload a new version of BrewPi to your Arduino.")
+					# script will continue so you can at least program the Arduino
+				else:
+					self.commands.send('n')  # request version info
+				self.versionRequests += 1
+				self.nextVersionRequest = now + 1
+			return
+
+		# request new LCD text and settings, often while a client asks for them and rarely when nobody is watching
+		for topic, key in (('lcd', 'l'), ('cs', 's'), ('cv', 'v')):
+			if self.publisher.watching(topic):
+				self.poller.demand(key, now)
+		if self.poller.due('l'):
+			self.commands.send('l')
+		if self.poller.due('s'):
+			self.commands.send('s')
+		if self.poller.watched('v') and self.poller.due('v'):
+			self.commands.send('v')  # control variables are only sent to subscribers
+
+		# if no new data has been received for serialRequestInteval seconds
+		if (now - self.prevDataTime) >= float(config['interval']):
+			self.commands.send("t")  # request new from arduino
+
+		elif (now - self.prevDataTime) > float(config['interval']) + 2 * float(config['interval']):
+			#something is wrong: arduino is not responding to data requests
+			self.logMessage("Error: Arduino is not responding to new data requests")
+
+		# Check for update from temperature profile
+		cs = self.cs
+		if cs['mode'] == 'p':
+			newTemp = temperatureProfile.getNewTemp(config['scriptPath'])
+			if self.cc['tempSetMin'] < newTemp < self.cc['tempSetMax']:
+				if newTemp != cs['beerSet']:
+					# if temperature has to be updated send settings to arduino
+					self.updateControlSettings(beerSet=newTemp)
+					self.commands.send("j{beerSet:" + str(cs['beerSet']) + "}")
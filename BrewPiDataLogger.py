@@ -0,0 +1,192 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+
+import brewpiJson
+import BrewPiBeerStats
+import BrewPiJournal
+import BrewPiMirror
+import BrewPiRollup
+import BrewPiStore
+import BrewPiMetrics
+import BrewPiUtil as util
+
+
+class DataLogger:
+	"""
+	Write-behind stage for all logged data of a beer: the daily JSON data table, the CSV file, the binary store and
+	the rollups, and their copies in the www directory.
+
+	Samples are collected in memory and committed in batches: after flushRows samples, when flushInterval seconds
+	have passed since the last commit, or on close. A commit writes the buffered data, syncs each file to disk once
+	and publishes the files to the www directory once. The interval bounds how much data a power cut can lose.
+	Writes to the JSON and CSV files go through a write-ahead journal, so an interrupted commit is completed or
+	cleanly undone when the beer is started again.
+	"""
+
+	def __init__(self, flushRows=1, flushInterval=0, fsync=True, chartPoints=1000, metrics=None):
+		"""
+		Args:
+		flushRows: number of samples that triggers a commit, 0 to only commit on time
+		flushInterval: number of seconds after the last commit that triggers a commit, 0 to disable
+		fsync: when True, each file is synced to disk on commit
+		chartPoints: number of points per line in the downsampled chart of the rollups
+		metrics: BrewPiMetrics.Metrics that gets the time spent adding, committing and publishing data
+		"""
+		self.metrics = metrics or BrewPiMetrics.Metrics()
+		self.flushRows = int(flushRows)
+		self.flushInterval = float(flushInterval)
+		self.fsync = fsync
+		self.chartPoints = chartPoints
+		self.pendingRows = 0
+		self.lastCommit = time.time()
+		self.csvLines = []
+		self.csvFile = None
+		self.csvJournal = None
+		self.csvMirror = None
+		self.jsonWriter = None
+		self.jsonMirror = None
+		self.store = None
+		self.rollups = None
+		self.stats = None
+		self.statsFileName = None
+
+	def startBeer(self, dataPath, wwwDataPath, beerName, jsonFileName):
+		"""
+		Closes the files of the previous beer and opens the files of a new beer.
+
+		Args:
+		dataPath, wwwDataPath: data directories of the beer, they should exist. With wwwDataPath None, the files are
+			not copied to the www directory, for a web server that reads them from the HTTP server of the script.
+		beerName: name of the beer, used for the CSV and rollup file names
+		jsonFileName: file name of the JSON data table for today, without path
+		"""
+		self.close()
+		dataPath = util.addSlash(dataPath)
+		if wwwDataPath:
+			wwwDataPath = util.addSlash(wwwDataPath)
+		BrewPiJournal.recoverBeer(dataPath, wwwDataPath)
+		csvFileName = dataPath + beerName + '.csv'
+		self.csvFile = open(csvFileName, 'ab')
+		self.csvJournal = BrewPiJournal.Journal(csvFileName, self.fsync)
+		if wwwDataPath:
+			self.csvMirror = BrewPiMirror.FileMirror(csvFileName, wwwDataPath + beerName + '.csv')
+		# binary store with all data of the beer, used for range queries and to export to JSON or CSV
+		self.store = BrewPiStore.TimeSeriesStore(dataPath + 'store')
+		# aggregated and downsampled data for charts over the whole beer
+		self.rollups = BrewPiRollup.BeerRollups(self.store, dataPath, wwwDataPath, beerName, self.chartPoints)
+		# statistics over the whole beer, computed from the store when they were not saved with the last commit
+		self.statsFileName = dataPath + 'store/stats.txt'
+		self.stats = BrewPiBeerStats.load(self.statsFileName, self.store)
+		self.newDataTable(dataPath + jsonFileName, wwwDataPath and wwwDataPath + jsonFileName)
+
+	def newDataTable(self, jsonFileName, wwwJsonFileName=None):
+		"""
+		Commits pending data and continues logging to a new empty JSON data table, for example on a new day.
+		"""
+		self.commit()
+		if self.jsonWriter:
+			self.jsonWriter.close()
+			if self.jsonMirror:
+				self.jsonMirror.close()
+		brewpiJson.newEmptyFile(jsonFileName)
+		self.jsonWriter = brewpiJson.DataTableWriter(jsonFileName, flushRows=0,
+													 journal=BrewPiJournal.Journal(jsonFileName, self.fsync))
+		self.jsonMirror = None
+		if wwwJsonFileName:
+			self.jsonMirror = BrewPiMirror.FileMirror(jsonFileName, wwwJsonFileName, 2)  # rows overwrite the closing ]}
+			self.jsonMirror.publish()
+
+	def add(self, row, timestamp=None):
+		"""
+		Adds a sample to all outputs and commits when the flush policy says so.
+		"""
+		if timestamp is None:
+			timestamp = time.time()
+		csvLine = BrewPiStore.csvLine(row, timestamp)  # raises KeyError on incomplete rows, before anything is logged
+		with self.metrics.time('dataAdd'):
+			self.store.append(row, timestamp)
+			self.rollups.add(row, timestamp)
+			self.stats.add(row, timestamp)
+			self.jsonWriter.addRow(row, timestamp)
+			self.csvLines.append(csvLine)
+		self.pendingRows += 1
+		if self.flushRows and self.pendingRows >= self.flushRows:
+			self.commit()
+		else:
+			self.commitIfDue()
+
+	def commitIfDue(self):
+		"""
+		Commits when pending data is older than flushInterval. Call this regularly when no samples are added.
+		"""
+		if self.pendingRows and self.flushInterval and time.time() - self.lastCommit >= self.flushInterval:
+			self.commit()
+
+	def commit(self):
+		"""
+		Writes all pending data, syncs the files to disk and publishes them to the www directory
+		"""
+		self.lastCommit = time.time()
+		if not self.pendingRows:
+			return
+		start = time.time()
+		self.pendingRows = 0
+		self.jsonWriter.flush()
+		csvData = ''.join(self.csvLines)
+		self.csvLines = []
+		self.csvJournal.write(os.fstat(self.csvFile.fileno()).st_size, csvData)
+		self.csvFile.write(csvData)
+		self.csvFile.flush()
+		if self.fsync:
+			os.fsync(self.jsonWriter.file.fileno())
+			os.fsync(self.csvFile.fileno())
+		self.store.flush(self.fsync)
+		self.rollups.commit(self.fsync)
+		self.stats.save(self.statsFileName)
+		self.metrics.add('dataCommit', time.time() - start)
+		if self.jsonMirror:
+			with self.metrics.time('dataPublish'):
+				self.jsonMirror.publish()
+				self.csvMirror.publish()
+
+	def close(self):
+		"""
+		Commits pending data and closes all files. The published copies in the www directory stay in place.
+		"""
+		if self.jsonWriter:
+			self.commit()
+			self.jsonWriter.close()
+			if self.jsonMirror:
+				self.jsonMirror.close()
+			self.jsonWriter = None
+		if self.csvFile:
+			if self.fsync:
+				os.fsync(self.csvFile.fileno())
+			self.csvJournal.close()
+			self.csvFile.close()
+			if self.csvMirror:
+				self.csvMirror.close()
+				self.csvMirror = None
+			self.csvFile = None
+		if self.rollups:
+			self.rollups.close()
+			self.rollups = None
+		if self.store:
+			self.store.close()
+			self.store = None
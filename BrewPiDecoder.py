@@ -0,0 +1,60 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+# Decoders for the lines the Arduino sends every few seconds: temperatures and LCD text. These have a fixed shape,
+# which is used to decode them with less work than the generic JSON path. Anything that does not have the expected
+# shape is decoded with json.loads, which also raises the errors for invalid lines.
+# The flat objects themselves are still decoded by json.loads: the C scanner of simplejson is faster than any
+# decoder written in Python for them.
+
+import re
+
+import simplejson as json
+
+# the Arduino sends short keys for the temperatures, these are the names used in the data files
+tempKeys = {"bt": "BeerTemp",
+			"bs": "BeerSet",
+			"ba": "BeerAnn",
+			"ft": "FridgeTemp",
+			"fs": "FridgeSet",
+			"fa": "FridgeAnn",
+			"rt": "RoomTemp",
+			"s": "State",
+			"t": "Time"}
+
+# separator between two lines of LCD text
+lcdSeparator = re.compile(r'"\s*,\s*"')
+
+
+def decodeTemperatures(data):
+	"""
+	Decodes the data of a 'T' line to a dict with the names used in the data files
+	"""
+	rename = tempKeys.get
+	return dict((rename(key, key), value) for key, value in json.loads(data).iteritems())
+
+
+def decodeLcd(data):
+	"""
+	Decodes the data of an 'L' line to a list of strings, with the degree sign replaced by &deg.
+	The LCD text is a list of plain strings, which are split without a JSON parser when they contain no escapes.
+	"""
+	data = data.strip().replace('\xb0', '&deg')
+	if data[:2] == '["' and data[-2:] == '"]' and '\\' not in data:
+		lines = lcdSeparator.split(data[2:-2])
+		if data.count('"') == 2 * len(lines):  # no quotes other than the ones around the lines
+			return lines
+	return json.loads(data)
@@ -0,0 +1,135 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+import simplejson as json
+
+
+class LineStats:
+	"""
+	Counters and timing of the lines of one type. Parse time and handler time are kept apart, so it is visible
+	whether decoding or handling a line (for example logging data to disk) takes the most time.
+	"""
+
+	def __init__(self):
+		self.count = 0
+		self.bytes = 0
+		self.errors = 0
+		self.parseSeconds = 0.0
+		self.handleSeconds = 0.0
+		self.maxSeconds = 0.0  # slowest line, parsing and handling together
+
+	def toDict(self):
+		return dict(count=self.count, bytes=self.bytes, errors=self.errors, parseSeconds=self.parseSeconds,
+					handleSeconds=self.handleSeconds, maxSeconds=self.maxSeconds)
+
+
+class LineDispatcher:
+	"""
+	Calls the handler registered for the first character of each line received from the Arduino and keeps
+	statistics for each type of line.
+	A handler is registered with a parser, which converts the data after the "X:" prefix. Handlers are called as
+	handler(value, line, receivedTime). When the parser fails with a ValueError, which includes JSON decode errors,
+	the error is counted and passed to onError. Exceptions raised by handlers are counted and raised again.
+	"""
+
+	def __init__(self, onError=None, onUnknown=None):
+		"""
+		Args:
+		onError: function called with the line and the exception when a line cannot be parsed
+		onUnknown: function called with lines without a handler, these are ignored when it is None
+		"""
+		self.handlers = {}
+		self.stats = {}
+		self.values = {}  # last value of each type registered with collect
+		self.onError = onError
+		self.onUnknown = onUnknown
+
+	def register(self, prefix, handler, parser=json.loads):
+		"""
+		Registers the handler for lines starting with prefix. With parser None, the handler gets the data as string.
+		"""
+		self.handlers[prefix] = (handler, parser)
+
+	def collect(self, prefix, parser=json.loads):
+		"""
+		Registers a handler that stores the last parsed value of lines starting with prefix in self.values
+		"""
+		def store(value, line, receivedTime):
+			self.values[prefix] = value
+		self.register(prefix, store, parser)
+
+	def lineStats(self, prefix):
+		stats = self.stats.get(prefix)
+		if stats is None:
+			stats = self.stats[prefix] = LineStats()
+		return stats
+
+	def dispatch(self, line, receivedTime=None):
+		"""
+		Parses a line and calls its handler.
+
+		Returns:
+		True when the line was handled, False when it could not be parsed or has no handler
+		"""
+		prefix = line[:1]
+		entry = self.handlers.get(prefix)
+		stats = self.lineStats(prefix if entry else '?')
+		stats.count += 1
+		stats.bytes += len(line)
+		if entry is None:
+			if self.onUnknown:
+				self.onUnknown(line)
+			return False
+		handler, parser = entry
+		start = time.time()
+		data = line[2:].rstrip('\r\n')
+		try:
+			value = parser(data) if parser else data
+		except ValueError, e:
+			stats.errors += 1
+			if self.onError:
+				self.onError(line, e)
+			return False
+		parsed = time.time()
+		try:
+			handler(value, line, receivedTime)
+		except Exception:
+			stats.errors += 1
+			raise
+		finally:
+			end = time.time()
+			stats.parseSeconds += parsed - start
+			stats.handleSeconds += end - parsed
+			stats.maxSeconds = max(stats.maxSeconds, end - start)
+		return True
+
+	def dispatchLines(self, lines):
+		"""
+		Dispatches a list of lines, or of (receive time, line) tuples as returned by SerialReader.readMessages
+		"""
+		for line in lines:
+			if isinstance(line, tuple):
+				self.dispatch(line[1], line[0])
+			else:
+				self.dispatch(line)
+
+	def statsDict(self):
+		"""
+		Returns the statistics of each type of line as a dict that can be sent as JSON
+		"""
+		return dict((prefix, stats.toDict()) for prefix, stats in self.stats.items())
@@ -0,0 +1,110 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+# Events pushed to socket clients that subscribed to changes of the state of a controller.
+# A client sends subscribe=<topics>, with a comma separated list of topics or nothing for all topics. The reply is
+# {"topic": "subscribed", "state": {<topic>: <value>}} with the current values. After that, a JSON event is sent for
+# each change: {"topic": <topic>, "time": <seconds since the epoch>, "diff": <changes>}.
+# The changes contain the keys of a dict that changed, with None for removed keys. For lists, like the LCD text,
+# they contain the items that changed by their index.
+
+import time
+
+import simplejson as json
+
+import BrewPiSocket
+
+topics = ('temperatures', 'lcd', 'cs', 'cc', 'cv')
+
+
+def diff(old, new):
+	"""
+	Returns the items of a dict or list new that differ from old, as a dict
+	"""
+	if isinstance(new, list):
+		old = dict(enumerate(old or []))
+		new = dict(enumerate(new))
+	elif old is None:
+		old = {}
+	changes = dict((key, value) for key, value in new.iteritems() if key not in old or old[key] != value)
+	changes.update((key, None) for key in old if key not in new)
+	return changes
+
+
+def parseTopics(value):
+	"""
+	Returns the list of topics in a comma separated string, all topics when it is empty
+
+	Raises:
+	ValueError when the string contains an unknown topic
+	"""
+	subscribed = [topic.strip() for topic in value.split(',') if topic.strip()]
+	unknown = [topic for topic in subscribed if topic not in topics]
+	if unknown:
+		raise ValueError("unknown topics: " + ", ".join(unknown))
+	return subscribed or list(topics)
+
+
+class Publisher:
+	"""
+	Keeps the subscriptions of the socket clients of a controller and pushes the changes of the state to them.
+	Nothing is encoded when nobody subscribed to a topic.
+	"""
+
+	def __init__(self):
+		self.subscriptions = []  # (topics, BrewPiSocket.Subscription) tuples
+
+	def subscribe(self, value, state):
+		"""
+		Creates a subscription, which is the reply to a subscribe message.
+
+		Args:
+		value: comma separated topics, as sent by the client
+		state: dict with the current value of each topic, sent in the reply
+
+		Raises:
+		ValueError when value contains an unknown topic
+		"""
+		subscribed = parseTopics(value)
+		reply = json.dumps(dict(topic='subscribed', state=dict((topic, state[topic]) for topic in subscribed)))
+		subscription = BrewPiSocket.Subscription(reply)
+		self.subscriptions.append((subscribed, subscription))
+		return subscription
+
+	def subscribers(self, topic):
+		self.subscriptions = [(subscribed, subscription) for subscribed, subscription in self.subscriptions
+							  if not subscription.closed]
+		return [subscription for subscribed, subscription in self.subscriptions if topic in subscribed]
+
+	def watching(self, topic):
+		"""
+		Returns True when a client subscribed to the topic
+		"""
+		return len(self.subscribers(topic)) > 0
+
+	def publish(self, topic, old, new, eventTime=None):
+		"""
+		Pushes the changes from old to new to the subscribers of topic, when there are changes
+		"""
+		subscribers = self.subscribers(topic)
+		if not subscribers:
+			return
+		changes = diff(old, new)
+		if not changes:
+			return
+		event = json.dumps(dict(topic=topic, time=eventTime or time.time(), diff=changes))
+		for subscription in subscribers:
+			subscription.push(event)
@@ -0,0 +1,296 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+# Optional HTTP server of a controller, enabled with httpPort in the config file. It is served by the same
+# SocketServer as the BrewPi socket, so requests never wait for another thread. It only answers GET and HEAD:
+# - /api/state: the live state, the same values a subscription starts with
+# - /api/<getter>?<value>: the reply to a socket getter like lcd or getControlSettings, as JSON
+# - /data/<path>: the data files of the script, like data/<beer>/<beer>.csv, with ETag and Range support. The files are
+#   streamed in parts as the client reads them, so large files are never read into memory at once.
+# A web server can proxy these paths, instead of reading the copies of the data files in the www directory.
+
+import os
+import re
+import socket
+import urllib
+
+import simplejson as json
+
+import BrewPiSocket
+import BrewPiUtil as util
+
+# socket messages that can be requested over HTTP, they do not change anything
+getters = ['ack', 'lcd', 'getMode', 'getFridge', 'getBeer', 'getControlConstants', 'getControlSettings',
+		   'getControlVariables', 'getDeviceList', 'getData', 'getBeerStats', 'getStats']
+
+maxHeaderSize = 16 * 1024  # connections that send larger request headers are closed
+maxDataSize = 4 * 1024 * 1024  # largest part of a data file sent for one Range request
+chunkSize = 64 * 1024  # data files are read in parts of this size as the connection drains
+
+statusTexts = {200: 'OK', 206: 'Partial Content', 304: 'Not Modified', 404: 'Not Found',
+			   405: 'Method Not Allowed', 416: 'Requested Range Not Satisfiable'}
+
+contentTypes = {'.json': 'application/json', '.csv': 'text/csv'}
+
+singleRange = re.compile(r'bytes=(\d*)-(\d*)$')
+
+
+def listen(host, port):
+	"""
+	Creates a listening TCP socket for the HTTP server
+	"""
+	sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+	sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+	sock.bind((host, int(port)))
+	sock.listen(10)
+	return sock
+
+
+class HttpRequest:
+	def __init__(self, method, path, query, version, headers):
+		self.method = method
+		self.path = path
+		self.query = query
+		self.headers = headers  # dict with lower case header names
+		connection = headers.get('connection', '').lower()
+		self.keepAlive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+
+
+def parseRequest(head):
+	"""
+	Parses the request line and headers of an HTTP request.
+
+	Returns:
+	an HttpRequest, or None when head is not a valid request
+	"""
+	lines = head.split('\r\n')
+	requestLine = lines[0].split()
+	if len(requestLine) != 3 or not requestLine[2].startswith('HTTP/'):
+		return None
+	method, target, version = requestLine
+	headers = {}
+	for line in lines[1:]:
+		name, separator, value = line.partition(':')
+		if not separator:
+			return None
+		headers[name.strip().lower()] = value.strip()
+	path, separator, query = target.partition('?')
+	return HttpRequest(method, path, query, version, headers)
+
+
+def parseRange(rangeHeader, size):
+	"""
+	Returns the (start, end) offsets of a single byte range in a Range header, with end exclusive.
+	Returns None for headers that should be ignored, like multiple ranges, and raises ValueError for a range that
+	is outside the file.
+	"""
+	match = singleRange.match(rangeHeader.replace(' ', ''))
+	if match is None or match.group(1) == match.group(2) == '':
+		return None
+	first, last = match.groups()
+	if first == '':  # the last bytes of the file
+		if int(last) == 0 or size == 0:
+			raise ValueError("empty range")
+		return max(0, size - int(last)), size
+	start = int(first)
+	if start >= size:
+		raise ValueError("range starts after the end of the file")
+	if last == '':
+		return start, size
+	if int(last) < start:
+		return None
+	return start, min(int(last) + 1, size)
+
+
+def response(request, status, body='', contentType='application/json', headers=(), contentLength=None):
+	"""
+	Returns a complete HTTP response. The body is left out for HEAD requests, but its length is still sent.
+	contentLength is the length of a body that is sent after the response, when body is empty.
+	"""
+	lines = ['HTTP/1.1 %d %s' % (status, statusTexts[status])]
+	if status != 304:
+		length = len(body) if contentLength is None else contentLength
+		lines += ['Content-Type: ' + contentType, 'Content-Length: %d' % length]
+	lines += ['%s: %s' % header for header in headers]
+	if not request.keepAlive:
+		lines.append('Connection: close')
+	if request.method == 'HEAD' or status == 304:
+		body = ''
+	return '\r\n'.join(lines) + '\r\n\r\n' + body
+
+
+def errorResponse(request, status, message):
+	return response(request, status, json.dumps(dict(error=message)))
+
+
+class FileResponse:
+	"""
+	Response with a part of an open file as body. The head is sent first, the body is read from the file as the
+	connection drains. The file is closed when the body is sent.
+	"""
+
+	def __init__(self, head, dataFile, start, end):
+		self.head = head
+		self.file = dataFile
+		self.start = start
+		self.end = end
+
+
+class HttpConnection(BrewPiSocket.Connection):
+	"""
+	Connection of an HTTP client to a SocketServer. Each request is passed to the handler as an HttpRequest and the
+	handler returns the complete response. The connection is kept open between requests unless the client asks to
+	close it.
+	"""
+
+	def __init__(self, sock, listener, handler):
+		BrewPiSocket.Connection.__init__(self, sock, listener, handler)
+		self.framing = 'http'
+		self.dataFile = None  # file of the body that is being streamed
+		self.dataOffset = 0  # offset in dataFile of the next part of the body
+		self.dataEnd = 0
+
+	def messages(self):
+		requests = []
+		while not self.closing:
+			end = self.inBuffer.find('\r\n\r\n')
+			if end < 0:
+				break
+			request = parseRequest(self.inBuffer[:end])
+			if request is None:
+				return None
+			try:
+				length = int(request.headers.get('content-length', 0))
+			except ValueError:
+				return None
+			if len(self.inBuffer) < end + 4 + length:
+				break  # the body is ignored, but it is not complete yet
+			self.inBuffer = self.inBuffer[end + 4 + length:]
+			if not request.keepAlive:
+				self.closing = True
+			requests.append(request)
+		if len(self.inBuffer) > maxHeaderSize and not requests:
+			return None
+		return requests
+
+	def frame(self, reply):
+		if isinstance(reply, FileResponse):
+			self.dataFile, self.dataOffset, self.dataEnd = reply.file, reply.start, reply.end
+			return reply.head
+		return reply or ''
+
+	def streaming(self):
+		return self.dataFile is not None
+
+	def readStream(self):
+		self.dataFile.seek(self.dataOffset)
+		data = self.dataFile.read(min(chunkSize, self.dataEnd - self.dataOffset))
+		self.dataOffset += len(data)
+		if not data:
+			self.closing = True  # the file was truncated, the client cannot get the rest of the announced length
+		if not data or self.dataOffset >= self.dataEnd:
+			self.closeStream()
+		return data
+
+	def closeStream(self):
+		if self.dataFile:
+			self.dataFile.close()
+			self.dataFile = None
+
+
+class HttpHandler:
+	"""
+	Answers the HTTP requests for one controller
+	"""
+
+	def __init__(self, controller):
+		self.controller = controller
+
+	def handle(self, request):
+		if request.method not in ['GET', 'HEAD']:
+			return errorResponse(request, 405, "only GET and HEAD are supported")
+		path = urllib.unquote(request.path)
+		if path == '/api/state':
+			state = json.dumps(self.controller.liveState())
+			return response(request, 200, state, headers=[('Cache-Control', 'no-store')])
+		if path.startswith('/api/'):
+			return self.getter(request, path[len('/api/'):])
+		if path.startswith('/data/'):
+			return self.dataFile(request, path[len('/data/'):])
+		return errorResponse(request, 404, "not found: " + path[:100])
+
+	def getter(self, request, name):
+		"""
+		Returns the reply of the controller to a getter. Replies that are not JSON, like the mode, are sent as a
+		JSON string.
+		"""
+		if name not in getters:
+			return errorResponse(request, 404, "unknown getter: " + name[:100])
+		message = name
+		if request.query:
+			message += "=" + urllib.unquote_plus(request.query)
+
+		def getterResponse(reply):
+			if not (reply and reply[:1] in ['{', '[']):
+				reply = json.dumps(reply)
+			return response(request, 200, reply, headers=[('Cache-Control', 'no-store')])
+
+		reply = self.controller.handleMessage(message)
+		if isinstance(reply, BrewPiSocket.DeferredReply):
+			return BrewPiSocket.DeferredReply(reply.ready, lambda: getterResponse(reply.result()))
+		return getterResponse(reply)
+
+	def dataFile(self, request, relativePath):
+		"""
+		Returns a file in the data directory of the script. Requests with If-None-Match get a 304 reply when the file
+		did not change, requests with a single byte range get that part of the file, up to maxDataSize bytes.
+		The body is returned as a FileResponse, which the connection sends in parts.
+		"""
+		root = os.path.realpath(util.addSlash(self.controller.config['scriptPath']) + 'data')
+		fileName = os.path.realpath(os.path.join(root, relativePath))
+		if not fileName.startswith(root + os.sep) or not os.path.isfile(fileName):
+			return errorResponse(request, 404, "no data file: " + relativePath[:100])
+		dataFile = open(fileName, 'rb')
+		stat = os.fstat(dataFile.fileno())
+		size = stat.st_size
+		etag = '"%x-%x"' % (size, int(stat.st_mtime * 1000000))
+		headers = [('ETag', etag), ('Accept-Ranges', 'bytes'), ('Cache-Control', 'no-cache')]
+		status = 200
+		start, end = 0, size
+		byteRange = None
+		rangeHeader = request.headers.get('range')
+		if request.headers.get('if-none-match') == etag:
+			status = 304
+		elif rangeHeader and request.headers.get('if-range', etag) == etag:
+			try:
+				byteRange = parseRange(rangeHeader, size)
+			except ValueError:
+				status = 416
+				headers = [('Content-Range', 'bytes */%d' % size)]
+		if byteRange:
+			start, end = byteRange
+			end = min(end, start + maxDataSize)  # the client requests the rest in the next range
+			status = 206
+			headers.append(('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, size)))
+		if status not in [200, 206]:
+			dataFile.close()
+			return response(request, status, headers=headers)
+		contentType = contentTypes.get(os.path.splitext(fileName)[1], 'application/octet-stream')
+		head = response(request, status, '', contentType, headers, contentLength=end - start)
+		if request.method == 'HEAD' or start == end:
+			dataFile.close()
+			return head
+		return FileResponse(head, dataFile, start, end)
@@ -0,0 +1,163 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import struct
+import zlib
+
+import brewpiJson
+import BrewPiMirror
+import BrewPiUtil as util
+
+headerFormat = '<QII'  # offset in the data file, length and crc32 of the data
+headerSize = struct.calcsize(headerFormat)
+
+
+def journalFileName(dataFileName):
+	return dataFileName + '.journal'
+
+
+class Journal:
+	"""
+	Write-ahead journal for a data file.
+	Before new data is written to the data file, the data and the offset where it will be written are saved in the
+	journal and synced to disk. When the script is interrupted while writing the data file, the write is completed on
+	the next start by replaying the journal. Data files are only changed at their end, so only the last write has to
+	be kept and replaying it more than once is harmless.
+	"""
+
+	def __init__(self, dataFileName, fsync=True):
+		"""
+		Creates a new journal for a data file. Replay an existing journal before creating a new one.
+		"""
+		self.fileName = journalFileName(dataFileName)
+		self.fsync = fsync
+		self.file = open(self.fileName, 'wb')
+
+	def write(self, offset, data):
+		"""
+		Saves the data that is about to be written at offset in the data file
+		"""
+		self.file.seek(0)
+		self.file.write(struct.pack(headerFormat, offset, len(data), zlib.crc32(data) & 0xffffffff))
+		self.file.write(data)
+		self.file.truncate()
+		self.file.flush()
+		if self.fsync:
+			os.fsync(self.file.fileno())
+
+	def close(self):
+		"""
+		Removes the journal. Only call this after the data file has been synced to disk.
+		"""
+		if self.file:
+			self.file.close()
+			self.file = None
+			os.remove(self.fileName)
+
+
+def replay(dataFileName):
+	"""
+	Completes the last write to a data file from its journal and removes the journal.
+	A journal that was not completely written is ignored, the data file was not touched yet in that case.
+
+	Returns:
+	True when a write was replayed
+	"""
+	fileName = journalFileName(dataFileName)
+	if not os.path.exists(fileName):
+		return False
+	content = open(fileName, 'rb').read()
+	valid = False
+	if len(content) >= headerSize:
+		offset, length, crc = struct.unpack(headerFormat, content[:headerSize])
+		data = content[headerSize:]
+		valid = len(data) == length and zlib.crc32(data) & 0xffffffff == crc
+	if valid:
+		dataFile = open(dataFileName, 'r+b' if os.path.exists(dataFileName) else 'wb')
+		dataFile.seek(offset)
+		dataFile.write(data)
+		dataFile.truncate()
+		dataFile.flush()
+		os.fsync(dataFile.fileno())
+		dataFile.close()
+	os.remove(fileName)
+	return valid
+
+
+def repairLines(fileName):
+	"""
+	Truncates a line based file, like the CSV file, after its last complete line.
+
+	Returns:
+	True when the file was repaired
+	"""
+	dataFile = open(fileName, 'r+b')
+	data = dataFile.read()
+	end = data.rfind('\n') + 1
+	if end == len(data):
+		dataFile.close()
+		return False
+	dataFile.seek(end)
+	dataFile.truncate()
+	dataFile.close()
+	return True
+
+
+# extensions of the files the data logger appends to, per sub directory of a beer. Other files, like the stats and
+# annotations in the store, are replaced atomically or read line by line and are never repaired.
+appendedFiles = {'': ('.json', '.csv'), 'rollup/': ('.json',), 'store/': ()}
+
+
+def recoverBeer(dataPath, wwwDataPath=None):
+	"""
+	Replays journals and repairs the data files of a beer that were not closed properly, for example after a power
+	cut. Only the files in appendedFiles are repaired. Repaired files are copied to the www data directory again.
+	Call this before any files of the beer are opened for writing.
+
+	Returns:
+	list of file names that were repaired
+	"""
+	dataPath = util.addSlash(dataPath)
+	repaired = []
+	for subDir in ['', 'rollup/', 'store/']:
+		extensions = appendedFiles[subDir]
+		path = dataPath + subDir
+		if not os.path.isdir(path):
+			continue
+		for name in sorted(os.listdir(path)):
+			if name.endswith('.journal'):
+				dataName = name[:-len('.journal')]
+				if replay(path + dataName):
+					repaired.append(subDir + dataName)
+		for name in sorted(os.listdir(path)):
+			extension = os.path.splitext(name)[1]
+			if extension not in extensions:
+				continue
+			if extension == '.json':
+				fixed = brewpiJson.repairFile(path + name)
+			else:
+				fixed = repairLines(path + name)
+			if fixed and subDir + name not in repaired:
+				repaired.append(subDir + name)
+
+	for name in repaired:
+		util.logMessage("Repaired data file " + dataPath + name + " that was not closed properly")
+		if wwwDataPath and not name.startswith('store/'):
+			wwwFileName = util.addSlash(wwwDataPath) + name
+			if os.path.isdir(os.path.dirname(wwwFileName)):
+				BrewPiMirror.copyAtomic(dataPath + name, wwwFileName)
+	return repaired
@@ -0,0 +1,134 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+# Counters and timings of the script, reported by the getStats socket message and written to a file every
+# statsInterval seconds. They show where the time goes: the SD card (writing and publishing data files), the
+# serial port or the socket.
+
+import collections
+import os
+import time
+
+percentiles = [50, 90, 99]
+
+
+def percentile(ordered, p):
+	"""
+	Returns the value that p percent of the values in a sorted list do not exceed
+	"""
+	return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100.0))]
+
+
+class Timing:
+	"""
+	Durations of one kind of work. The totals cover the whole run, the percentiles the last samples.
+	"""
+
+	def __init__(self, samples=1000):
+		self.count = 0
+		self.totalSeconds = 0.0
+		self.maxSeconds = 0.0
+		self.recent = collections.deque(maxlen=samples)
+
+	def add(self, seconds):
+		self.count += 1
+		self.totalSeconds += seconds
+		self.maxSeconds = max(self.maxSeconds, seconds)
+		self.recent.append(seconds)
+
+	def toDict(self):
+		result = dict(count=self.count, totalSeconds=self.totalSeconds, maxSeconds=self.maxSeconds)
+		if self.recent:
+			ordered = sorted(self.recent)
+			for p in percentiles:
+				result['p%d' % p] = percentile(ordered, p)
+		return result
+
+
+class TimingContext:
+	def __init__(self, timing):
+		self.timing = timing
+
+	def __enter__(self):
+		self.start = time.time()
+
+	def __exit__(self, excType, excValue, traceback):
+		self.timing.add(time.time() - self.start)
+
+
+class Metrics:
+	"""
+	Named timings and counters. Timings are created when they are first used.
+	"""
+
+	def __init__(self):
+		self.timings = {}
+		self.counters = {}
+
+	def timing(self, name):
+		timing = self.timings.get(name)
+		if timing is None:
+			timing = self.timings[name] = Timing()
+		return timing
+
+	def time(self, name):
+		"""
+		Returns a context manager that adds the time spent in its block to the timing name:
+			with metrics.time('dataCommit'):
+				...
+		"""
+		return TimingContext(self.timing(name))
+
+	def add(self, name, seconds):
+		self.timing(name).add(seconds)
+
+	def count(self, name, n=1):
+		self.counters[name] = self.counters.get(name, 0) + n
+
+	def toDict(self):
+		return dict(timings=dict((name, timing.toDict()) for name, timing in self.timings.items()),
+					counters=dict(self.counters))
+
+
+def rss():
+	"""
+	Returns the resident memory of the process in bytes, or None when it is not known on this platform
+	"""
+	try:
+		for line in open('/proc/self/status'):
+			if line.startswith('VmRSS:'):
+				return int(line.split()[1]) * 1024
+	except IOError:
+		pass
+	try:
+		import resource
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, in kilobytes on Linux
+	except ImportError:
+		return None
+
+
+# timings of the main loop and the socket server, which are shared by all controllers in the process
+process = Metrics()
+startTime = time.time()
+
+
+def processDict():
+	"""
+	Returns the metrics of the whole process as a dict that can be sent as JSON
+	"""
+	result = process.toDict()
+	result.update(pid=os.getpid(), uptimeSeconds=time.time() - startTime, rss=rss())
+	return result
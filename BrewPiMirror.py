@@ -0,0 +1,106 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import sys
+
+
+class FileMirror:
+	"""
+	Publishes a copy of a growing data file in another directory, for example the web server directory.
+
+	Two shadow copies are kept next to the published file. On every publish, the shadow that is not published
+	is brought up to date by copying only the bytes that changed since it was last updated. It is then
+	hard linked and renamed over the published file name. The rename is atomic, so the web server always
+	opens a complete file and the copy cost does not grow with the size of the file.
+	"""
+
+	def __init__(self, source, destination, rewriteSize=0):
+		"""
+		Prepares a mirror, nothing is copied until publish is called.
+
+		Args:
+		source: path of the file that is written by the script
+		destination: path of the published copy
+		rewriteSize: number of bytes at the end of the source that can be overwritten when new data is added.
+			Use 0 for append only files like the CSV file and 2 for the JSON data table, which rewrites its
+			closing brackets.
+		"""
+		self.source = source
+		self.destination = destination
+		self.rewriteSize = rewriteSize
+		directory, name = os.path.split(destination)
+		self.shadows = [os.path.join(directory, '.' + name + '.' + str(i)) for i in range(2)]
+		self.tmpName = os.path.join(directory, '.' + name + '.tmp')
+		self.synced = [0, 0]  # size of the source when each shadow was last updated
+		self.next = 0  # index of the shadow to update on the next publish
+
+	def publish(self):
+		"""
+		Makes the published file equal to the current source file.
+		"""
+		if not hasattr(os, 'link'):
+			# no hard links on this platform, fall back to copying the whole file
+			shutil.copyfile(self.source, self.destination)
+			return
+
+		shadow = self.shadows[self.next]
+		sourceFile = open(self.source, 'rb')
+		try:
+			size = os.fstat(sourceFile.fileno()).st_size
+			if os.path.exists(shadow):
+				start = max(0, min(self.synced[self.next], size) - self.rewriteSize)
+				shadowFile = open(shadow, 'r+b')
+			else:
+				start = 0
+				shadowFile = open(shadow, 'wb')
+			sourceFile.seek(start)
+			shadowFile.seek(start)
+			shadowFile.write(sourceFile.read(size - start))
+			shadowFile.truncate()
+			shadowFile.close()
+		finally:
+			sourceFile.close()
+		self.synced[self.next] = size
+
+		if os.path.exists(self.tmpName):
+			os.remove(self.tmpName)  # left behind by an earlier crash
+		os.link(shadow, self.tmpName)
+		os.rename(self.tmpName, self.destination)
+		self.next = 1 - self.next
+
+	def close(self):
+		"""
+		Removes the shadow copies. The published file stays in place.
+		"""
+		for shadow in self.shadows:
+			if os.path.exists(shadow):
+				os.remove(shadow)
+		self.synced = [0, 0]
+
+
+def copyAtomic(source, destination):
+	"""
+	Copies a file that is rewritten completely, like a generated chart file. The copy is written to a temporary
+	file first and renamed over the destination, so a reader never sees a half written file.
+	"""
+	directory, name = os.path.split(destination)
+	tmpName = os.path.join(directory, '.' + name + '.tmp')
+	shutil.copyfile(source, tmpName)
+	if sys.platform.startswith('win') and os.path.exists(destination):
+		os.remove(destination)  # rename does not replace existing files on Windows
+	os.rename(tmpName, destination)
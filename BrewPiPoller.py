@@ -0,0 +1,62 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+
+
+class DemandPoller:
+	"""
+	Decides when to request data from the Arduino that is only needed while a client is watching, like the LCD text.
+	Data that a client asked for in the last demandTimeout seconds is polled every activeInterval seconds.
+	Otherwise it is only polled every idleInterval seconds, to keep the local copy from getting too old.
+	"""
+
+	def __init__(self, activeInterval=0.5, idleInterval=60, demandTimeout=60):
+		self.activeInterval = float(activeInterval)
+		self.idleInterval = float(idleInterval)
+		self.demandTimeout = float(demandTimeout)
+		self.lastDemand = {}
+		self.lastPoll = {}
+
+	def watched(self, key, now=None):
+		"""
+		Returns True when a client asked for the data recently
+		"""
+		if now is None:
+			now = time.time()
+		return now - self.lastDemand.get(key, float('-inf')) < self.demandTimeout
+
+	def demand(self, key, now=None):
+		"""
+		Records that a client asked for the data. When nobody was watching, the data is polled on the next check.
+		"""
+		if now is None:
+			now = time.time()
+		if not self.watched(key, now):
+			self.lastPoll.pop(key, None)
+		self.lastDemand[key] = now
+
+	def due(self, key, now=None):
+		"""
+		Returns True when the data should be requested now, and records that it was requested
+		"""
+		if now is None:
+			now = time.time()
+		interval = self.activeInterval if self.watched(key, now) else self.idleInterval
+		if now - self.lastPoll.get(key, float('-inf')) < interval:
+			return False
+		self.lastPoll[key] = now
+		return True
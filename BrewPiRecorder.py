@@ -0,0 +1,224 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+# Records the serial traffic of the script and replays it without an Arduino.
+# Usage: python BrewPiRecorder.py <capture file> prints a capture as text.
+
+import struct
+import sys
+import threading
+import time
+
+magic = "BrewPi serial capture 1\n"
+startFormat = '<d'  # time the capture was started, seconds since the epoch
+recordFormat = '<dcI'  # seconds since the start, 'r' for read or 'w' for written, number of bytes that follow
+recordSize = struct.calcsize(recordFormat)
+
+
+class RecordingSerial:
+	"""
+	Wraps an open serial port and records all data read from and written to it in a capture file.
+	All other attributes are taken from the wrapped port.
+	"""
+
+	def __init__(self, ser, captureFileName):
+		self.ser = ser
+		self.startTime = time.time()
+		self.captureFile = open(captureFileName, 'wb')
+		self.captureFile.write(magic + struct.pack(startFormat, self.startTime))
+		self.lock = threading.Lock()  # the port is read and written from different threads
+
+	def record(self, direction, data):
+		if not data:
+			return
+		with self.lock:
+			if self.captureFile:
+				self.captureFile.write(struct.pack(recordFormat, time.time() - self.startTime, direction, len(data)))
+				self.captureFile.write(data)
+				self.captureFile.flush()
+
+	def read(self, size=1):
+		data = self.ser.read(size)
+		self.record('r', data)
+		return data
+
+	def readline(self, *args):
+		data = self.ser.readline(*args)
+		self.record('r', data)
+		return data
+
+	def readlines(self):
+		lines = self.ser.readlines()
+		self.record('r', ''.join(lines))
+		return lines
+
+	def write(self, data):
+		self.record('w', data)
+		return self.ser.write(data)
+
+	def close(self):
+		with self.lock:
+			if self.captureFile:
+				self.captureFile.close()
+				self.captureFile = None
+		self.ser.close()
+
+	def __getattr__(self, name):
+		return getattr(self.ser, name)
+
+
+def readCapture(captureFileName):
+	"""
+	Generator that yields the records of a capture file as (seconds since the start, direction, data) tuples.
+	An incomplete record at the end of the file, written when the script was stopped, is ignored.
+	"""
+	captureFile = open(captureFileName, 'rb')
+	try:
+		if captureFile.read(len(magic)) != magic:
+			raise ValueError(captureFileName + " is not a serial capture file")
+		captureFile.read(struct.calcsize(startFormat))
+		while True:
+			header = captureFile.read(recordSize)
+			if len(header) < recordSize:
+				return
+			offset, direction, length = struct.unpack(recordFormat, header)
+			data = captureFile.read(length)
+			if len(data) < length:
+				return
+			yield offset, direction, data
+	finally:
+		captureFile.close()
+
+
+class ReplaySerial:
+	"""
+	Fake serial port that returns the data that was read in a capture, at the times it was received.
+	The timing starts when the port is created. A speed above 1 replays faster, a speed of 0 replays all data as fast
+	as it is read. Written data is counted, but not checked against the capture.
+	"""
+
+	def __init__(self, captureFileName, speed=1.0, timeout=0.1):
+		self.speed = float(speed)
+		self.timeout = timeout
+		self.port = captureFileName
+		self.startTime = time.time()
+		self.records = [(offset, data) for offset, direction, data in readCapture(captureFileName) if direction == 'r']
+		self.next = 0  # index of the next record to read
+		self.partial = ''  # rest of a record that was read partly
+		self.bytesWritten = 0
+		self.lock = threading.Lock()
+
+	def due(self, offset, now=None):
+		"""
+		Returns the number of seconds until a record can be read, 0 or less when it can be read now
+		"""
+		if self.speed == 0:
+			return 0
+		return self.startTime + offset / self.speed - (now or time.time())
+
+	def done(self):
+		"""
+		Returns True when all recorded data has been read
+		"""
+		return not self.partial and self.next >= len(self.records)
+
+	def inWaiting(self):
+		with self.lock:
+			waiting = len(self.partial)
+			now = time.time()
+			i = self.next
+			while i < len(self.records) and self.due(self.records[i][0], now) <= 0:
+				waiting += len(self.records[i][1])
+				i += 1
+			return waiting
+
+	def read(self, size=1):
+		"""
+		Returns up to size bytes of recorded data. Waits for at most timeout seconds when no data is due yet.
+		"""
+		data = ''
+		deadline = None if self.timeout is None else time.time() + self.timeout
+		while len(data) < size:
+			with self.lock:
+				if self.partial:
+					take = size - len(data)
+					data += self.partial[:take]
+					self.partial = self.partial[take:]
+					continue
+				if self.next >= len(self.records):
+					if not data and self.timeout:
+						time.sleep(self.timeout)  # like a port that stays silent
+					break
+				offset, recordData = self.records[self.next]
+				wait = self.due(offset)
+				if wait <= 0:
+					self.next += 1
+					self.partial = recordData
+					continue
+			if data:
+				break  # return what is available now
+			if deadline is not None:
+				wait = min(wait, deadline - time.time())
+				if wait <= 0:
+					break
+			time.sleep(wait)
+		return data
+
+	def readline(self):
+		line = ''
+		while not line.endswith('\n'):
+			data = self.read(1)
+			if not data:
+				break
+			line += data
+		return line
+
+	def readlines(self):
+		lines = []
+		while True:
+			line = self.readline()
+			if not line:
+				return lines
+			lines.append(line)
+
+	def write(self, data):
+		self.bytesWritten += len(data)
+		return len(data)
+
+	def flush(self):
+		pass
+
+	def flushInput(self):
+		pass
+
+	def getTimeout(self):
+		return self.timeout
+
+	def setTimeout(self, timeout):
+		self.timeout = timeout
+
+	def isOpen(self):
+		return True
+
+	def close(self):
+		pass
+
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2:
+		sys.exit('Usage: %s <capture file>' % sys.argv[0])
+	for offset, direction, data in readCapture(sys.argv[1]):
+		print "%10.3f %s %s" % (offset, '<' if direction == 'r' else '>', repr(data))
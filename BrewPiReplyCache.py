@@ -0,0 +1,56 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+
+class ReplyCache:
+	"""
+	Keeps the encoded replies to socket requests that only change when new data is received from the Arduino.
+	A reply is built on the first request after it was invalidated and the same string is returned until the state
+	it was built from changes again.
+	"""
+
+	def __init__(self):
+		self.replies = {}
+		self.hits = 0
+		self.misses = 0
+
+	def get(self, key, build):
+		"""
+		Returns the cached reply for key, or calls build() to create it when it is not cached.
+
+		Args:
+		key: name of the reply, usually the request it answers
+		build: function without arguments that returns the reply
+		"""
+		reply = self.replies.get(key)
+		if reply is None:
+			self.misses += 1
+			reply = self.replies[key] = build()
+		else:
+			self.hits += 1
+		return reply
+
+	def invalidate(self, *keys):
+		"""
+		Removes the replies of keys from the cache, or all replies when no keys are given
+		"""
+		if not keys:
+			self.replies.clear()
+		for key in keys:
+			self.replies.pop(key, None)
+
+	def toDict(self):
+		return dict(cached=sorted(str(key) for key in self.replies), hits=self.hits, misses=self.misses)
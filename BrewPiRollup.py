@@ -0,0 +1,409 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import os
+import time
+
+import brewpiJson
+import BrewPiMirror
+import BrewPiUtil as util
+
+# name and bucket length in seconds of the rollup tiers
+tiers = (('1m', 60),
+         ('15m', 900),
+         ('1h', 3600))
+
+# numeric columns that are aggregated, with their labels
+rollupColumns = (('BeerTemp', 'Beer temperature'),
+                 ('BeerSet', 'Beer setting'),
+                 ('FridgeTemp', 'Fridge temperature'),
+                 ('FridgeSet', 'Fridge setting'),
+                 ('RoomTemp', 'Room temp.'))
+
+# columns of the downsampled chart, which keeps the shape of these lines
+chartColumns = ('BeerTemp', 'FridgeTemp')
+
+seedRows = 10000  # rows of the store read at a time when buckets are rebuilt
+
+maxQueryRows = 5000  # queries that would return more rows are aggregated in larger buckets
+
+
+def rollupCols():
+	"""
+	Returns the DataTable column definitions of a rollup file: the mean of each column in rollupColumns,
+	followed by its minimum and maximum as interval columns, and the most common state.
+	"""
+	cols = ["{\"type\":\"datetime\",\"id\":\"Time\",\"label\":\"Time\"}"]
+	for name, label in rollupColumns:
+		cols.append("{\"type\":\"number\",\"id\":\"%s\",\"label\":\"%s\"}" % (name, label))
+		for suffix in ('Min', 'Max'):
+			cols.append(("{\"type\":\"number\",\"id\":\"%s%s\",\"label\":\"%s %s\",\"p\":{\"role\":\"interval\"}}" %
+						 (name, suffix, label, suffix.lower())))
+	cols.append("{\"type\":\"number\",\"id\":\"State\",\"label\":\"State\"}")
+	return "\"cols\":[" + ",".join(cols) + "]"
+
+rollupJsonCols = rollupCols()
+
+
+class Bucket:
+	"""
+	Running count, sum, minimum and maximum of the samples in one time bucket
+	"""
+
+	def __init__(self, start):
+		self.start = start
+		self.count = dict((name, 0) for name, label in rollupColumns)
+		self.sum = dict((name, 0.0) for name, label in rollupColumns)
+		self.min = {}
+		self.max = {}
+		self.states = {}  # number of samples for each state
+
+	def add(self, row):
+		for name, label in rollupColumns:
+			value = row.get(name)
+			if value is None:
+				continue
+			value = float(value)
+			self.count[name] += 1
+			self.sum[name] += value
+			if self.count[name] == 1:
+				self.min[name] = value
+				self.max[name] = value
+			else:
+				self.min[name] = min(self.min[name], value)
+				self.max[name] = max(self.max[name], value)
+		state = row.get('State')
+		if state is not None:
+			self.states[state] = self.states.get(state, 0) + 1
+
+	def toJson(self):
+		"""
+		Returns the bucket as a row for a rollup DataTable file
+		"""
+		cells = ["{\"v\":\"" + brewpiJson.jsonDate(self.start) + "\"}"]
+		for name, label in rollupColumns:
+			if self.count[name] == 0:
+				cells += ["null", "null", "null"]
+			else:
+				cells.append("{\"v\":%s}" % str(round(self.sum[name] / self.count[name], 3)))
+				cells.append("{\"v\":%s}" % str(self.min[name]))
+				cells.append("{\"v\":%s}" % str(self.max[name]))
+		if self.states:
+			cells.append("{\"v\":%s}" % str(self.mostCommonState()))
+		else:
+			cells.append("null")
+		return "{\"c\":[" + ",".join(cells) + "]}"
+
+	def mostCommonState(self):
+		if not self.states:
+			return None
+		return max(self.states.keys(), key=lambda s: self.states[s])
+
+	def toRow(self):
+		"""
+		Returns the means of the bucket as a row like the logged samples, for the chart
+		"""
+		return chartRow(dict((name, round(self.sum[name] / self.count[name], 3) if self.count[name] else None)
+							 for name, label in rollupColumns), self.mostCommonState())
+
+
+def chartRow(means, state):
+	"""
+	Returns a row with the keys of the logged samples, from the means of a bucket and its most common state
+	"""
+	row = dict(means, BeerAnn=None, FridgeAnn=None)
+	row['State'] = int(state) if state is not None else None
+	return row
+
+
+class Rollup:
+	"""
+	One rollup tier: aggregates samples in buckets of a fixed number of seconds and appends each completed bucket
+	to a DataTable JSON file. Completed buckets are buffered until commit().
+	"""
+
+	def __init__(self, jsonFileName, seconds, wwwJsonFileName=None):
+		self.jsonFileName = jsonFileName
+		self.seconds = seconds
+		self.bucket = None
+		self.completedBucket = None  # the last bucket that was completed by add
+		self.pending = False
+		self.writer = brewpiJson.DataTableWriter(jsonFileName, flushRows=0, cols=rollupJsonCols)
+		self.mirror = None
+		if wwwJsonFileName:
+			self.mirror = BrewPiMirror.FileMirror(jsonFileName, wwwJsonFileName, 2)
+
+	def bucketStart(self, timestamp):
+		return timestamp - timestamp % self.seconds
+
+	def seed(self, store):
+		"""
+		Buckets are only written when they are complete, so the last bucket was still open when the script stopped,
+		and buckets that were completed but not committed before a crash are missing from the file. Both are rebuilt
+		from the samples in the store after the last bucket in the file, and the rebuilt buckets are committed.
+		"""
+		last = brewpiJson.lastRow(self.jsonFileName)
+		start = 0
+		if last and last['Time']:
+			start = store.indexOf(time.mktime(last['Time'].timetuple()) + self.seconds)
+		for chunkStart in xrange(start, len(store), seedRows):
+			for row in store.rows(chunkStart, chunkStart + seedRows):
+				self.add(row, row['Time'])
+		self.commit()
+
+	def add(self, row, timestamp):
+		"""
+		Adds a sample. Returns True when this completed a bucket, which is written by the next commit().
+		"""
+		start = self.bucketStart(timestamp)
+		completed = False
+		if self.bucket and self.bucket.start != start:
+			self.writer.addJsonRow(self.bucket.toJson())
+			self.pending = True
+			self.completedBucket = self.bucket
+			self.bucket = None
+			completed = True
+		if not self.bucket:
+			self.bucket = Bucket(start)
+		self.bucket.add(row)
+		return completed
+
+	def commit(self, fsync=True):
+		"""
+		Writes the completed buckets, syncs the file to disk when fsync is True and publishes it to the www directory
+		"""
+		if not self.pending:
+			return
+		self.pending = False
+		self.writer.flush()
+		if fsync:
+			os.fsync(self.writer.file.fileno())
+		if self.mirror:
+			self.mirror.publish()
+
+	def close(self):
+		"""
+		Writes the completed buckets and closes the file. The open bucket is not written, it is continued from the store by seed() on the next start.
+		"""
+		self.writer.close()
+		if self.mirror:
+			self.mirror.close()
+
+
+def largestTriangles(times, values, threshold):
+	"""
+	Selects threshold points that preserve the shape of a line with the Largest-Triangle-Three-Buckets algorithm.
+	Points with value None are skipped.
+
+	Params:
+	times, values: lists with the x and y values of the line
+	threshold: number of points to keep
+
+	Returns:
+	list of indexes of the selected points
+	"""
+	points = [i for i in xrange(len(values)) if values[i] is not None]
+	if threshold >= len(points) or threshold < 3:
+		return points
+	selected = [points[0]]
+	bucketSize = float(len(points) - 2) / (threshold - 2)
+	a = 0  # index in points of the previously selected point
+	for bucket in xrange(threshold - 2):
+		start = int(bucket * bucketSize) + 1
+		end = int((bucket + 1) * bucketSize) + 1
+		nextEnd = min(int((bucket + 2) * bucketSize) + 1, len(points))
+		# the third point of the triangle is the average of the next bucket
+		nextPoints = points[end:nextEnd]
+		avgTime = sum(times[p] for p in nextPoints) / len(nextPoints)
+		avgValue = sum(values[p] for p in nextPoints) / len(nextPoints)
+		aTime = times[points[a]]
+		aValue = values[points[a]]
+		maxArea = -1
+		for i in xrange(start, end):
+			p = points[i]
+			area = abs((aTime - avgTime) * (values[p] - aValue) - (aTime - times[p]) * (avgValue - aValue))
+			if area > maxArea:
+				maxArea = area
+				best = i
+		selected.append(points[best])
+		a = best
+	selected.append(points[-1])
+	return selected
+
+
+def writeChart(jsonFileName, rows):
+	"""
+	Writes a list of (time, row) tuples to a DataTable JSON file in the same format as the daily data files
+	"""
+	jsonFile = open(jsonFileName, 'wb')
+	jsonFile.write("{" + brewpiJson.jsonCols + ",\"rows\":[")
+	separator = os.linesep
+	for timestamp, row in rows:
+		jsonFile.write(separator + brewpiJson.rowToJson(row, timestamp))
+		separator = ',' + os.linesep
+	jsonFile.write("]}")
+	jsonFile.close()
+
+
+class BeerRollups:
+	"""
+	Maintains the rollup tiers and the downsampled chart of a beer in data/<beer>/rollup/,
+	and publishes them to the same location in the www data directory.
+	The chart is built from the buckets of the slowest tier, which are kept in memory, so updating it does not read
+	the whole store. The samples logged after the last of these buckets and the annotated samples are added from
+	the store.
+	"""
+
+	def __init__(self, store, dataPath, wwwDataPath, beerName, chartPoints=1000):
+		"""
+		Args:
+		store: TimeSeriesStore with all samples of the beer
+		dataPath, wwwDataPath: data directories of the beer, wwwDataPath None to not publish the files
+		beerName: name of the beer, used as prefix of the file names
+		chartPoints: number of points per line in the downsampled chart
+		"""
+		self.store = store
+		self.chartPoints = chartPoints
+		rollupPath = util.addSlash(dataPath) + 'rollup/'
+		wwwRollupPath = util.addSlash(wwwDataPath) + 'rollup/' if wwwDataPath else None
+		for path in [rollupPath, wwwRollupPath]:
+			if path and not os.path.exists(path):
+				os.makedirs(path)
+				os.chmod(path, 0775)  # give group all permissions
+
+		self.tiers = []
+		for name, seconds in tiers:
+			fileName = beerName + '-' + name + '.json'
+			rollup = Rollup(rollupPath + fileName, seconds, wwwRollupPath and wwwRollupPath + fileName)
+			rollup.seed(store)
+			self.tiers.append(rollup)
+		self.chartFileName = rollupPath + beerName + '-chart.json'
+		self.wwwChartFileName = wwwRollupPath and wwwRollupPath + beerName + '-chart.json'
+		self.chartRows = []  # (time, row) of each bucket of the slowest tier, with the means as values
+		for row in brewpiJson.readRows(self.tiers[-1].jsonFileName):
+			if row['Time'] is not None:
+				means = dict((name, row[name]) for name, label in rollupColumns)
+				self.chartRows.append((time.mktime(row['Time'].timetuple()), chartRow(means, row['State'])))
+		self.chartOutdated = False
+		self.updateChart()
+
+	def add(self, row, timestamp):
+		"""
+		Adds a sample to all tiers. The chart is updated by the next commit() each time the slowest tier completes
+		a bucket.
+		"""
+		completed = False
+		for rollup in self.tiers:
+			completed = rollup.add(row, timestamp)
+		if completed:
+			bucket = self.tiers[-1].completedBucket
+			self.chartRows.append((bucket.start, bucket.toRow()))
+			self.chartOutdated = True
+
+	def commit(self, fsync=True):
+		"""
+		Writes the completed buckets of all tiers and the outdated chart, and publishes them to the www directory
+		"""
+		for rollup in self.tiers:
+			rollup.commit(fsync)
+		if self.chartOutdated:
+			self.chartOutdated = False
+			self.updateChart()
+
+	def updateChart(self):
+		"""
+		Writes the chart: the buckets of the slowest tier, downsampled to chartPoints per line in chartColumns,
+		followed by the samples after the last bucket. Annotated samples are always included.
+		"""
+		times = [timestamp for timestamp, row in self.chartRows]
+		selected = set()
+		for name in chartColumns:
+			selected.update(largestTriangles(times, [row[name] for timestamp, row in self.chartRows], self.chartPoints))
+		rows = [self.chartRows[i] for i in selected]
+		tailStart = 0
+		if self.chartRows:
+			tailStart = self.store.indexOf(self.chartRows[-1][0] + self.tiers[-1].seconds)
+		for index in self.store.annotations:
+			if index < tailStart:
+				rows += [(row['Time'], row) for row in self.store.rows(index, index + 1)]
+		rows += [(row['Time'], row) for row in self.store.rows(tailStart)]
+		rows.sort(key=lambda timestampRow: timestampRow[0])
+		tmpName = self.chartFileName + '.tmp'
+		writeChart(tmpName, rows)
+		BrewPiMirror.copyAtomic(tmpName, self.chartFileName)
+		if self.wwwChartFileName:
+			BrewPiMirror.copyAtomic(tmpName, self.wwwChartFileName)
+		os.remove(tmpName)
+
+	def close(self):
+		for rollup in self.tiers:
+			rollup.close()
+
+
+def queryJson(store, fromTime=None, toTime=None, resolution=0):
+	"""
+	Returns the samples logged between fromTime and toTime as a DataTable JSON string.
+	The rows are found with a binary search on the Time column of the store, only the requested rows are read.
+
+	Params:
+	store: TimeSeriesStore to read from
+	fromTime, toTime: seconds since the epoch, None for the start or end of the beer
+	resolution: 0 or 'raw' for the logged samples in the format of the daily files. Otherwise a number of seconds or the name
+		of a tier ('1m', '15m', '1h'), the samples are then aggregated in buckets in the format of the rollup files.
+		When the query would return more than maxQueryRows rows, a coarser resolution is used: the first tier that
+		is coarse enough, or a larger number of seconds. The resolution used is in the table property resolution.
+
+	Raises:
+	ValueError when a parameter has the wrong type or value, they usually come from a socket client
+	"""
+	for value in [fromTime, toTime]:
+		if value is not None and (isinstance(value, bool) or not isinstance(value, (int, long, float))):
+			raise ValueError("time is not a number: %r" % (value,))
+	if isinstance(resolution, basestring) and resolution in dict(tiers, raw=0):
+		resolution = dict(tiers, raw=0)[resolution]
+	try:
+		resolution = float(resolution or 0)
+	except TypeError:
+		raise ValueError("invalid resolution: %r" % (resolution,))
+	if not 0 <= resolution < float('inf'):
+		raise ValueError("invalid resolution: %r" % (resolution,))
+	start, stop = store.range(fromTime, toTime)
+	if stop - start > maxQueryRows:
+		span = store.column('Time', stop - 1, stop)[0] - store.column('Time', start, start + 1)[0]
+		if resolution <= 0 or span / resolution > maxQueryRows:
+			needed = span / maxQueryRows
+			coarseEnough = [seconds for name, seconds in tiers if seconds >= needed]
+			resolution = float(coarseEnough[0] if coarseEnough else math.ceil(needed))
+	rows = []
+	if resolution <= 0:
+		cols = brewpiJson.jsonCols
+		for row in store.rows(start, stop):
+			rows.append(brewpiJson.rowToJson(row, row['Time']))
+	else:
+		cols = rollupJsonCols
+		bucket = None
+		for row in store.rows(start, stop):
+			bucketStart = row['Time'] - row['Time'] % resolution
+			if bucket and bucket.start != bucketStart:
+				rows.append(bucket.toJson())
+				bucket = None
+			if not bucket:
+				bucket = Bucket(bucketStart)
+			bucket.add(row)
+		if bucket:
+			rows.append(bucket.toJson())
+	return "{" + cols + ",\"rows\":[" + ",".join(rows) + "],\"p\":{\"resolution\":%s}}" % str(resolution)
@@ -0,0 +1,94 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+import Queue
+import threading
+import time
+
+import BrewPiUtil as util
+
+
+class SerialReader(threading.Thread):
+	"""
+	Reads the serial port in a background thread. Data is split into lines as it arrives and each complete line is
+	put on a queue together with the time it was received. The main loop takes the lines from the queue without
+	waiting for the serial port, also when a reply from the Arduino takes a long time.
+	The serial port should be opened with a short timeout, so the thread can stop quickly.
+	"""
+
+	def __init__(self, ser, listener=None):
+		"""
+		Args:
+		ser: opened serial port
+		listener: optional function that is called in the reader thread with each line and its receive time,
+			before the line is put on the queue. Errors of the listener are logged, the line is still queued.
+		"""
+		threading.Thread.__init__(self, name='SerialReader')
+		self.daemon = True  # do not keep the script alive
+		self.ser = ser
+		self.listener = listener
+		self.queue = Queue.Queue()
+		self.running = True
+		self.error = None  # the exception that stopped the thread
+
+	def run(self):
+		buffered = ''
+		while self.running:
+			try:
+				data = self.ser.read(self.ser.inWaiting() or 1)
+			except Exception, e:  # the port is gone, for example when the Arduino is unplugged
+				self.error = e
+				util.logMessage("Error reading from serial port: %s" % e)
+				break
+			if not data:
+				continue
+			receivedTime = time.time()
+			buffered += data
+			lines = buffered.split('\n')
+			buffered = lines.pop()  # incomplete line, or an empty string
+			for line in lines:
+				if line.strip():
+					if self.listener:
+						try:
+							self.listener(line + '\n', receivedTime)
+						except Exception, e:
+							util.logMessage("Error handling serial line %r: %s" % (line[:100], e))
+					self.queue.put((receivedTime, line + '\n'))
+
+	def readMessages(self):
+		"""
+		Returns all lines received since the last call as a list of (receive time, line) tuples, without waiting
+		"""
+		messages = []
+		while True:
+			try:
+				messages.append(self.queue.get_nowait())
+			except Queue.Empty:
+				return messages
+
+	def readLines(self):
+		"""
+		Returns all lines received since the last call, without waiting. Lines end with a newline like readlines().
+		"""
+		return [line for receivedTime, line in self.readMessages()]
+
+	def stop(self):
+		"""
+		Stops the thread and waits until it no longer uses the serial port. Call this before closing the port.
+		"""
+		self.running = False
+		if self.isAlive() and threading.currentThread() is not self:
+			self.join()
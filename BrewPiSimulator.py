@@ -0,0 +1,315 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+# Simulates an Arduino running BrewPi on a pseudo terminal, so the script can run without hardware.
+# Usage: python BrewPiSimulator.py [--speed <simulated seconds per second>] [--link <path>] [--room <temp>]
+#                                  [--beer <temp>]
+# Set port in the config file to the printed pseudo terminal, or to the path given with --link.
+
+import getopt
+import os
+import re
+import select
+import sys
+import time
+
+import simplejson as json
+
+import BrewPiCommand
+import parseEnum
+
+logMessagesFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'LogMessages.h')
+
+simulatedVersion = dict(v="0.2.0", n=0, y=1, b='s', s=2)
+
+# installed and available devices reported by the simulator
+installedDevices = [dict(i=0, c=1, b=0, f=5, h=2, p=10, a="28FF93AA22010027", x=0, d=0, j=0.0),  # fridge sensor
+                    dict(i=1, c=1, b=1, f=9, h=2, p=10, a="28FF84AA22010091", x=0, d=0, j=0.0),  # beer sensor
+                    dict(i=2, c=1, b=0, f=2, h=1, p=6, x=1, d=0),  # heater
+                    dict(i=3, c=1, b=0, f=3, h=1, p=5, x=1, d=0)]  # cooler
+availableDevices = [dict(c=0, b=0, f=0, h=2, p=10, a="28FF5AAB22010066", x=0, d=0, j=0.0)]
+
+IDLE, STATE_OFF, HEATING, COOLING = 0, 1, 3, 4
+
+
+def logIds(enumName):
+	"""
+	Returns a dict with the id of each log message in LogMessages.h by its name
+	"""
+	messages = parseEnum.parseEnumInFile(logMessagesFile, enumName)
+	return dict((message['logKey'], logId) for logId, message in messages.items())
+
+
+class FridgeModel:
+	"""
+	Thermal model of a fridge with a heater and a cooler, and a fermenting beer inside it.
+	The fridge air exchanges heat with the room and the beer, the beer only with the fridge air.
+	"""
+
+	def __init__(self, roomTemp=20.0, beerTemp=20.0, fridgeTemp=None):
+		self.roomTemp = roomTemp
+		self.beerTemp = beerTemp
+		self.fridgeTemp = beerTemp if fridgeTemp is None else fridgeTemp
+		self.wallTime = 3600.0  # time constant of the fridge air with the room, in seconds
+		self.beerTime = 14400.0  # time constant of the beer with the fridge air
+		self.airBeerRatio = 20.0  # heat capacity of the beer compared to the fridge air
+		self.heatPower = 0.02  # degrees per second the heater adds to the fridge air
+		self.coolPower = 0.03  # degrees per second the cooler removes from the fridge air
+		self.fermentationHeat = 0.00002  # degrees per second added to the beer by the yeast
+
+	def step(self, seconds, heating, cooling):
+		"""
+		Advances the model, in steps of at most 10 seconds to keep it stable
+		"""
+		while seconds > 0:
+			dt = min(seconds, 10.0)
+			seconds -= dt
+			beerFlow = (self.fridgeTemp - self.beerTemp) / self.beerTime
+			fridgeChange = (self.roomTemp - self.fridgeTemp) / self.wallTime - beerFlow * self.airBeerRatio
+			if heating:
+				fridgeChange += self.heatPower
+			if cooling:
+				fridgeChange -= self.coolPower
+			self.fridgeTemp += fridgeChange * dt
+			self.beerTemp += (beerFlow + self.fermentationHeat) * dt
+
+
+class ArduinoSimulator:
+	"""
+	Speaks the serial protocol of BrewPi on the Arduino and controls the temperature of a FridgeModel.
+	The control is simplified: in beer constant and profile mode the fridge setting follows the beer error
+	with a proportional gain, the fridge temperature is kept in the idle range around the fridge setting.
+	"""
+
+	def __init__(self, model=None):
+		self.model = model or FridgeModel()
+		self.time = 0.0  # simulated seconds since the start
+		self.stateSince = 0.0
+		self.state = IDLE
+		self.input = ''
+		self.warnings = logIds('warningMessages')
+		self.logVersion = int(re.search(r'BREWPI_LOG_MESSAGES_VERSION (\d+)', open(logMessagesFile).read()).group(1))
+		self.loadDefaults()
+
+	def loadDefaults(self):
+		self.cs = dict(mode='b', beerSet=20.0, fridgeSet=20.0, heatEst=0.2, coolEst=5.0)
+		self.cc = dict(tempFormat="C", tempSetMin=1.0, tempSetMax=30.0, Kp=5.0, Ki=0.25, Kd=-1.5, iMaxErr=0.5,
+					   idleRangeH=1.0, idleRangeL=-1.0, heatTargetH=0.301, heatTargetL=-0.199, coolTargetH=0.199,
+					   coolTargetL=-0.301, maxHeatTimeForEst="600", maxCoolTimeForEst="1200", fridgeFastFilt="1",
+					   fridgeSlowFilt="4", fridgeSlopeFilt="3", beerFastFilt="3", beerSlowFilt="5",
+					   beerSlopeFilt="4", lah=0, hs=0)
+		self.cv = dict(beerDiff=0.0, diffIntegral=0.0, beerSlope=0.0, p=0.0, i=0.0, d=0.0, estPeak=0.0,
+					   negPeakEst=0.0, posPeakEst=0.0, negPeak=0.0, posPeak=0.0)
+
+	def setState(self, state):
+		if state != self.state:
+			self.state = state
+			self.stateSince = self.time
+
+	def control(self):
+		mode = self.cs['mode']
+		model = self.model
+		if mode == 'o':
+			self.setState(STATE_OFF)
+			return
+		if mode in ('b', 'p'):
+			error = self.cs['beerSet'] - model.beerTemp
+			self.cv['beerDiff'] = round(-error, 3)
+			self.cv['p'] = round(self.cc['Kp'] * error, 3)
+			fridgeSet = self.cs['beerSet'] + self.cv['p']
+			self.cs['fridgeSet'] = round(min(self.cc['tempSetMax'], max(self.cc['tempSetMin'], fridgeSet)), 2)
+		difference = model.fridgeTemp - self.cs['fridgeSet']
+		if self.state == COOLING:
+			if difference <= self.cc['coolTargetL']:
+				self.setState(IDLE)
+		elif self.state == HEATING:
+			if difference >= self.cc['heatTargetH']:
+				self.setState(IDLE)
+		elif difference > self.cc['idleRangeH']:
+			self.setState(COOLING)
+		elif difference < self.cc['idleRangeL']:
+			self.setState(HEATING)
+		else:
+			self.setState(IDLE)
+
+	def step(self, seconds):
+		"""
+		Advances the simulated time, the control runs every simulated second
+		"""
+		while seconds > 0:
+			dt = min(seconds, 1.0)
+			seconds -= dt
+			self.model.step(dt, self.state == HEATING, self.state == COOLING)
+			self.time += dt
+			self.control()
+
+	def temperatures(self):
+		model = self.model
+		return dict(BeerTemp=round(model.beerTemp, 2), BeerSet=self.cs['beerSet'], BeerAnn=None,
+					FridgeTemp=round(model.fridgeTemp, 2), FridgeSet=self.cs['fridgeSet'], FridgeAnn=None,
+					RoomTemp=round(model.roomTemp, 2), State=self.state)
+
+	def lcd(self):
+		modes = dict(b="Beer Const.", f="Fridge Const.", p="Beer Profile", o="Off")
+		states = {IDLE: "Idling", STATE_OFF: "Temp. control OFF", HEATING: "Heating", COOLING: "Cooling"}
+		seconds = int(self.time - self.stateSince)
+		return ["Mode   " + modes.get(self.cs['mode'], "Unknown"),
+				"Beer   %5.1f %5.1f \xb0C" % (self.model.beerTemp, self.cs['beerSet']),
+				"Fridge %5.1f %5.1f \xb0C" % (self.model.fridgeTemp, self.cs['fridgeSet']),
+				"%s for %02dm%02d" % (states[self.state], seconds // 60, seconds % 60)]
+
+	def logMessage(self, logType, logId, values):
+		return "D:" + json.dumps(dict(logType=logType, logID=logId, V=values)) + "\n"
+
+	def applySettings(self, command):
+		settings = BrewPiCommand.parseSettings(command)
+		if settings is None:
+			return self.logMessage('W', self.warnings['WARNING_COULD_NOT_PROCESS_SETTING'], [])
+		for key, value in settings:
+			value = value.strip('"')
+			target = self.cs if key in self.cs else self.cc if key in self.cc else None
+			if target is None:
+				return self.logMessage('W', self.warnings['WARNING_COULD_NOT_PROCESS_SETTING'], [])
+			if isinstance(target[key], float):
+				try:
+					value = float(value)
+				except ValueError:
+					return self.logMessage('W', self.warnings['WARNING_COULD_NOT_PROCESS_SETTING'], [])
+			target[key] = value
+		self.control()
+		return ''
+
+	def handleCommand(self, command):
+		"""
+		Returns the reply to one command
+		"""
+		c = command[0]
+		if c == 'n':
+			version = dict(simulatedVersion, l=self.logVersion)
+			return "N:" + json.dumps(version) + "\n"
+		if c == 't':
+			return "T:" + json.dumps(self.temperatures()) + "\n"
+		if c == 'l':
+			# the LCD sends the degree sign as a single byte, which is not valid in a JSON string
+			lines = [line.replace('\xb0', '~') for line in self.lcd()]
+			return "L:" + json.dumps(lines).replace('~', '\xb0') + "\n"
+		if c == 's':
+			return "S:" + json.dumps(self.cs) + "\n"
+		if c == 'c':
+			return "C:" + json.dumps(self.cc) + "\n"
+		if c == 'v':
+			return "V:" + json.dumps(self.cv) + "\n"
+		if c == 'd':
+			return "d:" + json.dumps(installedDevices) + "\n"
+		if c == 'h':
+			return "h:" + json.dumps(availableDevices) + "\n"
+		if c == 'U':
+			return "U:" + command[1:] + "\n"
+		if c == 'j':
+			return self.applySettings(command)
+		if c in 'SCE':
+			self.loadDefaults()
+			return ''
+		return self.logMessage('W', self.warnings['WARNING_INVALID_COMMAND'], [ord(c)])
+
+	def receive(self, data):
+		"""
+		Processes the data received on the serial port and returns the replies.
+		Commands are a single character, optionally followed by a JSON object.
+		"""
+		self.input += data
+		output = ''
+		while self.input:
+			c = self.input[0]
+			if c.isspace():
+				self.input = self.input[1:]
+				continue
+			end = 1
+			if c in 'jdhU':
+				if self.input[1:2] == '':
+					break  # wait for the rest of the command
+				if self.input[1] == '{':
+					end = self.input.find('}') + 1
+					if end == 0:
+						break
+			command, self.input = self.input[:end], self.input[end:]
+			output += self.handleCommand(command)
+		return output
+
+
+def main():
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], "hs:l:r:b:", ['help', 'speed=', 'link=', 'room=', 'beer='])
+	except getopt.GetoptError:
+		print "Available Options: --help, --speed <n>, --link <path>, --room <temp>, --beer <temp>"
+		sys.exit()
+	speed = 60.0
+	link = None
+	model = FridgeModel()
+	for o, a in opts:
+		if o in ('-h', '--help'):
+			print "\n Simulates an Arduino running BrewPi on a pseudo terminal." \
+				  "\n --speed <n>: simulated seconds per real second, defaults to 60" \
+				  "\n --link <path>: create a symbolic link to the pseudo terminal, to use as port in the config" \
+				  "\n --room <temp>: room temperature, defaults to 20" \
+				  "\n --beer <temp>: start temperature of the beer and the fridge, defaults to 20"
+			sys.exit()
+		if o in ('-s', '--speed'):
+			speed = float(a)
+		if o in ('-l', '--link'):
+			link = a
+		if o in ('-r', '--room'):
+			model.roomTemp = float(a)
+		if o in ('-b', '--beer'):
+			model.beerTemp = model.fridgeTemp = float(a)
+
+	try:
+		import pty
+		import tty
+	except ImportError:
+		sys.exit("ERROR: the simulator needs pseudo terminals, which are not available on this platform")
+	master, slave = pty.openpty()
+	tty.setraw(slave)
+	portName = os.ttyname(slave)
+	if link:
+		if os.path.lexists(link):
+			os.remove(link)
+		os.symlink(portName, link)
+		portName = link
+	print "Simulated Arduino running on " + portName + " at %g times real time" % speed
+	sys.stdout.flush()
+
+	simulator = ArduinoSimulator(model)
+	lastTime = time.time()
+	try:
+		while True:
+			readable, writable, failed = select.select([master], [], [], 0.1)
+			now = time.time()
+			simulator.step((now - lastTime) * speed)
+			lastTime = now
+			if readable:
+				output = simulator.receive(os.read(master, 1024))
+				if output:
+					os.write(master, output)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		if link and os.path.lexists(link):
+			os.remove(link)
+
+
+if __name__ == '__main__':
+	main()
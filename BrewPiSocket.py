@@ -17,7 +17,16 @@
 import sys
 import socket
 import os
+import errno
+import re
+import select
+import time
 import BrewPiUtil as util
+import BrewPiMetrics
+
+maxMessageSize = 1024 * 1024  # connections that send a larger message are closed
+deferredCheckInterval = 0.05  # seconds between checks of replies that are not ready yet
+lengthPrefix = re.compile(r'(\d{1,9}):')
 
 class BrewPiSocket:
 	"""
@@ -39,12 +48,14 @@ class BrewPiSocket:
 		self.sock = 0
 
 		isWindows = sys.platform.startswith('win')
-		useInternetSocket = bool(cfg.get('useInternetSocket', isWindows))
+		# brewpi.py reads useInetSocket, older configs can still use useInternetSocket
+		useInternetSocket = str(cfg.get('useInetSocket', cfg.get('useInternetSocket', isWindows))).lower() == 'true'
 		if useInternetSocket:
-			self.port = cfg.get('socketPort', 6332)
+			self.host = cfg.get('socketHost', 'localhost')
+			self.port = int(cfg.get('socketPort', 6332))
 			self.type = 'i'
 		else:
-			self.file = util.addSlash(cfg['scriptPath']) + 'BEERSOCKET'
+			self.file = cfg.get('socketFile', util.addSlash(cfg['scriptPath']) + 'BEERSOCKET')
 
 	def __repr__(self):
 		"""
@@ -123,3 +134,295 @@ class BrewPiSocket:
 		finally:
 			return conn, msgType, msg
 
+
+
+class DeferredReply:
+	"""
+	A reply that is not known yet when the message is handled, for example because it waits for a reply from the
+	Arduino. The server keeps serving other clients and sends the result when it is ready.
+	"""
+
+	def __init__(self, ready, result):
+		"""
+		Args:
+		ready: function that returns True when the reply can be sent
+		result: function that returns the reply, a string or None
+		"""
+		self.ready = ready
+		self.result = result
+
+
+class Subscription:
+	"""
+	A reply that keeps the connection open to push events to the client. The reply is sent like any other reply,
+	after that the server sends the events that are pushed, until the client closes the connection.
+	A connection that sent a single message switches to line framing, so each event is sent as one line.
+	"""
+
+	def __init__(self, reply):
+		self.reply = reply
+		self.events = []  # events that are not sent yet
+		self.closed = False  # set when the connection is closed
+
+	def push(self, event):
+		if not self.closed:
+			self.events.append(event)
+
+
+class Connection:
+	"""
+	A client connected to a SocketServer. The framing of the messages is detected from the first data received:
+	- length framing: the data starts with <length>: and each message is sent as <length>:<message>. Replies are
+	  framed the same way, messages without a reply get an empty reply (0:).
+	- line framing: the data contains a newline. Each message is one line and each reply is one line, messages
+	  without a reply get an empty line.
+	- otherwise the client sent one message like the web interface always did. The data received is the message,
+	  the connection is closed after the reply.
+	With length or line framing, the connection stays open for more messages and replies are sent in the order of
+	the messages.
+	"""
+
+	def __init__(self, sock, listener, handler):
+		self.sock = sock
+		self.listener = listener  # listening socket that accepted the connection
+		self.handler = handler
+		self.framing = None  # 'length', 'line' or 'single'
+		self.inBuffer = ''
+		self.outBuffer = ''
+		self.outOffset = 0  # bytes at the start of outBuffer that have been sent
+		self.replies = []  # replies that are not sent yet, in the order of the messages
+		self.closing = False  # close when all replies are sent
+		self.subscription = None
+
+	def messages(self):
+		"""
+		Takes the complete messages from the received data.
+
+		Returns:
+		a list of messages, or None when the data does not follow the framing of the connection
+		"""
+		if self.framing is None:
+			if lengthPrefix.match(self.inBuffer):
+				self.framing = 'length'
+			elif self.inBuffer.isdigit():
+				return []  # the rest of a length prefix can follow
+			elif '\n' in self.inBuffer:
+				self.framing = 'line'
+			else:
+				self.framing = 'single'
+				self.closing = True
+				message, self.inBuffer = self.inBuffer, ''
+				return [message]
+		messages = []
+		if self.framing == 'line':
+			lines = self.inBuffer.split('\n')
+			self.inBuffer = lines.pop()  # incomplete line, or an empty string
+			messages = [line.rstrip('\r') for line in lines if line.strip()]
+		elif self.framing == 'length':
+			while self.inBuffer:
+				match = lengthPrefix.match(self.inBuffer)
+				if match is None:
+					if self.inBuffer.isdigit() and len(self.inBuffer) < 10:
+						break  # the rest of the length prefix can follow
+					return None
+				end = match.end() + int(match.group(1))
+				if len(self.inBuffer) < end:
+					break
+				messages.append(self.inBuffer[match.end():end])
+				self.inBuffer = self.inBuffer[end:]
+		return messages
+
+	def frame(self, reply):
+		if reply is None:
+			reply = ''
+		if self.framing == 'length':
+			return "%d:%s" % (len(reply), reply)
+		if self.framing == 'line':
+			return reply + '\n'
+		return reply
+
+	def streaming(self):
+		"""
+		Returns True while a reply is read from a stream, like a file, as the connection drains. Later replies wait
+		until it is complete. Connections that stream replies override this, readStream and closeStream.
+		"""
+		return False
+
+	def readStream(self):
+		"""
+		Returns the next part of the streamed reply
+		"""
+		return ''
+
+	def closeStream(self):
+		pass
+
+	def queueReplies(self):
+		"""
+		Moves the replies that are ready, up to the first one that is not, to the output buffer. A streamed reply is
+		read in parts when the output buffer is empty.
+		"""
+		if self.streaming():
+			if not self.outBuffer:
+				self.outBuffer = self.readStream()
+			return
+		while self.replies and not self.streaming():
+			reply = self.replies[0]
+			if isinstance(reply, DeferredReply):
+				try:
+					if not reply.ready():
+						return
+					reply = reply.result()
+				except Exception, e:  # like an error of the handler, only this connection is closed
+					util.logMessage("Error building deferred reply on socket: %s" % e)
+					self.replies = []
+					self.closing = True
+					return
+			elif isinstance(reply, Subscription):
+				self.subscribe(reply)
+				reply = reply.reply
+			self.replies.pop(0)
+			self.outBuffer += self.frame(reply)
+		if self.subscription and self.subscription.events:
+			events, self.subscription.events = self.subscription.events, []
+			self.outBuffer += ''.join(self.frame(event) for event in events)
+
+	def subscribe(self, subscription):
+		if self.subscription:
+			self.subscription.closed = True  # a new subscription replaces the old one
+		self.subscription = subscription
+		if self.framing == 'single':
+			self.framing = 'line'
+			self.closing = False
+
+	def done(self):
+		return self.closing and not self.replies and not self.outBuffer and not self.streaming()
+
+
+class SocketServer:
+	"""
+	Serves the clients of one or more listening sockets from a single thread with select. Many clients can be
+	connected at once. The messages are passed to the handler of the socket, which returns the reply: a string, None
+	when the message has no reply, a DeferredReply or a Subscription.
+	"""
+
+	def __init__(self):
+		self.listeners = {}  # listening socket: (handler, connection class)
+		self.connections = {}  # client socket: Connection
+		self.waitSeconds = 0.0  # time the last call to serve waited for clients
+
+	def addListener(self, sock, handler, connectionClass=None):
+		"""
+		Serves the clients of a listening socket. The connections are created with connectionClass, which parses the
+		messages and frames the replies, Connection by default.
+		"""
+		sock.setblocking(0)
+		self.listeners[sock] = (handler, connectionClass or Connection)
+
+	def removeListener(self, sock):
+		"""
+		Stops serving a listening socket and closes the connections it accepted
+		"""
+		self.listeners.pop(sock, None)
+		for connection in self.connections.values():
+			if connection.listener is sock:
+				self.close(connection)
+
+	def close(self, connection):
+		self.connections.pop(connection.sock, None)
+		connection.closeStream()
+		if connection.subscription:
+			connection.subscription.closed = True
+		try:
+			connection.sock.close()
+		except socket.error:
+			pass
+
+	def accept(self, listener):
+		try:
+			sock, addr = listener.accept()
+		except socket.error, e:
+			if e.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+				util.logMessage("Error accepting socket connection: %s" % e)
+			return
+		sock.setblocking(0)
+		handler, connectionClass = self.listeners[listener]
+		self.connections[sock] = connectionClass(sock, listener, handler)
+
+	def receive(self, connection):
+		try:
+			data = connection.sock.recv(65536)
+		except socket.error, e:
+			if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+				return
+			data = ''
+		if not data:  # the client closed the connection
+			connection.closing = True
+			connection.inBuffer = ''
+			return
+		connection.inBuffer += data
+		messages = connection.messages()
+		if messages is None or len(connection.inBuffer) > maxMessageSize:
+			util.logMessage("Error: closing socket connection that sent invalid or too large data")
+			self.close(connection)
+			return
+		for message in messages:
+			try:
+				reply = connection.handler(message)
+			except Exception, e:  # one bad message should not stop serving the other clients
+				util.logMessage("Error handling message '%s' received on socket: %s" % (str(message)[:100], e))
+				self.close(connection)
+				return
+			connection.replies.append(reply)
+
+	def send(self, connection):
+		try:
+			sent = connection.sock.send(buffer(connection.outBuffer, connection.outOffset))
+		except socket.error, e:
+			if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+				return
+			self.close(connection)  # the client is gone
+			return
+		connection.outOffset += sent
+		# drop the sent data when it is at least half of the buffer, large replies are not copied on every send
+		if connection.outOffset * 2 >= len(connection.outBuffer):
+			connection.outBuffer = connection.outBuffer[connection.outOffset:]
+			connection.outOffset = 0
+
+	def serve(self, timeout):
+		"""
+		Waits at most timeout seconds for clients, then handles all messages that were received and sends the
+		replies that can be sent without waiting.
+		"""
+		for connection in self.connections.values():
+			connection.queueReplies()  # replies and events that became ready since the last call
+		if any(connection.replies for connection in self.connections.values()):
+			timeout = min(timeout, deferredCheckInterval)
+		readers = self.listeners.keys() + [sock for sock, connection in self.connections.items()
+										   if not connection.closing]
+		writers = [sock for sock, connection in self.connections.items() if connection.outBuffer]
+		waitStart = time.time()
+		try:
+			readable, writable, failed = select.select(readers, writers, [], timeout)
+		except select.error, e:
+			if e.args[0] != errno.EINTR:
+				raise
+			return
+		busyStart = time.time()
+		self.waitSeconds = busyStart - waitStart
+		for sock in readable:
+			if sock in self.listeners:
+				with BrewPiMetrics.process.time('socketAccept'):
+					self.accept(sock)
+			elif sock in self.connections:
+				self.receive(self.connections[sock])
+		for connection in self.connections.values():
+			connection.queueReplies()
+			if connection.outBuffer:
+				self.send(connection)
+			if connection.subscription and len(connection.outBuffer) - connection.outOffset > maxMessageSize:
+				util.logMessage("Error: closing socket connection that does not read its replies and events")
+				self.close(connection)
+			elif connection.done():
+				self.close(connection)
+		BrewPiMetrics.process.add('socketServe', time.time() - busyStart)
@@ -0,0 +1,343 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+import array
+import mmap
+import os
+import struct
+import sys
+import time
+
+import brewpiJson
+import BrewPiUtil as util
+
+# name and array type code of each column. Temperatures are stored as doubles, NaN means no value.
+columns = (('Time', 'd'),
+           ('BeerTemp', 'd'),
+           ('BeerSet', 'd'),
+           ('FridgeTemp', 'd'),
+           ('FridgeSet', 'd'),
+           ('RoomTemp', 'd'),
+           ('State', 'B'))
+noState = 255  # stored in the State column when the state is unknown
+
+# annotations are rare, they are kept in a text file next to the columns
+annotationColumns = ('BeerAnn', 'FridgeAnn')
+
+growRows = 4096  # column files grow with this number of rows at a time
+
+
+def storedValue(typeCode, value):
+	"""
+	Converts a logged value to the type of its column. Missing values and values that cannot be stored, like a state
+	that is not a small integer, are stored as missing.
+	"""
+	try:
+		if typeCode != 'B':
+			return float(value)
+		value = int(value)
+		if 0 <= value < noState:
+			return value
+	except (TypeError, ValueError, OverflowError):
+		pass
+	return noState if typeCode == 'B' else float('nan')
+
+
+def csvLine(row, timestamp=None):
+	"""
+	Formats a row of logged values as a line in the ; separated CSV file.
+	"""
+	if timestamp is None:
+		timestamp = time.time()
+	return (time.strftime("%b %d %Y %H:%M:%S;", time.localtime(timestamp)) +
+			str(row['BeerTemp']) + ';' +
+			str(row['BeerSet']) + ';' +
+			str(row['BeerAnn']) + ';' +
+			str(row['FridgeTemp']) + ';' +
+			str(row['FridgeSet']) + ';' +
+			str(row['FridgeAnn']) + ';' +
+			str(row['State']) + ';' +
+			str(row['RoomTemp']) + '\n')
+
+
+class Column:
+	"""
+	A memory mapped file holding the fixed width values of one column in little endian byte order.
+	"""
+
+	def __init__(self, fileName, typeCode, readOnly=False, growBy=growRows):
+		self.typeCode = typeCode
+		self.growBy = growBy
+		self.format = '<' + typeCode
+		self.itemSize = struct.calcsize(self.format)
+		self.readOnly = readOnly
+		if readOnly:
+			self.file = open(fileName, 'rb')
+		elif os.path.exists(fileName):
+			self.file = open(fileName, 'r+b')
+		else:
+			self.file = open(fileName, 'w+b')
+		self.map = None
+		self.capacity = 0
+		self.remap()
+
+	def remap(self, minRows=0):
+		"""
+		Maps the file again after it has grown. Grows the file first when it cannot hold minRows rows.
+		"""
+		size = os.fstat(self.file.fileno()).st_size
+		if not self.readOnly and size < minRows * self.itemSize:
+			size = (minRows + self.growBy) * self.itemSize
+			self.file.truncate(size)
+		if self.map:
+			self.map.close()
+			self.map = None
+		if size:
+			access = mmap.ACCESS_READ if self.readOnly else mmap.ACCESS_WRITE
+			self.map = mmap.mmap(self.file.fileno(), size, access=access)
+		self.capacity = size // self.itemSize
+
+	def set(self, index, value):
+		if index >= self.capacity:
+			self.remap(index + 1)
+		struct.pack_into(self.format, self.map, index * self.itemSize, value)
+
+	def get(self, index):
+		if index >= self.capacity:
+			self.remap()
+		return struct.unpack_from(self.format, self.map, index * self.itemSize)[0]
+
+	def getRange(self, start, stop):
+		"""
+		Returns the values from start to stop as an array
+		"""
+		if stop <= start:
+			return array.array(self.typeCode)
+		if stop > self.capacity:
+			self.remap()
+		values = array.array(self.typeCode, self.map[start * self.itemSize:stop * self.itemSize])
+		if sys.byteorder == 'big':
+			values.byteswap()
+		return values
+
+	def flush(self):
+		if self.map and not self.readOnly:
+			self.map.flush()
+
+	def close(self):
+		if self.map:
+			self.map.close()
+			self.map = None
+		self.file.close()
+
+
+class TimeSeriesStore:
+	"""
+	Append only binary store for the logged temperature samples of one beer.
+	Each column is a memory mapped file with one fixed width value per row, so a range of rows can be read
+	without parsing any text. The number of valid rows is kept in a separate header. Appended rows are counted in
+	memory and the header is only updated by flush, after the columns have been written to disk. The kernel writes
+	memory mapped pages back in any order, so this ordering is what makes rows that were not completely written
+	before a power cut to be ignored.
+	"""
+
+	def __init__(self, path, readOnly=False):
+		"""
+		Opens the store in directory path, creates it when it does not exist and readOnly is False.
+		"""
+		self.path = util.addSlash(path)
+		self.readOnly = readOnly
+		if not readOnly and not os.path.exists(self.path):
+			os.makedirs(self.path)
+		self.columns = {}
+		for name, typeCode in columns:
+			self.columns[name] = Column(self.path + name + '.bin', typeCode, readOnly)
+		self.header = Column(self.path + 'count.bin', 'Q', readOnly, growBy=0)
+		if not readOnly and self.header.capacity == 0:
+			self.header.set(0, 0)
+		self.count = self.header.get(0) if self.header.capacity else 0  # rows appended by this writer
+		self.annotationFileName = self.path + 'annotations.txt'
+		self.annotations = {}
+		self.annotationsRead = 0
+		self.pendingAnnotations = []  # lines that are written to the annotations file by the next flush
+		self.readAnnotations()
+
+	def __len__(self):
+		if not self.readOnly:
+			return self.count
+		if self.header.capacity == 0:
+			self.header.remap()
+			if self.header.capacity == 0:
+				return 0
+		return self.header.get(0)
+
+	def readAnnotations(self):
+		"""
+		Reads annotations that were added to the annotations file since it was last read.
+		Annotations are stored as lines of: row index, column name and text, separated by tabs.
+		The writer removes the annotations of rows that were not committed, they were left behind by a crash.
+		"""
+		if not os.path.exists(self.annotationFileName):
+			return
+		annotationFile = open(self.annotationFileName, 'rb')
+		annotationFile.seek(self.annotationsRead)
+		uncommitted = False
+		for line in annotationFile:
+			if not line.endswith('\n'):
+				uncommitted = not self.readOnly
+				break  # still being written
+			index, name, text = line.rstrip('\n').split('\t', 2)
+			if not self.readOnly and int(index) >= self.count:
+				uncommitted = True
+				break
+			self.annotationsRead += len(line)
+			self.annotations.setdefault(int(index), {})[name] = text
+		annotationFile.close()
+		if uncommitted:
+			annotationFile = open(self.annotationFileName, 'r+b')
+			annotationFile.truncate(self.annotationsRead)
+			annotationFile.close()
+
+	def append(self, row, timestamp=None):
+		"""
+		Appends a row of logged values, keyed by the same names as the DataTable JSON columns.
+		Returns the index of the new row.
+		"""
+		if timestamp is None:
+			timestamp = time.time()
+		index = len(self)
+		self.annotations.pop(index, None)  # left behind by a row that was not committed
+		for name, typeCode in columns:
+			if name == 'Time':
+				value = timestamp
+			else:
+				value = row.get(name)
+			self.columns[name].set(index, storedValue(typeCode, value))
+
+		for name in annotationColumns:
+			if row.get(name) is not None:
+				text = str(row[name]).replace('\t', ' ').replace('\n', ' ')
+				self.pendingAnnotations.append("%d\t%s\t%s\n" % (index, name, text))
+				self.annotations.setdefault(index, {})[name] = text
+
+		self.count = index + 1  # the row and its annotations are written to the header on the next flush
+		return index
+
+	def column(self, name, start=0, stop=None):
+		"""
+		Returns the values of one column from row start to row stop as a list, with None for missing values.
+		"""
+		if stop is None or stop > len(self):
+			stop = len(self)
+		values = self.columns[name].getRange(start, max(start, stop))
+		if name == 'State':
+			return [None if v == noState else v for v in values]
+		return [None if v != v else v for v in values]  # NaN is the only value not equal to itself
+
+	def rows(self, start=0, stop=None):
+		"""
+		Generator that yields the rows from start to stop as dicts, with the same keys as the rows
+		logged to the DataTable JSON file. Time is in seconds since the epoch.
+		"""
+		if stop is None or stop > len(self):
+			stop = len(self)
+		if stop > start and self.readOnly:
+			self.readAnnotations()
+		data = [(name, self.column(name, start, stop)) for name, typeCode in columns]
+		for i in xrange(stop - start):
+			row = dict((name, values[i]) for name, values in data)
+			annotations = self.annotations.get(start + i, {})
+			for name in annotationColumns:
+				row[name] = annotations.get(name)
+			yield row
+
+	def indexOf(self, timestamp):
+		"""
+		Returns the index of the first row logged at or after timestamp, with a binary search on the Time column
+		"""
+		timeColumn = self.columns['Time']
+		low = 0
+		high = len(self)
+		while low < high:
+			middle = (low + high) // 2
+			if timeColumn.get(middle) < timestamp:
+				low = middle + 1
+			else:
+				high = middle
+		return low
+
+	def range(self, fromTime=None, toTime=None):
+		"""
+		Returns start and stop indexes of the rows logged between fromTime and toTime (inclusive).
+		"""
+		start = 0 if fromTime is None else self.indexOf(fromTime)
+		stop = len(self) if toTime is None else self.indexOf(toTime + 1e-6)
+		return start, max(start, stop)
+
+	def flush(self, sync=True):
+		"""
+		Makes the appended rows visible to readers of the store by updating the header.
+		With sync, the columns and annotations are written to disk before the header and the header is written to
+		disk after them.
+		"""
+		if self.readOnly:
+			return
+		if sync:
+			for c in self.columns.values():
+				c.flush()
+		if self.pendingAnnotations:
+			annotationFile = open(self.annotationFileName, 'ab')
+			annotationFile.write(''.join(self.pendingAnnotations))
+			annotationFile.flush()
+			if sync:
+				os.fsync(annotationFile.fileno())
+			self.annotationsRead = annotationFile.tell()
+			annotationFile.close()
+			self.pendingAnnotations = []
+		if self.header.get(0) != self.count:
+			self.header.set(0, self.count)
+		if sync:
+			self.header.flush()
+
+	def close(self):
+		self.flush()
+		for c in self.columns.values():
+			c.close()
+		self.header.close()
+
+
+def exportJson(store, jsonFileName, start=0, stop=None):
+	"""
+	Writes rows of the store to a file in the Google DataTable JSON format written by brewpiJson
+	"""
+	jsonFile = open(jsonFileName, 'wb')
+	jsonFile.write("{" + brewpiJson.jsonCols + ",\"rows\":[")
+	separator = os.linesep
+	for row in store.rows(start, stop):
+		jsonFile.write(separator + brewpiJson.rowToJson(row, row['Time']))
+		separator = ',' + os.linesep
+	jsonFile.write("]}")
+	jsonFile.close()
+
+
+def exportCsv(store, csvFileName, start=0, stop=None):
+	"""
+	Writes rows of the store to a file in the ; separated CSV format logged by brewpi.py
+	"""
+	csvFile = open(csvFileName, 'wb')
+	for row in store.rows(start, stop):
+		csvFile.write(csvLine(row, row['Time']))
+	csvFile.close()
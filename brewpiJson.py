@@ -19,6 +19,8 @@ import time
 import os
 import re
 
+import simplejson as json
+
 jsonCols = ("\"cols\":[" +
             "{\"type\":\"datetime\",\"id\":\"Time\",\"label\":\"Time\"}," +
             "{\"type\":\"number\",\"id\":\"BeerTemp\",\"label\":\"Beer temperature\"}," +
@@ -31,6 +33,17 @@ jsonCols = ("\"cols\":[" +
             "{\"type\":\"number\",\"id\":\"State\",\"label\":\"State\"}" +
             "]")
 
+# keys of a row in column order after the time, with the format used to write the value
+# RoomTemp and State are written as strings for compatibility with existing data files
+rowFormat = (("BeerTemp", "{\"v\":%s}"),
+             ("BeerSet", "{\"v\":%s}"),
+             ("BeerAnn", "{\"v\":\"%s\"}"),
+             ("FridgeTemp", "{\"v\":%s}"),
+             ("FridgeSet", "{\"v\":%s}"),
+             ("FridgeAnn", "{\"v\":\"%s\"}"),
+             ("RoomTemp", "{\"v\":\"%s\"}"),
+             ("State", "{\"v\":\"%s\"}"))
+
 
 def fixJson(j):
 	j = re.sub(r"'{\s*?(|\w)", r'{"\1', j)
@@ -40,6 +53,38 @@ def fixJson(j):
 	return j
 
 
+def jsonDate(timestamp=None):
+	"""
+	Returns a timestamp in seconds since the epoch in the DataTable date format: Date(y,M,d,h,m,s).
+	The month is zero based, like in JavaScript. Defaults to now.
+	"""
+	if timestamp is None:
+		now = datetime.now()
+	else:
+		now = datetime.fromtimestamp(timestamp)
+	return "Date({y},{M},{d},{h},{m},{s})".format(
+		y=now.year, M=(now.month - 1), d=now.day, h=now.hour, m=now.minute, s=now.second)
+
+
+def rowToJson(row, timestamp=None):
+	"""
+	Formats a row of logged values as a DataTable row.
+	Returns something like:
+	{"c":[{"v":"Date(2012,8,26,0,1,0)"},{"v":18.96},{"v":19.0},null,{"v":19.94},{"v":19.6},null,null,{"v":"1"}]}
+
+	Params:
+	row: dict with the values for the columns in rowFormat
+	timestamp: time of the row in seconds since the epoch, defaults to now
+	"""
+	cells = ["{\"v\":\"" + jsonDate(timestamp) + "\"}"]
+	for key, fmt in rowFormat:
+		if row[key] is None:
+			cells.append("null")
+		else:
+			cells.append(fmt % str(row[key]))
+	return "{\"c\":[" + ",".join(cells) + "]}"
+
+
 def addRow(jsonFileName, row):
 	jsonFile = open(jsonFileName, "r+")
 	jsonFile.seek(-3, 2)  # Go insert point to add the last row
@@ -50,62 +95,318 @@ def addRow(jsonFileName, row):
 	if ch != '[':
 		# not the first item
 		jsonFile.write(',')
-	newRow = {}
-	newRow['Time'] = datetime.today()
 
-	# insert something like this into the file:
-	# {"c":[{"v":"Date(2012,8,26,0,1,0)"},{"v":18.96},{"v":19.0},null,{"v":19.94},{"v":19.6},null]},
 	jsonFile.write(os.linesep)
-	jsonFile.write("{\"c\":[")
-	now = datetime.now()
-	jsonFile.write("{{\"v\":\"Date({y},{M},{d},{h},{m},{s})\"}},".format(
-		y=now.year, M=(now.month - 1), d=now.day, h=now.hour, m=now.minute, s=now.second))
-	if row['BeerTemp'] is None:
-		jsonFile.write("null,")
-	else:
-		jsonFile.write("{\"v\":" + str(row['BeerTemp']) + "},")
+	jsonFile.write(rowToJson(row))
 
-	if row['BeerSet'] is None:
-		jsonFile.write("null,")
-	else:
-		jsonFile.write("{\"v\":" + str(row['BeerSet']) + "},")
+	# rewrite end of json file
+	jsonFile.write("]}")
+	jsonFile.close()
 
-	if row['BeerAnn'] is None:
-		jsonFile.write("null,")
-	else:
-		jsonFile.write("{\"v\":\"" + str(row['BeerAnn']) + "\"},")
 
-	if row['FridgeTemp'] is None:
-		jsonFile.write("null,")
-	else:
-		jsonFile.write("{\"v\":" + str(row['FridgeTemp']) + "},")
+class DataTableWriter:
+	"""
+	Keeps a DataTable JSON file open and appends rows to it.
+	Rows are collected in a buffer and written with a single write when the flush policy says so:
+	after every flushRows rows or when flushInterval seconds have passed since the last flush.
+	The file on disk is valid JSON after every flush.
+	"""
 
-	if row['FridgeSet'] is None:
-		jsonFile.write("null,")
-	else:
-		jsonFile.write("{\"v\":" + str(row['FridgeSet']) + "},")
+	def __init__(self, jsonFileName, flushRows=1, flushInterval=0, cols=jsonCols, journal=None):
+		"""
+		Opens an existing DataTable JSON file, or creates an empty one when it does not exist yet.
 
-	if row['FridgeAnn'] is None:
-		jsonFile.write("null,")
-	else:
-		jsonFile.write("{\"v\":\"" + str(row['FridgeAnn']) + "\"},")
+		Args:
+		jsonFileName: path to the JSON file
+		flushRows: number of buffered rows that triggers a flush, 0 to only flush when flush() is called
+		flushInterval: number of seconds after the last flush that triggers a flush, 0 to disable
+		cols: column definitions used when a new file is created
+		journal: optional write-ahead journal, its write(offset, data) method is called before data is written
+		"""
+		if not os.path.isfile(jsonFileName):
+			newEmptyFile(jsonFileName, cols)
+		self.fileName = jsonFileName
+		self.flushRows = int(flushRows)
+		self.flushInterval = float(flushInterval)
+		self.pending = []
+		self.lastFlush = time.time()
+		self.journal = journal
+		self.file = open(jsonFileName, "r+b")
+		self.file.seek(-3, 2)
+		self.empty = (self.file.read(1) == '[')
+		self.insertPos = self.file.tell()  # position of the closing ]} of the rows array
 
-	if row['RoomTemp'] is None:
-		jsonFile.write("null,")
-	else:
-		jsonFile.write("{\"v\":\"" + str(row['RoomTemp']) + "\"},")
+	def addRow(self, row, timestamp=None):
+		"""
+		Adds a row to the buffer and flushes when needed.
+		"""
+		self.addJsonRow(rowToJson(row, timestamp))
 
-	if row['State'] is None:
-		jsonFile.write("null")
-	else:
-		jsonFile.write("{\"v\":\"" + str(row['State']) + "\"}")
+	def addJsonRow(self, jsonRow):
+		"""
+		Adds a row that is already formatted as DataTable JSON to the buffer and flushes when needed.
+		"""
+		self.pending.append(jsonRow)
+		if self.flushRows and len(self.pending) >= self.flushRows:
+			self.flush()
+		elif self.flushInterval and time.time() - self.lastFlush >= self.flushInterval:
+			self.flush()
 
-	# rewrite end of json file
-	jsonFile.write("]}]}")
+	def flush(self):
+		"""
+		Writes all buffered rows to the file, followed by the closing brackets of the table.
+		"""
+		self.lastFlush = time.time()
+		if not self.pending:
+			return
+		separator = ',' + os.linesep
+		data = separator.join(self.pending)
+		data = (os.linesep if self.empty else separator) + data
+		self.pending = []
+		if self.journal:
+			self.journal.write(self.insertPos, data + "]}")
+		self.file.seek(self.insertPos)
+		self.file.write(data + "]}")
+		self.file.flush()
+		self.insertPos += len(data)
+		self.empty = False
+
+	def close(self):
+		"""
+		Flushes the buffer and closes the file.
+		"""
+		if self.file:
+			self.flush()
+			if self.journal:
+				os.fsync(self.file.fileno())
+				self.journal.close()  # the data is safe on disk, the journal is no longer needed
+			self.file.close()
+			self.file = None
+
+
+def repairFile(jsonFileName):
+	"""
+	Checks whether a data table file ends like a complete table. When it does not, for example because the script
+	was interrupted while writing it, the file is truncated after the last complete row and closed again.
+
+	Returns:
+	True when the file was repaired
+	"""
+	jsonFile = open(jsonFileName, "r+b")
+	jsonFile.seek(0, os.SEEK_END)
+	jsonFile.seek(max(0, jsonFile.tell() - 4))
+	tail = jsonFile.read()
+	if tail.endswith("]}]}") or tail.endswith("[]}"):
+		jsonFile.close()
+		return False
+	jsonFile.seek(0)
+	data = jsonFile.read()
+	rowsStart = data.find("\"rows\":[")
+	if rowsStart == -1:
+		# the header was not written completely, start again with an empty table
+		jsonFile.close()
+		newEmptyFile(jsonFileName)
+		return True
+	rowsStart += len("\"rows\":[")
+	lastRow = data.rfind("{\"c\":[", rowsStart)
+	if lastRow == -1:
+		end = rowsStart  # no rows
+	else:
+		# ] only occurs at the end of a row, so the row is complete when it is followed by ]}
+		rowEnd = data.find("]}", lastRow)
+		if rowEnd == -1:
+			end = len(data[:lastRow].rstrip().rstrip(','))  # drop the incomplete row
+		else:
+			end = rowEnd + 2
+	jsonFile.seek(end)
+	jsonFile.write("]}")
+	jsonFile.truncate()
 	jsonFile.close()
+	return True
 
 
-def newEmptyFile(jsonFileName):
+def newEmptyFile(jsonFileName, cols=jsonCols):
 	jsonFile = open(jsonFileName, "w")
-	jsonFile.write("{" + jsonCols + ",\"rows\":[]}")
+	jsonFile.write("{" + cols + ",\"rows\":[]}")
 	jsonFile.close()
+
+
+readSize = 65536  # number of bytes the streaming reader reads at a time
+rowStart = "{\"c\":["
+
+
+def parseDate(date):
+	"""
+	Converts a DataTable date string Date(y,M,d,h,m,s) with a zero based month to a datetime
+	"""
+	y, M, d, h, m, s = [int(v) for v in date[date.index('(') + 1:date.index(')')].split(',')]
+	return datetime(y, M + 1, d, h, m, s)
+
+
+def readCols(jsonFile):
+	"""
+	Reads the column definitions at the start of a DataTable JSON file.
+
+	Returns:
+	list of column definitions, offset of the first row in the file
+	"""
+	jsonFile.seek(0)
+	data = ''
+	while True:
+		chunk = jsonFile.read(readSize)
+		data += chunk
+		start = data.find("\"cols\":")
+		rowsStart = data.find("\"rows\":[")
+		if start != -1 and rowsStart != -1:
+			cols, end = json.JSONDecoder().raw_decode(data, start + len("\"cols\":"))
+			return cols, rowsStart + len("\"rows\":[")
+		if not chunk:
+			raise ValueError("no DataTable found in " + jsonFile.name)
+
+
+def typedRow(cols, row):
+	"""
+	Converts a decoded DataTable row to a dict keyed by column id. The time is a datetime, numbers are floats and
+	strings are kept. Missing cells and values are None. Numbers that were written as strings are converted too.
+	"""
+	result = {}
+	for col, cell in zip(cols, row['c']):
+		value = None if cell is None else cell.get('v')
+		if value is not None and value != 'None':
+			if col['type'] == 'datetime':
+				value = parseDate(value)
+			elif col['type'] == 'number':
+				try:
+					value = float(value)
+				except ValueError:
+					value = None
+		else:
+			value = None
+		result[col['id']] = value
+	for col in cols[len(row['c']):]:
+		result[col['id']] = None
+	return result
+
+
+def iterJsonRows(jsonFile, offset, onError=None):
+	"""
+	Generator that decodes the rows of a DataTable file one at a time, starting at the first row at or after offset.
+	Only a small buffer of the file is in memory. An incomplete last row is ignored. A corrupt row is skipped, the
+	rows after it are still read, and onError is called with its offset when it is given.
+
+	Yields:
+	offset of the row in the file, decoded row
+	"""
+	decoder = json.JSONDecoder()
+	jsonFile.seek(offset)
+	data = ''
+	pos = 0
+	eof = False
+	while True:
+		start = data.find(rowStart, pos)
+		if start != -1:
+			try:
+				row, end = decoder.raw_decode(data, start)
+			except ValueError:
+				row = None
+				nextStart = data.find(rowStart, start + 1)
+				if nextStart != -1:
+					# the row is corrupt, not incomplete: continue with the next row
+					if onError:
+						onError(offset + start)
+					pos = nextStart
+					continue
+				if eof:
+					return  # incomplete row at the end of the file
+			if row is not None:
+				yield offset + start, row
+				pos = end
+				continue
+		elif eof:
+			return
+		else:
+			start = max(pos, len(data) - len(rowStart))  # keep the end, it could be the start of a row
+		# read more data and drop what has been decoded
+		chunk = jsonFile.read(readSize)
+		eof = not chunk
+		offset += start
+		data = data[start:] + chunk
+		pos = 0
+
+
+def seekTime(jsonFile, rowsOffset, fromTime):
+	"""
+	Returns an offset in the file before the first row at or after fromTime, with a binary search on the file.
+	Rows are in time order, so only the time of a few rows has to be decoded.
+	"""
+	jsonFile.seek(0, os.SEEK_END)
+	low = rowsOffset
+	high = jsonFile.tell()
+	while high - low > readSize:
+		middle = (low + high) // 2
+		found = None
+		for offset, row in iterJsonRows(jsonFile, middle):
+			try:
+				found = offset, parseDate(row['c'][0]['v'])
+			except (KeyError, IndexError, ValueError, TypeError, AttributeError):
+				continue  # a row without a valid time, use the next one
+			break
+		if found and found[1] < fromTime:
+			low = found[0]
+		else:
+			high = middle
+	return low
+
+
+def lastRow(jsonFileName):
+	"""
+	Returns the last complete row of a DataTable JSON file as a dict like readRows, or None when it has no rows.
+	Only the end of the file is read.
+	"""
+	jsonFile = open(jsonFileName, "rb")
+	try:
+		cols, rowsOffset = readCols(jsonFile)
+		jsonFile.seek(0, os.SEEK_END)
+		offset = jsonFile.tell()
+		last = None
+		while last is None and offset > rowsOffset:
+			offset = max(rowsOffset, offset - readSize)
+			for rowOffset, row in iterJsonRows(jsonFile, offset):
+				last = row
+		return typedRow(cols, last) if last is not None else None
+	finally:
+		jsonFile.close()
+
+
+def readRows(jsonFileName, fromTime=None, onError=None):
+	"""
+	Generator that reads the rows of a DataTable JSON file written by brewpiJson with constant memory use.
+	Also reads the rollup files, all columns are returned.
+
+	Params:
+	jsonFileName: path of the file
+	fromTime: datetime or seconds since the epoch, rows logged before this time are skipped with a binary search
+	onError: function called with the offset of each row that is skipped because it cannot be read
+
+	Yields:
+	dicts keyed by column id, see typedRow
+	"""
+	jsonFile = open(jsonFileName, "rb")
+	try:
+		cols, offset = readCols(jsonFile)
+		if fromTime is not None:
+			if not isinstance(fromTime, datetime):
+				fromTime = datetime.fromtimestamp(fromTime)
+			offset = seekTime(jsonFile, offset, fromTime)
+		timeId = cols[0]['id']
+		for offset, row in iterJsonRows(jsonFile, offset, onError):
+			try:
+				row = typedRow(cols, row)
+			except (KeyError, ValueError, TypeError, AttributeError):
+				if onError:
+					onError(offset)
+				continue
+			if fromTime is None or row[timeId] >= fromTime:
+				yield row
+	finally:
+		jsonFile.close()
@@ -0,0 +1,337 @@
+# Copyright 2013 BrewPi
+# This file is part of BrewPi.
+
+# BrewPi is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# BrewPi is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with BrewPi.  If not, see <http://www.gnu.org/licenses/>.
+
+# Imports the JSON data tables and CSV files of existing beers into the binary store of each beer.
+# Usage: python importData.py [--data <data dir>] [--processes <n>] [--reindex] [beer name ...]
+# Stop brewpi.py or start another beer before importing the beer that is currently logged.
+
+import getopt
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+
+import brewpiJson
+import BrewPiStore
+import BrewPiUtil as util
+
+# keys of the logged values, in the order they are kept in the tuples passed between processes
+rowKeys = [key for key, fmt in brewpiJson.rowFormat]
+
+# order of the values after the time in a line of the CSV file. Older files end after FridgeAnn.
+csvKeys = ('BeerTemp', 'BeerSet', 'BeerAnn', 'FridgeTemp', 'FridgeSet', 'FridgeAnn', 'State', 'RoomTemp')
+
+months = dict((m, i + 1) for i, m in enumerate(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+                                                'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']))
+
+manifestName = 'import.txt'  # list of imported files in the store directory, used to skip beers on the next run
+
+
+def toValue(key, value):
+	"""
+	Converts a value read from a data file to the type stored for its column, None when there is no value
+	"""
+	if value is None or value == 'None' or value == '':
+		return None
+	if key in BrewPiStore.annotationColumns:
+		return value
+	try:
+		if key == 'State':
+			return int(float(value))
+		return float(value)
+	except ValueError:
+		return None
+
+
+def localTime(year, month, day, hour, minute, second):
+	return time.mktime((year, month, day, hour, minute, second, 0, 0, -1))
+
+
+def parseJsonFile(fileName):
+	"""
+	Reads the rows of a DataTable JSON file written by brewpi.py
+
+	Returns:
+	list of (time, values) tuples with values in the order of rowKeys, number of rows that could not be read
+	"""
+	result = []
+	skippedOffsets = []
+	for row in brewpiJson.readRows(fileName, onError=skippedOffsets.append):
+		try:
+			timestamp = time.mktime(row['Time'].timetuple())
+		except (KeyError, AttributeError):
+			skippedOffsets.append(None)  # a row without a time
+			continue
+		result.append((timestamp, tuple(toValue(key, row.get(key)) for key in rowKeys)))
+	return result, len(skippedOffsets)
+
+
+def parseCsvFile(fileName):
+	"""
+	Reads the lines of a CSV file written by brewpi.py, like: Sep 26 2012 00:01:00;18.96;19.00;None;19.94;19.60;None
+
+	Returns:
+	list of (time, values) tuples with values in the order of rowKeys, number of lines that could not be read
+	"""
+	result = []
+	skipped = 0
+	for line in open(fileName, 'rb'):
+		fields = line.rstrip('\r\n').split(';')
+		if len(fields) < 7:
+			if line.strip():
+				skipped += 1
+			continue
+		try:
+			month, day, year, clock = fields[0].split()
+			h, m, s = clock.split(':')
+			timestamp = localTime(int(year), months[month], int(day), int(h), int(m), int(s))
+		except (KeyError, ValueError):
+			skipped += 1
+			continue
+		values = dict(zip(csvKeys, fields[1:]))
+		result.append((timestamp, tuple(toValue(key, values.get(key)) for key in rowKeys)))
+	return result, skipped
+
+
+def parseFile(fileName):
+	"""
+	Runs in a worker process. Returns the file name, the rows, the number of rows skipped and an error message.
+	"""
+	try:
+		if fileName.endswith('.csv'):
+			rows, skipped = parseCsvFile(fileName)
+		else:
+			rows, skipped = parseJsonFile(fileName)
+		return fileName, rows, skipped, None
+	except Exception, e:
+		return fileName, [], 0, str(e)
+
+
+def sourceFiles(beerPath):
+	"""
+	Returns the data files of a beer: its daily JSON data tables and its CSV file
+	"""
+	names = [name for name in sorted(os.listdir(beerPath))
+			 if not name.startswith('.') and (name.endswith('.json') or name.endswith('.csv'))]
+	return [beerPath + name for name in names if os.path.isfile(beerPath + name)]
+
+
+def fileSignature(fileName):
+	stat = os.stat(fileName)
+	return "%s\t%d\t%d" % (os.path.basename(fileName), stat.st_size, int(stat.st_mtime))
+
+
+def readManifest(storePath):
+	"""
+	Returns the signatures of the files that were imported into the store, None when the beer was not imported
+	"""
+	fileName = storePath + manifestName
+	if not os.path.exists(fileName):
+		return None
+	return [line.rsplit('\t', 1)[0] for line in open(fileName, 'rb').read().splitlines()]
+
+
+def isImported(beerPath, files):
+	"""
+	A beer is imported when the store exists and its files did not change since they were imported
+	"""
+	return readManifest(beerPath + 'store/') == [fileSignature(f) for f in files]
+
+
+def restoreInterruptedSwap(beerPath):
+	"""
+	Cleans up after an import that was interrupted: removes a partly written store and puts back the old store
+	if the new store was not in place yet.
+	"""
+	if os.path.exists(beerPath + 'store.import'):
+		shutil.rmtree(beerPath + 'store.import')
+	if os.path.exists(beerPath + 'store.old'):
+		if os.path.exists(beerPath + 'store'):
+			shutil.rmtree(beerPath + 'store.old')
+		else:
+			os.rename(beerPath + 'store.old', beerPath + 'store')
+
+
+def mergeRows(parsed):
+	"""
+	Merges the rows of all files of a beer in time order. The same sample is usually logged to both the JSON and the
+	CSV file, so only the first row with a given time is kept. JSON files are passed first, they also hold the room
+	temperature and state of older beers.
+
+	Params:
+	parsed: list of row lists as returned by parseFile
+	"""
+	merged = {}
+	for rows in parsed:
+		for timestamp, values in rows:
+			merged.setdefault(int(round(timestamp)), (timestamp, values))
+	return [merged[key] for key in sorted(merged.keys())]
+
+
+def writeStore(beerPath, rows, signatures):
+	"""
+	Writes the merged rows to a new store, verifies it and replaces the current store of the beer with it.
+	Rows in the current store that are newer than the imported rows are kept.
+
+	Returns:
+	number of rows in the new store
+	"""
+	storePath = beerPath + 'store/'
+	tmpPath = beerPath + 'store.import/'
+	store = BrewPiStore.TimeSeriesStore(tmpPath)
+	for timestamp, values in rows:
+		store.append(dict(zip(rowKeys, values)), timestamp)
+	expected = [timestamp for timestamp, values in rows]
+	if os.path.exists(storePath):
+		oldStore = BrewPiStore.TimeSeriesStore(storePath, readOnly=True)
+		start = oldStore.indexOf(expected[-1] + 0.5) if expected else 0
+		for row in oldStore.rows(start):
+			store.append(row, row['Time'])
+			expected.append(row['Time'])
+		oldStore.close()
+	store.close()
+
+	# read the new store back before it replaces the old one
+	store = BrewPiStore.TimeSeriesStore(tmpPath, readOnly=True)
+	if len(store) != len(expected) or list(store.column('Time')) != expected:
+		store.close()
+		shutil.rmtree(tmpPath)
+		raise ValueError("the store holds %d rows instead of %d" % (len(store), len(expected)))
+	store.close()
+
+	manifest = open(tmpPath + manifestName, 'wb')
+	for signature, count in signatures:
+		manifest.write("%s\t%d\n" % (signature, count))
+	manifest.close()
+
+	if os.path.exists(storePath):
+		os.rename(storePath, beerPath + 'store.old')
+	os.rename(tmpPath, storePath)
+	if os.path.exists(beerPath + 'store.old'):
+		shutil.rmtree(beerPath + 'store.old')
+	return len(expected)
+
+
+def importBeers(dataPath, beerNames=None, processes=None, reindex=False):
+	"""
+	Imports the data files of beers in a data directory into their stores.
+	The files are parsed in a pool of worker processes and each beer is written as soon as all its files are parsed.
+	Beers that were imported before and did not change are skipped, so an interrupted import can be restarted.
+
+	Params:
+	dataPath: directory with a subdirectory for each beer
+	beerNames: names of the beers to import, None for all beers
+	processes: number of worker processes, defaults to the number of CPUs
+	reindex: import all beers again, also when they did not change
+
+	Returns:
+	dict with the number of imported rows for each beer, or the reason it was not imported
+	"""
+	dataPath = util.addSlash(dataPath)
+	if beerNames is None:
+		beerNames = sorted(name for name in os.listdir(dataPath) if os.path.isdir(dataPath + name))
+
+	results = {}
+	pending = {}  # files of each beer that still have to be parsed
+	for beerName in beerNames:
+		beerPath = util.addSlash(dataPath + beerName)
+		if not os.path.isdir(beerPath):
+			results[beerName] = "not found"
+			continue
+		files = sourceFiles(beerPath)
+		if os.path.exists(beerPath + beerName + '.csv.journal'):
+			results[beerName] = "skipped, it is being logged or was not closed properly"
+			continue
+		restoreInterruptedSwap(beerPath)
+		if not files:
+			results[beerName] = "no data files"
+		elif not reindex and isImported(beerPath, files):
+			results[beerName] = "already imported"
+		else:
+			pending[beerName] = files
+
+	fileBeer = dict((f, beerName) for beerName, files in pending.items() for f in files)
+	parsed = dict((beerName, {}) for beerName in pending)
+	if not fileBeer:
+		return results
+	pool = multiprocessing.Pool(processes)
+	try:
+		# large files first, so the pool is not waiting on one big file at the end
+		order = sorted(fileBeer.keys(), key=lambda f: -os.path.getsize(f))
+		for fileName, rows, skipped, error in pool.imap_unordered(parseFile, order):
+			beerName = fileBeer[fileName]
+			if error:
+				print "Could not read %s: %s" % (fileName, error)
+			elif skipped:
+				print "Skipped %d rows that could not be read in %s" % (skipped, fileName)
+			parsed[beerName][fileName] = rows
+			if len(parsed[beerName]) < len(pending[beerName]):
+				continue
+			files = pending[beerName]
+			# JSON files first, see mergeRows
+			ordered = sorted(files, key=lambda f: (f.endswith('.csv'), f))
+			beerPath = util.addSlash(dataPath + beerName)
+			signatures = [(fileSignature(f), len(parsed[beerName][f])) for f in files]
+			try:
+				count = writeStore(beerPath, mergeRows([parsed[beerName][f] for f in ordered]), signatures)
+				results[beerName] = count
+				print "Imported %d rows of %s from %d files" % (count, beerName, len(files))
+			except (ValueError, IOError, OSError), e:
+				results[beerName] = "failed: " + str(e)
+				print "Import of %s failed: %s" % (beerName, e)
+			del parsed[beerName]
+	finally:
+		pool.close()
+		pool.join()
+	return results
+
+
+def main():
+	try:
+		opts, args = getopt.getopt(sys.argv[1:], "hd:p:r", ['help', 'data=', 'processes=', 'reindex'])
+	except getopt.GetoptError:
+		print "Available Options: --help, --data <data dir>, --processes <n>, --reindex, followed by beer names"
+		sys.exit()
+
+	dataPath = util.addSlash(util.scriptPath()) + 'data/'
+	processes = None
+	reindex = False
+	for o, a in opts:
+		if o in ('-h', '--help'):
+			print "\n Imports existing JSON and CSV data files into the binary store of each beer." \
+				  "\n Beers that were imported before and did not change are skipped." \
+				  "\n --data <dir>: data directory with a directory per beer, defaults to the data dir of the script" \
+				  "\n --processes <n>: number of processes that read files, defaults to the number of CPUs" \
+				  "\n --reindex: import all beers again" \
+				  "\n Pass beer names to only import these beers."
+			sys.exit()
+		if o in ('-d', '--data'):
+			dataPath = a
+		if o in ('-p', '--processes'):
+			processes = int(a)
+		if o in ('-r', '--reindex'):
+			reindex = True
+
+	if not os.path.isdir(dataPath):
+		sys.exit('ERROR: Data directory "%s" was not found!' % dataPath)
+	results = importBeers(dataPath, args or None, processes, reindex)
+	for beerName in sorted(results.keys()):
+		print "%s: %s" % (beerName, results[beerName])
+
+
+if __name__ == '__main__':
+	main()
@@ -25,12 +25,39 @@ import expandLogMessage
 import settingRestore
 from sys import stderr
 import BrewPiUtil as util
+import BrewPiCommand
+import BrewPiDispatcher
 
 
 def printStdErr(string):
 	print >> stderr, string + '\n'
 
 
+def printDebugMessage(data, line, receivedTime):
+	try:
+		expandedMessage = expandLogMessage.expandLogMessage(data)
+		printStdErr("Arduino debug message: " + expandedMessage)
+	except Exception, e:  # catch all exceptions, because out of date file could cause errors
+		printStdErr("Error while expanding log message: " + str(e))
+		printStdErr("Arduino debug message was: " + data)
+
+
+def printDecodeError(line, e):
+	printStdErr("JSON decode error: " + str(e))
+	printStdErr("Line received was: " + line)
+
+
+def readReplies(ser, dispatcher):
+	"""
+	Dispatches the lines received from the Arduino until it has been silent for the timeout of the serial port
+	"""
+	while 1:  # read all lines on serial interface
+		line = ser.readline()
+		if not line:
+			break
+		dispatcher.dispatch(line)
+
+
 def fetchBoardSettings(boardsFile, boardType):
 	boardSettings = {}
 	for line in boardsFile:
@@ -80,6 +107,16 @@ def programArduino(config, boardType, hexFile, restoreWhat):
 		print e
 		return 0
 
+	# the version, settings and devices received from the Arduino are collected in dispatcher.values
+	dispatcher = BrewPiDispatcher.LineDispatcher(printDecodeError)
+	dispatcher.collect('N', AvrInfo)
+	dispatcher.collect('C')
+	dispatcher.collect('S')
+	dispatcher.collect('d')
+	dispatcher.register('D', printDebugMessage, None)
+	dispatcher.register('U', lambda data, line, receivedTime:
+						printStdErr("Arduino reports: device updated to: " + data), None)
+
 	printStdErr("Checking old version before programming.")
 
 	avrVersionOld = None
@@ -87,16 +124,14 @@ def programArduino(config, boardType, hexFile, restoreWhat):
 	retries = 0
 	requestVersion = True
 	while requestVersion:
-		for line in ser.readlines():
-			if line[0] == 'N':
-				data = line.strip('\n')[2:]
-				avrVersionOld = AvrInfo(data)
-				printStdErr(( "Found Arduino " + str(avrVersionOld.board) +
-							" with a " + str(avrVersionOld.shield) + " shield, " +
-							"running BrewPi version " + str(avrVersionOld.version) +
-							" build " + str(avrVersionOld.build)))
-				requestVersion = False
-				break
+		dispatcher.dispatchLines(ser.readlines())
+		avrVersionOld = dispatcher.values.pop('N', None)
+		if avrVersionOld is not None:
+			printStdErr(( "Found Arduino " + str(avrVersionOld.board) +
+						" with a " + str(avrVersionOld.shield) + " shield, " +
+						"running BrewPi version " + str(avrVersionOld.version) +
+						" build " + str(avrVersionOld.build)))
+			requestVersion = False
 		else:
 			ser.write('n')  # request version info
 			time.sleep(1)
@@ -121,18 +156,10 @@ def programArduino(config, boardType, hexFile, restoreWhat):
 		time.sleep(2)
 
 
-	for line in ser.readlines():
-		try:
-			if line[0] == 'C':
-				oldSettings['controlConstants'] = json.loads(line[2:])
-			elif line[0] == 'S':
-				oldSettings['controlSettings'] = json.loads(line[2:])
-			elif line[0] == 'd':
-				oldSettings['installedDevices'] = json.loads(line[2:])
-
-		except json.decoder.JSONDecodeError, e:
-			printStdErr("JSON decode error: " + str(e))
-			printStdErr("Line received was: " + line)
+	dispatcher.dispatchLines(ser.readlines())
+	for prefix, name in (('C', 'controlConstants'), ('S', 'controlSettings'), ('d', 'installedDevices')):
+		if prefix in dispatcher.values:
+			oldSettings[name] = dispatcher.values.pop(prefix)
 
 	ser.close()
 	del ser  # Arduino won't reset when serial port is not completely removed
@@ -231,17 +258,14 @@ def programArduino(config, boardType, hexFile, restoreWhat):
 	retries = 0
 	requestVersion = True
 	while requestVersion:
-		for line in ser.readlines():
-			if line[0] == 'N':
-				data = line.strip('\n')[2:]
-				avrVersionNew = AvrInfo(data)
-				printStdErr(("Checking new version: Found Arduino " + avrVersionNew.board +
-								" with a " + str(avrVersionNew.shield) + " shield, " +
-								"running BrewPi version " + str(avrVersionNew.version) +
-								" build " + str(avrVersionNew.build) + "\n"))
-				requestVersion = False
-				break
-
+		dispatcher.dispatchLines(ser.readlines())
+		avrVersionNew = dispatcher.values.pop('N', None)
+		if avrVersionNew is not None:
+			printStdErr(("Checking new version: Found Arduino " + avrVersionNew.board +
+							" with a " + str(avrVersionNew.shield) + " shield, " +
+							"running BrewPi version " + str(avrVersionNew.version) +
+							" build " + str(avrVersionNew.build) + "\n"))
+			requestVersion = False
 		else:
 			ser.write('n')  # request version info
 			time.sleep(1)
@@ -253,19 +277,7 @@ def programArduino(config, boardType, hexFile, restoreWhat):
 	printStdErr("Resetting EEPROM to default settings")
 	ser.write('E')
 	time.sleep(5)  # resetting EEPROM takes a while, wait 5 seconds
-	while 1:  # read all lines on serial interface
-		line = ser.readline()
-		if line:  # line available?
-			if line[0] == 'D':
-				# debug message received
-				try:
-					expandedMessage = expandLogMessage.expandLogMessage(line[2:])
-					printStdErr("Arduino debug message: " + expandedMessage)
-				except Exception, e:  # catch all exceptions, because out of date file could cause errors
-					printStdErr("Error while expanding log message: " + str(e))
-					printStdErr("Arduino debug message was: " + line[2:])
-		else:
-			break
+	readReplies(ser, dispatcher)
 
 	if avrVersionNew is None:
 		printStdErr(("Warning: Cannot receive version number from Arduino after programming. " +
@@ -305,28 +317,9 @@ def programArduino(config, boardType, hexFile, restoreWhat):
 		ser.write('c')
 		ser.write('s')
 		time.sleep(2)
-		ccNew = {}
-		csNew = {}
-		while 1:  # read all lines on serial interface
-			line = ser.readline()
-			if line:  # line available?
-				try:
-					if line[0] == 'C':
-						ccNew = json.loads(line[2:])
-					elif line[0] == 'S':
-						csNew = json.loads(line[2:])
-					elif line[0] == 'D':
-						try:  # debug message received
-							expandedMessage = expandLogMessage.expandLogMessage(line[2:])
-							printStdErr(expandedMessage)
-						except Exception, e:  # catch all exceptions, because out of date file could cause errors
-							printStdErr("Error while expanding log message: " + str(e))
-							printStdErr("Arduino debug message: " + line[2:])
-				except json.decoder.JSONDecodeError, e:
-						printStdErr("JSON decode error: " + str(e))
-						printStdErr("Line received was: " + line)
-			else:
-				break
+		readReplies(ser, dispatcher)
+		ccNew = dispatcher.values.pop('C', {})
+		csNew = dispatcher.values.pop('S', {})
 
 		printStdErr("Trying to restore old control constants and settings")
 		# find control constants to restore
@@ -343,25 +336,12 @@ def programArduino(config, boardType, hexFile, restoreWhat):
 
 		printStdErr("Restoring these settings: " + json.dumps(restoredSettings))
 
-		for key in restoredSettings.keys():
-			# send one by one or the arduino cannot keep up
-			if restoredSettings[key] is not None:
-				command = "j{" + str(key) + ":" + str(restoredSettings[key]) + "}\n"
-				ser.write(command)
-				time.sleep(0.5)
-			# read all replies
-			while 1:
-				line = ser.readline()
-				if line:  # line available?
-					if line[0] == 'D':
-						try:  # debug message received
-							expandedMessage = expandLogMessage.expandLogMessage(line[2:])
-							printStdErr(expandedMessage)
-						except Exception, e:  # catch all exceptions, because out of date file could cause errors
-							printStdErr("Error while expanding log message: " + str(e))
-							printStdErr("Arduino debug message: " + line[2:])
-				else:
-					break
+		settings = [(str(key), str(value)) for key, value in restoredSettings.items() if value is not None]
+		# combine the settings in as few commands as fit in the receive buffer of the Arduino
+		for command in BrewPiCommand.settingsCommands(settings):
+			ser.write(command + "\n")
+			# read all replies, the next command is sent when the Arduino is done with this one
+			readReplies(ser, dispatcher)
 
 		printStdErr("restoring settings done!")
 	else:
@@ -376,20 +356,7 @@ def programArduino(config, boardType, hexFile, restoreWhat):
 		time.sleep(1)  # give the Arduino time to respond
 
 		# read log messages from arduino
-		while 1:  # read all lines on serial interface
-			line = ser.readline()
-			if line:  # line available?
-				if line[0] == 'D':
-					try:  # debug message received
-						expandedMessage = expandLogMessage.expandLogMessage(line[2:])
-						printStdErr(expandedMessage)
-					except Exception, e:  # catch all exceptions, because out of date file could cause errors
-						printStdErr("Error while expanding log message: " + str(e))
-						printStdErr("Arduino debug message: " + line[2:])
-				elif line[0] == 'U':
-					printStdErr("Arduino reports: device updated to: " + line[2:])
-			else:
-				break
+		readReplies(ser, dispatcher)
 
 		printStdErr("Restoring installed devices done!")
 	else:
@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+import BrewPiBeerStats
+from BrewPiStore import TimeSeriesStore
+
+
+def sampleRow(beerTemp, state):
+	return {"BeerTemp": beerTemp, "BeerSet": 20.0, "BeerAnn": None, "FridgeTemp": 18.0,
+			"FridgeSet": 18.0, "FridgeAnn": None, "RoomTemp": None, "State": state}
+
+
+class BeerStatsTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.store = TimeSeriesStore(os.path.join(self.dir, 'store'))
+		self.stats = BrewPiBeerStats.BeerStats()
+		# 3 minutes cooling, 1 minute idle, then a gap that is not counted
+		for timestamp, beerTemp, state in [(0, 20.0, 4), (60, 20.5, 4), (120, 21.5, 4), (180, 19.0, 0),
+										   (240, 20.0, 0), (100000, 22.0, 3)]:
+			self.store.append(sampleRow(beerTemp, state), timestamp)
+			self.stats.add(sampleRow(beerTemp, state), timestamp)
+
+	def tearDown(self):
+		self.store.close()
+		shutil.rmtree(self.dir)
+
+	def test_statsAreUpdatedPerSample(self):
+		result = self.stats.toDict()
+		self.assertEqual(result['rows'], 6)
+		self.assertEqual(result['BeerTemp'], {'min': 19.0, 'max': 22.0, 'mean': 20.5})
+		self.assertEqual(result['stateSeconds'], {'4': 180, '0': 60})
+		self.assertEqual(result['coolingDutyCycle'], 0.75)
+		self.assertEqual(result['heatingDutyCycle'], 0.0)
+		self.assertEqual(result['maxBeerDeviation'], 2.0)
+		self.assertEqual(result['maxBeerDeviationTime'], 100000)
+
+	def test_savedStatsAreLoaded(self):
+		fileName = os.path.join(self.dir, 'stats.txt')
+		self.stats.save(fileName)
+		loaded = BrewPiBeerStats.load(fileName, self.store)
+		self.assertEqual(loaded.toDict(), self.stats.toDict())
+		loaded.add(sampleRow(20.0, 3), 100060)
+		self.assertEqual(loaded.toDict()['stateSeconds']['3'], 60)
+
+	def test_statsAreRebuiltFromStore(self):
+		fileName = os.path.join(self.dir, 'stats.txt')
+		self.stats.save(fileName)
+		self.store.append(sampleRow(20.0, 3), 100060)
+		self.stats.add(sampleRow(20.0, 3), 100060)
+		self.assertEqual(BrewPiBeerStats.load(fileName, self.store).toDict(), self.stats.toDict())
+
+if __name__ == '__main__':
+	unittest.main()
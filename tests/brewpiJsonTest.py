@@ -0,0 +1,113 @@
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import simplejson as json
+import brewpiJson
+
+
+def sampleRow(beerTemp=19.5):
+	return {"BeerTemp": beerTemp, "BeerSet": 20.0, "BeerAnn": None,
+			"FridgeTemp": 18.25, "FridgeSet": 18.0, "FridgeAnn": "cooling",
+			"RoomTemp": 21.0, "State": 4}
+
+
+class DataTableWriterTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.fileName = os.path.join(self.dir, 'test.json')
+		brewpiJson.newEmptyFile(self.fileName)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def loadRows(self):
+		return json.load(open(self.fileName))['rows']
+
+	def test_writerMatchesAddRow(self):
+		reference = os.path.join(self.dir, 'reference.json')
+		brewpiJson.newEmptyFile(reference)
+		writer = brewpiJson.DataTableWriter(self.fileName)
+		for t in (19.5, 19.6, None):
+			brewpiJson.addRow(reference, sampleRow(t))
+			writer.addRow(sampleRow(t))
+		writer.close()
+		self.assertEqual(json.load(open(reference)), json.load(open(self.fileName)))
+
+	def test_fileIsValidAfterEveryRow(self):
+		writer = brewpiJson.DataTableWriter(self.fileName)
+		for i in range(3):
+			writer.addRow(sampleRow(19.0 + i))
+			self.assertEqual(len(self.loadRows()), i + 1)
+		writer.close()
+
+	def test_rowsAreBufferedUntilFlush(self):
+		writer = brewpiJson.DataTableWriter(self.fileName, flushRows=3)
+		writer.addRow(sampleRow())
+		writer.addRow(sampleRow())
+		self.assertEqual(len(self.loadRows()), 0)
+		writer.addRow(sampleRow())
+		self.assertEqual(len(self.loadRows()), 3)
+		writer.addRow(sampleRow())
+		writer.close()
+		self.assertEqual(len(self.loadRows()), 4)
+
+	def test_appendsToExistingFile(self):
+		brewpiJson.addRow(self.fileName, sampleRow())
+		writer = brewpiJson.DataTableWriter(self.fileName)
+		writer.addRow(sampleRow(20.0))
+		writer.close()
+		rows = self.loadRows()
+		self.assertEqual(len(rows), 2)
+		self.assertEqual(rows[1]['c'][1]['v'], 20.0)
+		self.assertEqual(rows[1]['c'][8]['v'], "4")
+
+
+class ReadRowsTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.fileName = os.path.join(self.dir, 'test.json')
+		self.startTime = 1372500000
+		writer = brewpiJson.DataTableWriter(self.fileName)
+		for i in range(500):
+			writer.addRow(sampleRow(19.0 + i / 100.0), self.startTime + 60 * i)
+		writer.close()
+		self.readSize = brewpiJson.readSize
+		brewpiJson.readSize = 256  # read in many small blocks
+
+	def tearDown(self):
+		brewpiJson.readSize = self.readSize
+		shutil.rmtree(self.dir)
+
+	def test_rowsAreTyped(self):
+		rows = list(brewpiJson.readRows(self.fileName))
+		self.assertEqual(len(rows), 500)
+		self.assertEqual(rows[1], {"Time": datetime.fromtimestamp(self.startTime + 60), "BeerTemp": 19.01,
+								   "BeerSet": 20.0, "BeerAnn": None, "FridgeTemp": 18.25, "FridgeSet": 18.0,
+								   "FridgeAnn": "cooling", "RoomTemp": 21.0, "State": 4.0})
+
+	def test_readingStartsAtTime(self):
+		for i in [0, 1, 250, 499]:
+			rows = list(brewpiJson.readRows(self.fileName, self.startTime + 60 * i - 30))
+			self.assertEqual(len(rows), 500 - i)
+			self.assertEqual(rows[0]['Time'], datetime.fromtimestamp(self.startTime + 60 * i))
+		self.assertEqual(list(brewpiJson.readRows(self.fileName, self.startTime + 60 * 500)), [])
+
+	def test_incompleteRowIsIgnored(self):
+		data = open(self.fileName, 'rb').read()
+		open(self.fileName, 'wb').write(data[:-20])
+		self.assertEqual(len(list(brewpiJson.readRows(self.fileName))), 499)
+
+	def test_corruptRowIsSkipped(self):
+		data = open(self.fileName, 'rb').read()
+		start = data.index(brewpiJson.rowStart, data.index(brewpiJson.rowStart, 1000) + 1)
+		open(self.fileName, 'wb').write(data[:start + 10] + 'garbage' + data[start + 17:])
+		skipped = []
+		rows = list(brewpiJson.readRows(self.fileName, onError=skipped.append))
+		self.assertEqual(len(rows), 499)
+		self.assertEqual(skipped, [start])
+		self.assertEqual(rows[-1]['Time'], datetime.fromtimestamp(self.startTime + 60 * 499))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,117 @@
+import threading
+import time
+import unittest
+import BrewPiCommand
+from BrewPiCommand import ArduinoCommands
+
+
+class FakePort:
+	def __init__(self):
+		self.written = []
+
+	def write(self, data):
+		self.written.append(data)
+
+
+class ArduinoCommandsTestCase(unittest.TestCase):
+	def setUp(self):
+		self.port = FakePort()
+		self.commands = ArduinoCommands(self.port, timeout=1)
+
+	def test_replyCompletesOldestCommandOfItsType(self):
+		first = self.commands.send('c')
+		self.commands.pump()
+		second = self.commands.send('c')
+		settings = self.commands.send('s')
+		self.assertEqual(self.port.written, ['c'])
+		self.assertTrue(self.commands.handleLine('C:{"Kp":1}\n') is first)
+		self.commands.pump()
+		self.assertTrue(self.commands.handleLine('C:{"Kp":2}\n') is second)
+		self.commands.pump()
+		self.assertTrue(self.commands.handleLine('S:{"mode":"b"}\n') is settings)
+		self.assertEqual(self.port.written, ['c', 'c', 's'])
+		self.assertEqual(first.wait(), 'C:{"Kp":1}\n')
+		self.assertEqual(self.commands.waiting('C'), None)
+
+	def test_commandsWithoutReplyReturnNone(self):
+		self.assertEqual(self.commands.send('j{mode:o}'), None)
+		self.assertEqual(self.commands.handleLine('D:{}\n'), None)
+
+	def test_waitReturnsReplyFromOtherThread(self):
+		self.commands.start()
+		future = self.commands.send('d{}')
+		timer = threading.Timer(0.05, self.commands.handleLine, ['d:[]\n'])
+		timer.start()
+		self.assertEqual(future.wait(), 'd:[]\n')
+		timer.join()
+		self.commands.stop()
+
+	def test_unansweredCommandTimesOut(self):
+		future = self.commands.send('v', timeout=0.05)
+		self.commands.pump()
+		start = time.time()
+		self.assertEqual(future.wait(), None)
+		self.assertTrue(time.time() - start < 0.5)
+		self.assertTrue(future.expired())
+		next = self.commands.send('v')
+		self.assertEqual(self.commands.pump(), None)
+		self.assertTrue(self.commands.handleLine('V:{}\n') is next)
+
+	def test_queuedRequestsAreDeduplicated(self):
+		self.commands.send('l')
+		self.commands.pump()
+		first = self.commands.send('s')
+		self.assertTrue(self.commands.send('s') is first)
+		self.assertTrue(self.commands.send('s') is first)
+		self.commands.handleLine('L:[]\n')
+		self.commands.pump()
+		self.assertEqual(self.port.written, ['l', 's'])
+
+	def test_consecutiveSettingsAreMerged(self):
+		self.commands.send('l')
+		self.commands.pump()
+		self.commands.send('j{mode:b, beerSet:20.0}')
+		self.commands.send('j{"beerSet": 21.5, "fridgeSet": 18}')
+		self.commands.send('s')
+		self.commands.send('j{mode:f}')
+		self.commands.handleLine('L:[]\n')
+		self.commands.pump(time.time() + 10)
+		self.assertEqual(self.port.written[:2], ['l', 'j{mode:b,beerSet:21.5,fridgeSet:18}'])
+
+	def test_overwrittenSettingKeepsItsLaterPosition(self):
+		self.commands.send('j{beerSet:20}')
+		self.commands.send('j{tempFormat:F}')
+		self.commands.send('j{beerSet:68}')
+		self.commands.pump()
+		self.assertEqual(self.port.written, ['j{tempFormat:F,beerSet:68}'])
+
+	def test_stopCancelsWaitingCommands(self):
+		future = self.commands.send('s')
+		self.commands.stop()
+		self.assertTrue(future.done())
+		self.assertEqual(future.line, None)
+		self.assertEqual(self.commands.waiting('S'), None)
+		self.assertEqual(self.commands.send('s'), None)
+
+	def test_commandsAreNotWrittenFasterThanTheArduinoReplies(self):
+		now = time.time()
+		self.commands.send('j{mode:b}')
+		self.commands.send('s')
+		delay = self.commands.pump(now)
+		self.assertEqual(self.port.written, ['j{mode:b}'])
+		self.assertTrue(delay > 0)
+		self.assertEqual(self.commands.pump(now + delay + 0.001), None)
+		self.assertEqual(self.port.written, ['j{mode:b}', 's'])
+
+	def test_longSettingsAreSplit(self):
+		settings = [('key%d' % i, '%d.000' % i) for i in range(10)]
+		commands = BrewPiCommand.settingsCommands(settings)
+		self.assertTrue(len(commands) > 1)
+		self.assertTrue(all(len(c) <= BrewPiCommand.maxCommandLength for c in commands))
+		merged = []
+		for c in commands:
+			merged += BrewPiCommand.parseSettings(c)
+		self.assertEqual(merged, settings)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+import unittest
+import simplejson as json
+import BrewPiCommand
+import BrewPiSerial
+from BrewPiController import Controller
+
+
+class FakePort:
+	def __init__(self):
+		self.written = []
+
+	def write(self, data):
+		self.written.append(data)
+		return len(data)
+
+	def close(self):
+		pass
+
+
+class ControllerTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		os.makedirs(os.path.join(self.dir, 'www'))
+		configFile = os.path.join(self.dir, 'test.cfg')
+		open(configFile, 'w').write("scriptPath = %s/\nwwwPath = %s/www/\nbeerName = Test\n" % (self.dir, self.dir))
+		self.controller = Controller(configFile, 'test')
+		self.port = FakePort()
+		self.controller.commands = BrewPiCommand.ArduinoCommands(self.port)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_getters(self):
+		self.assertEqual(self.controller.handleMessage('ack'), 'ack')
+		self.assertEqual(json.loads(self.controller.handleMessage('lcd'))[0], 'Script starting up')
+		self.assertEqual(self.controller.handleMessage('refreshControlSettings'), None)
+
+	def test_setBeerSendsSettingsAndPollsNow(self):
+		self.controller.cs = dict(mode='f', beerSet=20.0, fridgeSet=20.0)
+		self.controller.handleMessage('setBeer=18.5')
+		self.assertEqual(self.controller.cs['beerSet'], 18.5)
+		self.assertTrue(self.controller.pollDue(0) <= 0)
+		self.controller.commands.pump()
+		self.assertEqual(self.port.written, ["j{mode:b, beerSet:18.5}"])
+
+	def test_linesUpdateState(self):
+		self.controller.lineDispatcher.dispatchLines(['S:{"mode":"o","beerSet":19.0}\n', 'L:["a","b \xb0C"]\n',
+													   'd:[{"i":0}]\n', 'h:[]\n'])
+		self.assertEqual(self.controller.handleMessage('getMode'), 'o')
+		self.assertEqual(self.controller.lcdText, ['a', 'b &degC'])
+		self.assertEqual(self.controller.deviceList['listState'], 'dh')
+
+	def test_cachedRepliesFollowState(self):
+		controller = self.controller
+		controller.lineDispatcher.dispatch('S:{"mode":"b","beerSet":19.0}\n')
+		reply = controller.handleMessage('getControlSettings')
+		controller.lineDispatcher.dispatch('S:{"mode":"b","beerSet":19.0}\n')
+		self.assertTrue(controller.handleMessage('getControlSettings') is reply)
+		controller.handleMessage('setOff')
+		self.assertEqual(json.loads(controller.handleMessage('getControlSettings'))['mode'], 'o')
+		controller.lineDispatcher.dispatch('S:{"mode":"f","beerSet":19.0}\n')
+		self.assertEqual(json.loads(controller.handleMessage('getControlSettings'))['mode'], 'f')
+
+	def test_subscribersGetChanges(self):
+		controller = self.controller
+		subscription = controller.handleMessage('subscribe=lcd,cs')
+		self.assertEqual(json.loads(subscription.reply)['state']['lcd'][0], 'Script starting up')
+		controller.lineDispatcher.dispatch('L:["Mode","Beer",""," "]\n')
+		controller.handleMessage('setOff')
+		events = [json.loads(event) for event in subscription.events]
+		self.assertEqual([event['topic'] for event in events], ['lcd', 'cs'])
+		self.assertEqual(events[1]['diff'], dict(mode='o'))
+
+	def test_batch(self):
+		controller = self.controller
+		controller.lineDispatcher.dispatch('S:{"mode":"f","beerSet":19.0,"fridgeSet":18.0}\n')
+		replies = json.loads(controller.handleMessage('batch=["getMode", "getFridge", "setOff", "getMode", "subscribe"]'))
+		self.assertEqual(replies, ['f', '18.0', None, 'o', None])
+		self.assertEqual(controller.handleMessage('batch=lcd'), None)
+
+	def test_batchIsTimedAsOneRequest(self):
+		controller = self.controller
+		controller.handleMessage('batch=["getMode", "nonsense"]')
+		timings = controller.metrics.toDict()['timings']
+		self.assertEqual(sorted(timings), ['request.batch'])
+
+	def test_batchWaitsForRefresh(self):
+		controller = self.controller
+		reply = controller.handleMessage('batch=["refreshControlSettings", "getControlSettings", "getMode"]')
+		self.assertFalse(reply.ready())
+		controller.commands.pump()
+		future = controller.commands.handleLine('S:{"mode":"o"}\n')
+		self.assertTrue(future is not None and reply.ready())
+		replies = json.loads(reply.result())
+		self.assertEqual(json.loads(replies[1]), dict(mode='o'))
+		self.assertEqual(replies[2], 'b')
+
+	def test_waitingReplyIsSentWhenSerialCloses(self):
+		controller = self.controller
+		reply = controller.handleMessage('batch=["refreshControlSettings", "getControlSettings"]')
+		self.assertFalse(reply.ready())
+		controller.commands.stop()  # like closeSerial before programming the Arduino
+		self.assertTrue(reply.ready())
+		self.assertEqual(json.loads(json.loads(reply.result())[1])['mode'], controller.cs['mode'])
+
+	def test_getStats(self):
+		controller = self.controller
+		controller.lineDispatcher.dispatchLines(['L:["a"]\n', 'S:{"mode":"b",\n'])
+		controller.handleMessage('lcd')
+		controller.handleMessage('noSuchMessage')
+		controller.handleMessage('setOff')
+		controller.commands.pump()
+		stats = json.loads(controller.handleMessage('getStats'))
+		self.assertEqual(stats['serialIn']['S']['errors'], 1)
+		self.assertEqual(stats['serialOut']['j'], dict(count=1, bytes=len('j{mode:o}')))
+		self.assertEqual(stats['controller']['counters']['decodeErrors'], 1)
+		timings = stats['controller']['timings']
+		self.assertEqual([timings[name]['count'] for name in ['request.lcd', 'request.invalid', 'request.setOff']],
+						 [1, 1, 1])
+		self.assertTrue('rss' in stats['process'])
+
+	def test_badDataQueriesAreIgnored(self):
+		open(os.path.join(self.dir, 'www', 'wwwSettings.json'), 'w').write('{}')
+		self.controller.startBeer('Test')
+		for query in ['{"to":"x"}', '{"resolution":[1]}', '[1]', 'x']:
+			self.assertEqual(self.controller.handleMessage('getData=' + query), None)
+		self.controller.dataLogger.close()
+
+	def test_serialErrorReopensPort(self):
+		open(os.path.join(self.dir, 'www', 'wwwSettings.json'), 'w').write('{}')
+		self.controller.startBeer('Test')
+		self.controller.ser = self.port
+		self.controller.serialReader = BrewPiSerial.SerialReader(self.port)  # never started, like a reader that died
+		opened = []
+		self.controller.openSerial = lambda: len(opened) > 1 or opened.append(1)
+		self.controller.poll(1000)
+		self.assertEqual((self.controller.ser, self.controller.serialRetryTime), (None, 1005))
+		self.controller.poll(1004)
+		self.assertEqual(len(opened), 1)
+		self.controller.poll(1005)
+		self.assertEqual((len(opened), self.controller.serialRetryTime), (2, 1015))
+		self.controller.poll(1015)
+		self.assertEqual(self.controller.serialRetryTime, None)
+		self.assertTrue(self.controller.running)
+		self.controller.dataLogger.close()
+
+	def test_quit(self):
+		self.controller.handleMessage('quit')
+		self.assertFalse(self.controller.running)
+		self.assertFalse(self.controller.restart)
+		self.assertTrue(self.controller.stopProcess)
+
+if __name__ == '__main__':
+	unittest.main()
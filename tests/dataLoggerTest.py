@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import unittest
+import simplejson as json
+from BrewPiDataLogger import DataLogger
+
+
+def sampleRow(beerTemp):
+	return {"BeerTemp": beerTemp, "BeerSet": 20.0, "BeerAnn": None, "FridgeTemp": 18.0,
+			"FridgeSet": 18.0, "FridgeAnn": None, "RoomTemp": None, "State": 0}
+
+
+class DataLoggerTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.dataPath = os.path.join(self.dir, 'data') + '/'
+		self.wwwPath = os.path.join(self.dir, 'www') + '/'
+		os.makedirs(self.dataPath)
+		os.makedirs(self.wwwPath)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def publishedRows(self):
+		return len(json.load(open(self.wwwPath + 'beer-today.json'))['rows'])
+
+	def publishedCsvLines(self):
+		return len(open(self.wwwPath + 'beer.csv').readlines())
+
+	def test_samplesAreCommittedInBatches(self):
+		logger = DataLogger(flushRows=3, fsync=False, chartPoints=10)
+		logger.startBeer(self.dataPath, self.wwwPath, 'beer', 'beer-today.json')
+		logger.add(sampleRow(19.0), 6000)
+		logger.add(sampleRow(19.1), 6060)
+		self.assertEqual(self.publishedRows(), 0)
+		logger.add(sampleRow(19.2), 6120)
+		self.assertEqual(self.publishedRows(), 3)
+		self.assertEqual(self.publishedCsvLines(), 3)
+		logger.add(sampleRow(19.3), 6180)
+		self.assertEqual(len(logger.store), 4)
+		logger.close()
+		self.assertEqual(self.publishedRows(), 4)
+		self.assertEqual(self.publishedCsvLines(), 4)
+
+	def test_commitIfDueUsesInterval(self):
+		logger = DataLogger(flushRows=0, flushInterval=3600)
+		logger.startBeer(self.dataPath, self.wwwPath, 'beer', 'beer-today.json')
+		logger.add(sampleRow(19.0), 6000)
+		logger.commitIfDue()
+		self.assertEqual(self.publishedRows(), 0)
+		logger.lastCommit -= 3600
+		logger.commitIfDue()
+		self.assertEqual(self.publishedRows(), 1)
+		logger.close()
+
+	def test_withoutWwwCopies(self):
+		logger = DataLogger(flushRows=1, fsync=False, chartPoints=10)
+		logger.startBeer(self.dataPath, None, 'beer', 'beer-today.json')
+		logger.add(sampleRow(19.0), 6000)
+		logger.newDataTable(self.dataPath + 'beer-tomorrow.json')
+		logger.close()
+		self.assertEqual(len(json.load(open(self.dataPath + 'beer-today.json'))['rows']), 1)
+		self.assertEqual(os.listdir(self.wwwPath), [])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+import simplejson as json
+from BrewPiDecoder import decodeTemperatures, decodeLcd
+
+
+class DecodeTemperaturesTestCase(unittest.TestCase):
+	def test_keysAreRenamed(self):
+		row = decodeTemperatures('{"bt":19.85,"bs":20.00,"ba":null,"s":0,"Log1":1.5}')
+		self.assertEqual(row, dict(BeerTemp=19.85, BeerSet=20.0, BeerAnn=None, State=0, Log1=1.5))
+
+	def test_invalidLine(self):
+		self.assertRaises(ValueError, decodeTemperatures, '{"bt":19.8')
+
+
+class DecodeLcdTestCase(unittest.TestCase):
+	def test_sameAsJson(self):
+		for data in ['["Mode   Beer Const.","Beer    19.2  15.0 \xb0C", "Fridge   4.1   1.0 \xb0C", "Idling"]\r\n',
+					 '["Mode", "say \\"hi\\"", "a, b", "c"]',
+					 '[ "spaces around", "the list" ]',
+					 '[]']:
+			self.assertEqual(decodeLcd(data), json.loads(data.replace('\xb0', '&deg')))
+
+	def test_degreeSign(self):
+		self.assertEqual(decodeLcd('["20.0 \xb0C"]'), ['20.0 &degC'])
+
+	def test_invalidLine(self):
+		self.assertRaises(ValueError, decodeLcd, '["Mode", "Beer"')
+
+if __name__ == '__main__':
+	unittest.main()
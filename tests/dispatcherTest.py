@@ -0,0 +1,42 @@
+import unittest
+from BrewPiDispatcher import LineDispatcher
+
+
+class LineDispatcherTestCase(unittest.TestCase):
+	def setUp(self):
+		self.errors = []
+		self.unknown = []
+		self.dispatcher = LineDispatcher(lambda line, e: self.errors.append(line), self.unknown.append)
+
+	def test_handlerGetsParsedValue(self):
+		received = []
+		self.dispatcher.register('T', lambda value, line, receivedTime: received.append((value, receivedTime)))
+		self.assertTrue(self.dispatcher.dispatch('T:{"bt": 20.5}\n', 123.0))
+		self.assertEqual(received, [({"bt": 20.5}, 123.0)])
+
+	def test_rawData(self):
+		self.dispatcher.collect('U', None)
+		self.dispatcher.dispatchLines([(1.0, 'U:{"i":1}\r\n')])
+		self.assertEqual(self.dispatcher.values['U'], '{"i":1}')
+
+	def test_statsPerType(self):
+		self.dispatcher.collect('S')
+		self.dispatcher.dispatchLines(['S:{"mode":"b"}\n', 'S:{"mode":"f"}\n', 'S:{mode\n', 'x\n'])
+		self.assertEqual(self.dispatcher.values['S'], {"mode": "f"})
+		stats = self.dispatcher.statsDict()
+		self.assertEqual(stats['S']['count'], 3)
+		self.assertEqual(stats['S']['errors'], 1)
+		self.assertEqual(stats['S']['bytes'], 38)
+		self.assertEqual(stats['?']['count'], 1)
+		self.assertEqual(self.errors, ['S:{mode\n'])
+		self.assertEqual(self.unknown, ['x\n'])
+
+	def test_handlerExceptionIsCountedAndRaised(self):
+		def fail(value, line, receivedTime):
+			raise KeyError('BeerTemp')
+		self.dispatcher.register('T', fail)
+		self.assertRaises(KeyError, self.dispatcher.dispatch, 'T:{}\n')
+		self.assertEqual(self.dispatcher.stats['T'].errors, 1)
+
+if __name__ == '__main__':
+	unittest.main()
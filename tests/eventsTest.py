@@ -0,0 +1,42 @@
+import unittest
+import simplejson as json
+import BrewPiEvents
+from BrewPiEvents import Publisher, diff
+
+
+class DiffTestCase(unittest.TestCase):
+	def test_dict(self):
+		self.assertEqual(diff(dict(a=1, b=2, c=3), dict(a=1, b=4, d=5)), dict(b=4, c=None, d=5))
+		self.assertEqual(diff(dict(a=1), dict(a=1)), {})
+
+	def test_list(self):
+		self.assertEqual(diff(['Mode', 'Beer 20.0'], ['Mode', 'Beer 19.9']), {1: 'Beer 19.9'})
+
+	def test_topics(self):
+		self.assertEqual(BrewPiEvents.parseTopics('lcd, cs'), ['lcd', 'cs'])
+		self.assertEqual(BrewPiEvents.parseTopics(''), list(BrewPiEvents.topics))
+		self.assertRaises(ValueError, BrewPiEvents.parseTopics, 'lcd,fridge')
+
+
+class PublisherTestCase(unittest.TestCase):
+	def test_onlyChangesAreSentToSubscribers(self):
+		publisher = Publisher()
+		state = dict(lcd=['a', 'b'], cs=dict(mode='b'))
+		subscription = publisher.subscribe('cs', state)
+		self.assertEqual(json.loads(subscription.reply), dict(topic='subscribed', state=dict(cs=dict(mode='b'))))
+		publisher.publish('lcd', ['a', 'b'], ['a', 'c'])
+		publisher.publish('cs', dict(mode='b'), dict(mode='b'))
+		publisher.publish('cs', dict(mode='b'), dict(mode='o'), 10.0)
+		self.assertEqual([json.loads(event) for event in subscription.events],
+						 [dict(topic='cs', time=10.0, diff=dict(mode='o'))])
+
+	def test_closedSubscriptionsAreDropped(self):
+		publisher = Publisher()
+		subscription = publisher.subscribe('', dict((topic, {}) for topic in BrewPiEvents.topics))
+		self.assertTrue(publisher.watching('cv'))
+		subscription.closed = True
+		self.assertFalse(publisher.watching('cv'))
+		self.assertEqual(publisher.subscriptions, [])
+
+if __name__ == '__main__':
+	unittest.main()
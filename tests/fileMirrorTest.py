@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+from BrewPiMirror import FileMirror
+
+
+class FileMirrorTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.source = os.path.join(self.dir, 'source.json')
+		self.destination = os.path.join(self.dir, 'published.json')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def writeSource(self, content):
+		f = open(self.source, 'wb')
+		f.write(content)
+		f.close()
+
+	def published(self):
+		return open(self.destination, 'rb').read()
+
+	def test_publishedFileFollowsRewrittenTail(self):
+		mirror = FileMirror(self.source, self.destination, 2)
+		content = '{"rows":[]}'
+		for row in ['1', '2', '3', '4']:
+			self.writeSource(content)
+			mirror.publish()
+			self.assertEqual(self.published(), content)
+			content = content[:-2] + (',' if row != '1' else '') + row + ']}'
+
+	def test_openedPublishedFileIsNotChangedByNextPublish(self):
+		mirror = FileMirror(self.source, self.destination)
+		self.writeSource('line 1\n')
+		mirror.publish()
+		reader = open(self.destination, 'rb')
+		self.writeSource('line 1\nline 2\n')
+		mirror.publish()
+		self.assertEqual(reader.read(), 'line 1\n')
+		self.assertEqual(self.published(), 'line 1\nline 2\n')
+
+	def test_closeRemovesShadowCopies(self):
+		mirror = FileMirror(self.source, self.destination)
+		self.writeSource('data')
+		mirror.publish()
+		mirror.publish()
+		mirror.close()
+		self.assertEqual(sorted(os.listdir(self.dir)), ['published.json', 'source.json'])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,121 @@
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+import simplejson as json
+import BrewPiHttp
+import BrewPiSocket
+from BrewPiHttp import HttpConnection, HttpHandler, parseRange
+
+
+class FakeController:
+	def __init__(self, scriptPath):
+		self.config = dict(scriptPath=scriptPath)
+		self.messages = []
+
+	def handleMessage(self, message):
+		self.messages.append(message)
+		return '["Mode", "Beer"]' if message == 'lcd' else 'b'
+
+	def liveState(self):
+		return dict(cs=dict(mode='b'))
+
+
+class HttpTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		os.makedirs(os.path.join(self.dir, 'data', 'Test'))
+		open(os.path.join(self.dir, 'data', 'Test', 'Test.csv'), 'wb').write('0123456789')
+		open(os.path.join(self.dir, 'secret.txt'), 'wb').write('secret')
+		self.controller = FakeController(self.dir + '/')
+		self.handler = HttpHandler(self.controller)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def get(self, path, *headers):
+		connection = HttpConnection(None, None, None)
+		connection.inBuffer = 'GET %s HTTP/1.1\r\n%s\r\n' % (path, ''.join(header + '\r\n' for header in headers))
+		request = connection.messages()[0]
+		data = connection.frame(self.handler.handle(request))
+		while connection.streaming():
+			data += connection.readStream()
+		head, body = data.split('\r\n\r\n', 1)
+		lines = head.split('\r\n')
+		return int(lines[0].split()[1]), dict(line.split(': ', 1) for line in lines[1:]), body
+
+	def test_requestsArePipelined(self):
+		connection = HttpConnection(None, None, None)
+		connection.inBuffer = 'GET /a HTTP/1.1\r\nHost: x\r\n\r\nGET /b?c HTTP/1.0\r\n\r\nGET /d HTTP/1.1\r\n\r\n'
+		requests = connection.messages()
+		self.assertEqual([(request.path, request.query, request.keepAlive) for request in requests],
+						 [('/a', '', True), ('/b', 'c', False)])
+		self.assertTrue(connection.closing)
+
+	def test_getters(self):
+		status, headers, body = self.get('/api/lcd')
+		self.assertEqual((status, json.loads(body)), (200, ['Mode', 'Beer']))
+		status, headers, body = self.get('/api/getData?%7B%22from%22%3A1%7D')
+		self.assertEqual(json.loads(body), 'b')
+		self.assertEqual(self.controller.messages[-1], 'getData={"from":1}')
+		self.assertEqual(self.get('/api/setOff')[0], 404)
+		self.assertEqual(json.loads(self.get('/api/state')[2]), dict(cs=dict(mode='b')))
+
+	def test_dataFiles(self):
+		status, headers, body = self.get('/data/Test/Test.csv')
+		self.assertEqual((status, headers['Content-Type'], body), (200, 'text/csv', '0123456789'))
+		self.assertEqual(self.get('/data/Test/Test.csv', 'If-None-Match: ' + headers['ETag'])[0], 304)
+		status, headers, body = self.get('/data/Test/Test.csv', 'Range: bytes=2-4')
+		self.assertEqual((status, headers['Content-Range'], body), (206, 'bytes 2-4/10', '234'))
+		self.assertEqual(self.get('/data/Test/Test.csv', 'Range: bytes=10-')[0], 416)
+		self.assertEqual(self.get('/data/../secret.txt')[0], 404)
+
+	def test_dataFilesAreStreamedInChunks(self):
+		chunkSize, maxDataSize = BrewPiHttp.chunkSize, BrewPiHttp.maxDataSize
+		BrewPiHttp.chunkSize, BrewPiHttp.maxDataSize = 3, 4
+		try:
+			status, headers, body = self.get('/data/Test/Test.csv')
+			self.assertEqual((status, headers['Content-Length'], body), (200, '10', '0123456789'))
+			status, headers, body = self.get('/data/Test/Test.csv', 'Range: bytes=3-')
+			self.assertEqual((status, headers['Content-Range'], body), (206, 'bytes 3-6/10', '3456'))
+		finally:
+			BrewPiHttp.chunkSize, BrewPiHttp.maxDataSize = chunkSize, maxDataSize
+
+	def test_largeFileIsServedBeforeNextRequest(self):
+		content = ''.join(chr(65 + i % 26) for i in range(300000))
+		open(os.path.join(self.dir, 'data', 'Test', 'big.csv'), 'wb').write(content)
+		listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		listener.bind(os.path.join(self.dir, 'http'))
+		listener.listen(1)
+		server = BrewPiSocket.SocketServer()
+		server.addListener(listener, self.handler.handle, HttpConnection)
+		client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		client.connect(os.path.join(self.dir, 'http'))
+		client.sendall('GET /data/Test/big.csv HTTP/1.1\r\n\r\nGET /api/lcd HTTP/1.0\r\n\r\n')
+		client.settimeout(0.01)
+		data = ''
+		for i in range(1000):
+			server.serve(0.01)
+			try:
+				received = client.recv(65536)
+			except socket.timeout:
+				continue
+			if not received:
+				break
+			data += received
+		client.close()
+		listener.close()
+		first, second = data.split('HTTP/1.1 200 OK', 2)[1:]
+		self.assertTrue(first.endswith('\r\n\r\n' + content))
+		self.assertTrue(second.endswith('["Mode", "Beer"]'))
+
+	def test_parseRange(self):
+		self.assertEqual(parseRange('bytes=-3', 10), (7, 10))
+		self.assertEqual(parseRange('bytes=5-', 10), (5, 10))
+		self.assertEqual(parseRange('bytes=5-100', 10), (5, 10))
+		self.assertEqual(parseRange('bytes=0-1,5-6', 10), None)
+		self.assertRaises(ValueError, parseRange, 'bytes=-0', 10)
+
+if __name__ == '__main__':
+	unittest.main()
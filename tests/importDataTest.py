@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import brewpiJson
+import BrewPiStore
+import importData
+
+
+def sampleRow(i):
+	return {"BeerTemp": 19.0 + i / 100.0, "BeerSet": 20.0, "BeerAnn": "dry hop" if i == 2 else None,
+			"FridgeTemp": 18.5, "FridgeSet": 18.0, "FridgeAnn": None, "RoomTemp": 21.5, "State": i % 4}
+
+
+class ImportDataTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.beerPath = os.path.join(self.dir, 'Test Beer') + '/'
+		os.makedirs(self.beerPath)
+		self.startTime = float(int(time.mktime((2013, 6, 29, 10, 0, 0, 0, 0, -1))))
+		# rows 0-5 are in both files, rows 6-9 only in the CSV file, like after a day change
+		jsonFileName = self.beerPath + 'Test Beer-2013-06-29.json'
+		brewpiJson.newEmptyFile(jsonFileName)
+		writer = brewpiJson.DataTableWriter(jsonFileName)
+		for i in range(6):
+			writer.addRow(sampleRow(i), self.startTime + 60 * i)
+		writer.close()
+		csvFile = open(self.beerPath + 'Test Beer.csv', 'wb')
+		for i in range(10):
+			csvFile.write(BrewPiStore.csvLine(sampleRow(i), self.startTime + 60 * i))
+		csvFile.close()
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_csvLinesOfOldFormatAreRead(self):
+		fileName = os.path.join(self.dir, 'old.csv')
+		open(fileName, 'wb').write("Sep 26 2012 00:01:00;18.96;19.00;None;19.94;19.60;None\ngarbage\n")
+		rows, skipped = importData.parseCsvFile(fileName)
+		self.assertEqual(skipped, 1)
+		timestamp, values = rows[0]
+		self.assertEqual(time.localtime(timestamp)[:6], (2012, 9, 26, 0, 1, 0))
+		self.assertEqual(dict(zip(importData.rowKeys, values)),
+						 {"BeerTemp": 18.96, "BeerSet": 19.0, "BeerAnn": None, "FridgeTemp": 19.94,
+						  "FridgeSet": 19.6, "FridgeAnn": None, "RoomTemp": None, "State": None})
+
+	def test_jsonRowsWithoutValidTimeAreSkipped(self):
+		fileName = self.beerPath + 'Test Beer-2013-06-29.json'
+		data = open(fileName, 'rb').read()
+		dates = [brewpiJson.jsonDate(self.startTime + 60 * i) for i in [1, 2]]
+		data = data.replace('"' + dates[0] + '"', '"Date(x)"').replace('{"v":"' + dates[1] + '"}', 'null')
+		open(fileName, 'wb').write(data)
+		rows, skipped = importData.parseJsonFile(fileName)
+		self.assertEqual((len(rows), skipped), (4, 2))
+
+	def test_importMergesFilesIntoStore(self):
+		results = importData.importBeers(self.dir, processes=2)
+		self.assertEqual(results, {'Test Beer': 10})
+		store = BrewPiStore.TimeSeriesStore(self.beerPath + 'store', readOnly=True)
+		rows = list(store.rows())
+		store.close()
+		self.assertEqual([row['Time'] for row in rows], [self.startTime + 60 * i for i in range(10)])
+		self.assertEqual(rows[2]['BeerAnn'], 'dry hop')
+		self.assertEqual(rows[9]['State'], 1)
+
+	def test_unchangedBeersAreSkipped(self):
+		importData.importBeers(self.dir, processes=1)
+		self.assertEqual(importData.importBeers(self.dir, processes=1), {'Test Beer': 'already imported'})
+		self.assertEqual(importData.importBeers(self.dir, processes=1, reindex=True), {'Test Beer': 10})
+
+	def test_interruptedImportIsCleanedUp(self):
+		importData.importBeers(self.dir, processes=1)
+		os.rename(self.beerPath + 'store', self.beerPath + 'store.old')
+		os.makedirs(self.beerPath + 'store.import')
+		self.assertEqual(importData.importBeers(self.dir, processes=1), {'Test Beer': 'already imported'})
+		self.assertFalse(os.path.exists(self.beerPath + 'store.import'))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+import simplejson as json
+import brewpiJson
+import BrewPiJournal
+
+
+class JournalTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.fileName = os.path.join(self.dir, 'beer.csv')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def writeFile(self, fileName, content):
+		f = open(fileName, 'wb')
+		f.write(content)
+		f.close()
+
+	def test_interruptedWriteIsReplayed(self):
+		self.writeFile(self.fileName, 'line 1\nline')
+		journal = BrewPiJournal.Journal(self.fileName, fsync=False)
+		journal.write(7, 'line 2\nline 3\n')
+		self.assertTrue(BrewPiJournal.replay(self.fileName))
+		self.assertEqual(open(self.fileName).read(), 'line 1\nline 2\nline 3\n')
+		self.assertFalse(os.path.exists(BrewPiJournal.journalFileName(self.fileName)))
+
+	def test_incompleteJournalIsIgnored(self):
+		self.writeFile(self.fileName, 'line 1\n')
+		journal = BrewPiJournal.Journal(self.fileName, fsync=False)
+		journal.write(7, 'line 2\n')
+		journal.file.truncate(BrewPiJournal.headerSize + 3)
+		journal.file.flush()
+		self.assertFalse(BrewPiJournal.replay(self.fileName))
+		self.assertEqual(open(self.fileName).read(), 'line 1\n')
+
+	def test_brokenDataTableIsRepaired(self):
+		fileName = os.path.join(self.dir, 'beer.json')
+		row = {"BeerTemp": 19.5, "BeerSet": 20.0, "BeerAnn": None, "FridgeTemp": 18.0,
+			   "FridgeSet": 18.0, "FridgeAnn": None, "RoomTemp": None, "State": 0}
+		brewpiJson.newEmptyFile(fileName)
+		brewpiJson.addRow(fileName, row)
+		brewpiJson.addRow(fileName, row)
+		complete = open(fileName).read()
+		for cut in [1, 2, 3, 20]:
+			self.writeFile(fileName, complete[:-cut])
+			self.assertTrue(brewpiJson.repairFile(fileName))
+			rows = json.load(open(fileName))['rows']
+			self.assertEqual(len(rows), 2 if cut < 3 else 1)
+		self.assertFalse(brewpiJson.repairFile(fileName))
+
+	def test_recoverBeerRepairsAllFiles(self):
+		self.writeFile(self.fileName, 'line 1\nli')
+		jsonFileName = os.path.join(self.dir, 'beer.json')
+		self.writeFile(jsonFileName, '{"cols":[],"rows":[')
+		repaired = BrewPiJournal.recoverBeer(self.dir)
+		self.assertEqual(sorted(repaired), ['beer.csv', 'beer.json'])
+		self.assertEqual(json.load(open(jsonFileName))['rows'], [])
+
+	def test_recoverBeerLeavesOtherFilesAlone(self):
+		os.mkdir(os.path.join(self.dir, 'store'))
+		statsFileName = os.path.join(self.dir, 'store', 'stats.txt')
+		self.writeFile(statsFileName, '{"count": 1')
+		self.writeFile(os.path.join(self.dir, 'notes.txt'), 'line 1\nli')
+		self.assertEqual(BrewPiJournal.recoverBeer(self.dir), [])
+		self.assertEqual(open(statsFileName).read(), '{"count": 1')
+
+if __name__ == '__main__':
+	unittest.main()
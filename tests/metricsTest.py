@@ -0,0 +1,32 @@
+import unittest
+import BrewPiMetrics
+from BrewPiMetrics import Metrics, Timing
+
+
+class MetricsTestCase(unittest.TestCase):
+	def test_timingPercentiles(self):
+		timing = Timing(samples=100)
+		for i in range(200):
+			timing.add(i / 1000.0)
+		result = timing.toDict()
+		self.assertEqual(result['count'], 200)
+		self.assertEqual(result['maxSeconds'], 0.199)
+		self.assertEqual((result['p50'], result['p90'], result['p99']), (0.15, 0.19, 0.199))  # last 100 samples
+
+	def test_metrics(self):
+		metrics = Metrics()
+		with metrics.time('dataCommit'):
+			pass
+		metrics.count('decodeErrors')
+		metrics.count('decodeErrors', 2)
+		result = metrics.toDict()
+		self.assertEqual(result['timings']['dataCommit']['count'], 1)
+		self.assertEqual(result['counters'], dict(decodeErrors=3))
+
+	def test_processDict(self):
+		result = BrewPiMetrics.processDict()
+		self.assertTrue(result['rss'] > 0)
+		self.assertTrue(result['uptimeSeconds'] >= 0)
+
+if __name__ == '__main__':
+	unittest.main()
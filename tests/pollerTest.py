@@ -0,0 +1,38 @@
+import unittest
+from BrewPiPoller import DemandPoller
+
+
+class DemandPollerTestCase(unittest.TestCase):
+	def setUp(self):
+		self.poller = DemandPoller(activeInterval=0.5, idleInterval=60, demandTimeout=60)
+
+	def pollTimes(self, start, stop, step=0.5):
+		times = []
+		t = start
+		while t < stop:
+			if self.poller.due('l', t):
+				times.append(t)
+			t += step
+		return times
+
+	def test_slowPollingWithoutClients(self):
+		self.assertEqual(self.pollTimes(0, 300), [0, 60, 120, 180, 240])
+
+	def test_fastPollingWhileWatched(self):
+		self.poller.due('l', 0)
+		self.poller.demand('l', 10)
+		self.assertEqual(len(self.pollTimes(10, 20)), 20)
+		# back to the slow rate when the client stops asking
+		self.assertEqual(len(self.pollTimes(70, 200)), 3)
+
+	def test_demandTriggersPollImmediately(self):
+		self.poller.due('l', 0)
+		self.assertFalse(self.poller.due('l', 5))
+		self.poller.demand('l', 5)
+		self.assertTrue(self.poller.due('l', 5))
+		# other keys keep their own schedule: never polled, so due once, then idle
+		self.assertTrue(self.poller.due('s', 5))
+		self.assertFalse(self.poller.due('s', 6))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import BrewPiRecorder
+
+
+class FakePort:
+	def __init__(self, chunks):
+		self.chunks = list(chunks)
+		self.timeout = 0.1
+
+	def read(self, size=1):
+		return self.chunks.pop(0) if self.chunks else ''
+
+	def write(self, data):
+		return len(data)
+
+	def close(self):
+		pass
+
+
+class RecorderTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.fileName = os.path.join(self.dir, 'serial.capture')
+		ser = BrewPiRecorder.RecordingSerial(FakePort(['N:{"v":"0.2.0"}\n', 'T:{"bt":19', '.5}\n']), self.fileName)
+		ser.read(100)
+		ser.write('t')
+		time.sleep(0.05)
+		ser.read(100)
+		ser.read(100)
+		self.assertEqual(ser.timeout, 0.1)  # other attributes are taken from the port
+		ser.close()
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_bothDirectionsAreRecorded(self):
+		records = list(BrewPiRecorder.readCapture(self.fileName))
+		self.assertEqual([(direction, data) for offset, direction, data in records],
+						 [('r', 'N:{"v":"0.2.0"}\n'), ('w', 't'), ('r', 'T:{"bt":19'), ('r', '.5}\n')])
+		self.assertTrue(records[2][0] - records[1][0] >= 0.05)
+
+	def test_incompleteRecordIsIgnored(self):
+		data = open(self.fileName, 'rb').read()
+		open(self.fileName, 'wb').write(data[:-2])
+		self.assertEqual(len(list(BrewPiRecorder.readCapture(self.fileName))), 3)
+
+	def test_replayAtSpeed(self):
+		ser = BrewPiRecorder.ReplaySerial(self.fileName, speed=1, timeout=0.01)
+		self.assertEqual(ser.readline(), 'N:{"v":"0.2.0"}\n')
+		self.assertEqual(ser.read(100), '')  # the next line was received 50 ms later
+		time.sleep(0.06)
+		self.assertEqual(ser.inWaiting(), len('T:{"bt":19.5}\n'))
+		self.assertEqual(ser.readlines(), ['T:{"bt":19.5}\n'])
+		self.assertTrue(ser.done())
+
+	def test_replayAsFastAsPossible(self):
+		ser = BrewPiRecorder.ReplaySerial(self.fileName, speed=0, timeout=0.01)
+		self.assertEqual(ser.read(5), 'N:{"v')
+		self.assertEqual(ser.readlines(), ['":"0.2.0"}\n', 'T:{"bt":19.5}\n'])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,28 @@
+import unittest
+from BrewPiReplyCache import ReplyCache
+
+
+class ReplyCacheTestCase(unittest.TestCase):
+	def setUp(self):
+		self.cache = ReplyCache()
+		self.builds = 0
+
+	def build(self):
+		self.builds += 1
+		return 'reply %d' % self.builds
+
+	def test_buildsOncePerInvalidation(self):
+		self.assertEqual(self.cache.get('lcdText', self.build), 'reply 1')
+		self.assertEqual(self.cache.get('lcdText', self.build), 'reply 1')
+		self.cache.invalidate('cs', 'lcdText')
+		self.assertEqual(self.cache.get('lcdText', self.build), 'reply 2')
+		self.assertEqual(self.cache.toDict(), dict(cached=['lcdText'], hits=1, misses=2))
+
+	def test_invalidateAll(self):
+		self.cache.get('cs', self.build)
+		self.cache.get(('pinList', 'leonardo', 'revC'), self.build)
+		self.cache.invalidate()
+		self.assertEqual(self.cache.replies, {})
+
+if __name__ == '__main__':
+	unittest.main()
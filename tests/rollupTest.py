@@ -0,0 +1,139 @@
+import os
+import shutil
+import tempfile
+import unittest
+import simplejson as json
+import BrewPiRollup
+from BrewPiStore import TimeSeriesStore
+
+
+def sampleRow(beerTemp, state=0):
+	return {"BeerTemp": beerTemp, "BeerSet": 20.0, "BeerAnn": None, "FridgeTemp": 18.0,
+			"FridgeSet": None, "FridgeAnn": None, "RoomTemp": None, "State": state}
+
+
+class RollupTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.fileName = os.path.join(self.dir, 'rollup.json')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_completedBucketsAreWritten(self):
+		rollup = BrewPiRollup.Rollup(self.fileName, 60)
+		self.assertFalse(rollup.add(sampleRow(19.0, 1), 6000))
+		self.assertFalse(rollup.add(sampleRow(20.0, 1), 6030))
+		self.assertFalse(rollup.add(sampleRow(21.0, 2), 6059))
+		self.assertTrue(rollup.add(sampleRow(22.0), 6060))
+		rollup.close()
+		table = json.load(open(self.fileName))
+		self.assertEqual(len(table['rows']), 1)
+		cells = [c['v'] if c else None for c in table['rows'][0]['c']]
+		self.assertEqual(cells[1:4], [20.0, 19.0, 21.0])  # BeerTemp mean, min, max
+		self.assertEqual(cells[10:13], [None, None, None])  # FridgeSet was never logged
+		self.assertEqual(cells[-1], 1)  # most common state
+		self.assertEqual(len(cells), len(table['cols']))
+
+	def test_completedBucketsWaitForCommit(self):
+		rollup = BrewPiRollup.Rollup(self.fileName, 60)
+		rollup.add(sampleRow(19.0), 6000)
+		rollup.add(sampleRow(20.0), 6060)
+		self.assertEqual(len(json.load(open(self.fileName))['rows']), 0)
+		rollup.commit(fsync=False)
+		self.assertEqual(len(json.load(open(self.fileName))['rows']), 1)
+		rollup.close()
+
+	def test_openBucketIsContinuedFromStore(self):
+		store = TimeSeriesStore(os.path.join(self.dir, 'store'))
+		for i, t in enumerate([6000, 6040, 6070, 6080]):
+			store.append(sampleRow(19.0 + i), t)
+		rollup = BrewPiRollup.Rollup(self.fileName, 60)
+		rollup.seed(store)
+		self.assertEqual(rollup.bucket.start, 6060)
+		self.assertEqual(rollup.bucket.count['BeerTemp'], 2)
+		store.close()
+
+	def test_uncommittedBucketsAreRebuiltFromStore(self):
+		store = TimeSeriesStore(os.path.join(self.dir, 'store'))
+		for t in [6000, 6060, 6120, 6180, 6190]:
+			store.append(sampleRow(t / 100.0), t)
+		rollup = BrewPiRollup.Rollup(self.fileName, 60)
+		rollup.add(sampleRow(60.0), 6000)
+		rollup.add(sampleRow(60.6), 6060)
+		rollup.commit(fsync=False)  # the buckets after 6000 were lost in a crash
+		rollup.close()
+		rollup = BrewPiRollup.Rollup(self.fileName, 60)
+		rollup.seed(store)
+		rollup.close()
+		table = json.load(open(self.fileName))
+		self.assertEqual([row['c'][1]['v'] for row in table['rows']], [60.0, 60.6, 61.2])
+		self.assertEqual(rollup.bucket.count['BeerTemp'], 2)
+		store.close()
+
+	def test_chartIsBuiltFromSlowestTierAndTail(self):
+		store = TimeSeriesStore(os.path.join(self.dir, 'store'))
+		rollups = BrewPiRollup.BeerRollups(store, self.dir, None, 'beer', chartPoints=3)
+		start = 36000
+		for i in range(10 * 60):
+			t = start + i * 60  # ten hours of samples, one per minute
+			row = sampleRow(20.0 + i % 60)
+			if i == 30:
+				row['BeerAnn'] = 'dry hop'
+			store.append(row, t)
+			rollups.add(row, t)
+		rollups.commit(fsync=False)
+		rollups.close()
+		rows = json.load(open(os.path.join(self.dir, 'rollup', 'beer-chart.json')))['rows']
+		# 3 of the 9 hourly means, the annotated sample and the 60 samples of the open hour
+		self.assertEqual(len(rows), 3 + 1 + 60)
+		self.assertEqual(len([row for row in rows if row['c'][3]]), 1)
+		store.close()
+
+	def test_largestTrianglesKeepsPeaks(self):
+		times = range(100)
+		values = [0.0] * 100
+		values[37] = 10.0
+		values[50] = None
+		selected = BrewPiRollup.largestTriangles(times, values, 10)
+		self.assertEqual(len(selected), 10)
+		self.assertTrue(37 in selected)
+		self.assertFalse(50 in selected)
+		self.assertEqual((selected[0], selected[-1]), (0, 99))
+
+	def test_queryReturnsRowsInWindow(self):
+		store = TimeSeriesStore(os.path.join(self.dir, 'store'))
+		for i in range(10):
+			store.append(sampleRow(19.0 + i), 6000 + 30 * i)
+		raw = json.loads(BrewPiRollup.queryJson(store, 6030, 6090))
+		self.assertEqual([r['c'][1]['v'] for r in raw['rows']], [20.0, 21.0, 22.0])
+		perMinute = json.loads(BrewPiRollup.queryJson(store, None, None, '1m'))
+		self.assertEqual([r['c'][1]['v'] for r in perMinute['rows']], [19.5, 21.5, 23.5, 25.5, 27.5])
+		store.close()
+
+	def test_largeQueriesAreAggregated(self):
+		store = TimeSeriesStore(os.path.join(self.dir, 'store'))
+		for i in range(30):
+			store.append(sampleRow(19.0), 6000 + 60 * i)
+		maxQueryRows = BrewPiRollup.maxQueryRows
+		BrewPiRollup.maxQueryRows = 10
+		try:
+			table = json.loads(BrewPiRollup.queryJson(store))
+			self.assertEqual(table['p']['resolution'], 900)  # the 15m tier is the first with at most 10 buckets
+			self.assertEqual(len(table['rows']), 3)
+			table = json.loads(BrewPiRollup.queryJson(store, None, 6000 + 60 * 5))
+			self.assertEqual((table['p']['resolution'], len(table['rows'])), (0, 6))
+		finally:
+			BrewPiRollup.maxQueryRows = maxQueryRows
+		store.close()
+
+	def test_queryRejectsBadParameters(self):
+		store = TimeSeriesStore(os.path.join(self.dir, 'store'))
+		for fromTime, toTime, resolution in [(None, 'x', 0), ('1', None, 0), (None, None, [1]), (None, None, 'day'),
+											 (None, None, -60), (None, None, float('nan'))]:
+			self.assertRaises(ValueError, BrewPiRollup.queryJson, store, fromTime, toTime, resolution)
+		self.assertEqual(json.loads(BrewPiRollup.queryJson(store, 6000, None, 60))['rows'], [])
+		store.close()
+
+if __name__ == '__main__':
+	unittest.main()
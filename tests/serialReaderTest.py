@@ -0,0 +1,81 @@
+import threading
+import time
+import unittest
+from BrewPiSerial import SerialReader
+
+
+class FakePort:
+	"""
+	Returns the given chunks of data from read(), like a serial port with a timeout
+	"""
+	def __init__(self, chunks):
+		self.chunks = list(chunks)
+		self.lock = threading.Lock()
+
+	def inWaiting(self):
+		with self.lock:
+			return len(self.chunks[0]) if self.chunks else 0
+
+	def read(self, size=1):
+		with self.lock:
+			if self.chunks:
+				return self.chunks.pop(0)
+		time.sleep(0.01)
+		return ''
+
+
+class SerialReaderTestCase(unittest.TestCase):
+	def readAll(self, reader, count):
+		lines = []
+		for i in range(100):
+			lines += reader.readLines()
+			if len(lines) >= count:
+				break
+			time.sleep(0.01)
+		return lines
+
+	def test_linesAreFramedAcrossReads(self):
+		reader = SerialReader(FakePort(['T:{"BeerTemp":19', '.5}\nL:["a",', '"b"]\n\r\nS:{}', '\n']))
+		reader.start()
+		lines = self.readAll(reader, 3)
+		reader.stop()
+		self.assertEqual(lines, ['T:{"BeerTemp":19.5}\n', 'L:["a","b"]\n', 'S:{}\n'])
+		self.assertFalse(reader.isAlive())
+
+	def test_linesAreTimestamped(self):
+		reader = SerialReader(FakePort(['N:{}\n']))
+		before = time.time()
+		reader.start()
+		for i in range(100):
+			if not reader.queue.empty():
+				break
+			time.sleep(0.01)
+		messages = reader.readMessages()
+		reader.stop()
+		self.assertEqual(len(messages), 1)
+		self.assertTrue(before <= messages[0][0] <= time.time())
+		self.assertEqual(reader.readMessages(), [])
+
+	def test_readErrorStopsReader(self):
+		port = FakePort([])
+		port.read = lambda size: 1 / 0
+		reader = SerialReader(port)
+		reader.start()
+		reader.join(1)
+		self.assertFalse(reader.isAlive())
+		self.assertTrue(isinstance(reader.error, ZeroDivisionError))
+
+	def test_listenerErrorDoesNotStopReader(self):
+		def listener(line, receivedTime):
+			if line.startswith('X'):
+				raise ValueError("bad line")
+		reader = SerialReader(FakePort(['X:1\n', 'T:{}\n']), listener)
+		reader.start()
+		lines = self.readAll(reader, 2)
+		self.assertTrue(reader.isAlive())
+		reader.stop()
+		self.assertEqual(lines, ['X:1\n', 'T:{}\n'])
+		self.assertEqual(reader.error, None)
+
+if __name__ == '__main__':
+	unittest.main()
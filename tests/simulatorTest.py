@@ -0,0 +1,48 @@
+import unittest
+import simplejson as json
+from brewpiVersion import AvrInfo
+from BrewPiSimulator import ArduinoSimulator, FridgeModel, COOLING, HEATING
+
+
+class ArduinoSimulatorTestCase(unittest.TestCase):
+	def setUp(self):
+		self.simulator = ArduinoSimulator(FridgeModel(roomTemp=25.0, beerTemp=24.0))
+
+	def reply(self, data):
+		return self.simulator.receive(data).splitlines()
+
+	def test_repliesToCommands(self):
+		lines = self.reply('nts')
+		self.assertEqual([line[0] for line in lines], ['N', 'T', 'S'])
+		self.assertEqual(AvrInfo(lines[0][2:]).version, "0.2.0")
+		self.assertEqual(json.loads(lines[1][2:])['BeerTemp'], 24.0)
+		lcd = self.reply('l')[0]
+		self.assertEqual(len(json.loads(lcd[2:].replace('\xb0', '&deg'))), 4)
+
+	def test_commandsAreFramedAcrossReads(self):
+		self.assertEqual(self.reply('j{beerSet:18'), [])
+		self.assertEqual(self.reply('.5}d'), [])
+		self.assertEqual(self.reply('{}')[0][0], 'd')
+		self.assertEqual(json.loads(self.reply('s')[0][2:])['beerSet'], 18.5)
+
+	def test_invalidCommandIsLogged(self):
+		line = self.reply('x')[0]
+		self.assertEqual(json.loads(line[2:])['V'], [ord('x')])
+
+	def test_controlCoolsWarmBeer(self):
+		self.reply('j{beerSet:18.0}')
+		states = set()
+		for hour in range(48):
+			self.simulator.step(3600)
+			states.add(self.simulator.state)
+		self.assertTrue(COOLING in states)
+		self.assertAlmostEqual(self.simulator.model.beerTemp, 18.0, delta=0.5)
+
+	def test_fridgeConstantHeats(self):
+		self.simulator = ArduinoSimulator(FridgeModel(roomTemp=10.0, beerTemp=15.0))
+		self.reply('j{mode:f, fridgeSet:20.0}')
+		self.simulator.step(600)
+		self.assertEqual(self.simulator.state, HEATING)
+
+if __name__ == '__main__':
+	unittest.main()
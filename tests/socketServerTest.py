@@ -0,0 +1,135 @@
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+from BrewPiSocket import BrewPiSocket, Connection, DeferredReply, SocketServer, Subscription
+
+
+class ConnectionFramingTestCase(unittest.TestCase):
+	def receive(self, *chunks):
+		connection = Connection(None, None, None)
+		messages = []
+		for chunk in chunks:
+			connection.inBuffer += chunk
+			messages += connection.messages()
+		return connection, messages
+
+	def test_singleMessage(self):
+		connection, messages = self.receive('setBeer=20.5')
+		self.assertEqual(messages, ['setBeer=20.5'])
+		self.assertTrue(connection.closing)
+		self.assertEqual(connection.frame(None), '')
+
+	def test_lines(self):
+		connection, messages = self.receive('lcd\ngetMode\r\nget', 'Beer\n')
+		self.assertEqual(messages, ['lcd', 'getMode', 'getBeer'])
+		self.assertFalse(connection.closing)
+		self.assertEqual(connection.frame(None), '\n')
+
+	def test_lengthPrefixed(self):
+		big = 'setParameters=' + 'x' * 10000
+		data = '%d:%s3:lcd' % (len(big), big)
+		connection, messages = self.receive('1', data[1:5000], data[5000:])
+		self.assertEqual(messages, [big, 'lcd'])
+		self.assertEqual(connection.frame('ack'), '3:ack')
+
+	def test_invalidLengthPrefix(self):
+		connection, messages = self.receive('3:lcd')
+		connection.inBuffer = 'lcd'
+		self.assertEqual(connection.messages(), None)
+
+
+class BrewPiSocketConfigTestCase(unittest.TestCase):
+	def test_useInetSocketIsParsed(self):
+		for value, socketType in [('true', 'i'), ('True', 'i'), ('false', 'f'), ('False', 'f')]:
+			sock = BrewPiSocket({'useInetSocket': value, 'scriptPath': '/tmp/'})
+			self.assertEqual(sock.type, socketType)
+
+
+class SocketServerTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, 'BEERSOCKET')
+		self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.listener.bind(self.path)
+		self.listener.listen(10)
+		self.server = SocketServer()
+		self.ready = False
+		self.server.addListener(self.listener, self.handle)
+
+	def tearDown(self):
+		self.listener.close()
+		shutil.rmtree(self.dir)
+
+	def handle(self, message):
+		if message == 'subscribe':
+			self.subscription = Subscription('subscribed')
+			return self.subscription
+		if message == 'later':
+			return DeferredReply(lambda: self.ready, lambda: 'done')
+		if message == 'big':
+			return ''.join(chr(65 + i % 26) for i in range(500000))
+		if message == 'broken':
+			return DeferredReply(lambda: True, lambda: 1 / 0)
+		return None if message == 'none' else message.upper()
+
+	def connect(self, data):
+		client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		client.connect(self.path)
+		client.sendall(data)
+		client.settimeout(2)
+		return client
+
+	def serveUntil(self, client, length):
+		data = ''
+		while len(data) < length:
+			self.server.serve(0.01)
+			try:
+				client.settimeout(0.01)
+				data += client.recv(4096)
+			except socket.timeout:
+				pass
+		return data
+
+	def test_clientsAreServedTogether(self):
+		first = self.connect('one\n')
+		second = self.connect('two')
+		self.assertEqual(self.serveUntil(second, 3), 'TWO')
+		self.assertEqual(self.serveUntil(first, 4), 'ONE\n')
+		first.sendall('none\nthree\n')
+		self.assertEqual(self.serveUntil(first, 7), '\nTHREE\n')
+
+	def test_deferredReplyKeepsOrder(self):
+		client = self.connect('later\nafter\n')
+		self.server.serve(0.01)
+		self.server.serve(0.01)
+		self.ready = True
+		self.assertEqual(self.serveUntil(client, 11), 'done\nAFTER\n')
+
+	def test_deferredErrorClosesOnlyItsConnection(self):
+		client = self.connect('one\nbroken\nafter\n')
+		other = self.connect('two\n')
+		self.assertEqual(self.serveUntil(client, 4), 'ONE\n')
+		self.assertEqual(self.serveUntil(other, 4), 'TWO\n')
+		self.server.serve(0.01)
+		self.assertEqual(client.recv(4096), '')  # closed without the replies after the error
+		self.assertEqual(len(self.server.connections), 1)
+
+	def test_largeReplyIsSentInParts(self):
+		client = self.connect('big')
+		self.assertEqual(self.serveUntil(client, 500000), self.handle('big'))
+
+	def test_subscriptionPushesEvents(self):
+		client = self.connect('subscribe')
+		self.assertEqual(self.serveUntil(client, 11), 'subscribed\n')
+		self.subscription.push('{"topic": "lcd"}')
+		client.sendall('one\n')
+		self.assertEqual(self.serveUntil(client, 21), '{"topic": "lcd"}\nONE\n')
+		client.close()
+		self.server.serve(0.01)
+		self.assertTrue(self.subscription.closed)
+		self.assertEqual(self.server.connections, {})
+
+if __name__ == '__main__':
+	unittest.main()
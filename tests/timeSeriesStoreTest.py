@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+import simplejson as json
+from BrewPiStore import TimeSeriesStore, exportJson, exportCsv
+
+
+def sampleRow(i):
+	return {"BeerTemp": 19.0 + i / 100.0, "BeerSet": 20.0, "BeerAnn": "started" if i == 1 else None,
+			"FridgeTemp": None, "FridgeSet": 18.0, "FridgeAnn": None, "RoomTemp": 21.5, "State": i % 8}
+
+
+class TimeSeriesStoreTestCase(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.store = TimeSeriesStore(os.path.join(self.dir, 'store'))
+		self.startTime = 1372500000.0
+		for i in range(10):
+			self.store.append(sampleRow(i), self.startTime + 60 * i)
+
+	def tearDown(self):
+		self.store.close()
+		shutil.rmtree(self.dir)
+
+	def test_rowsAreReadBack(self):
+		rows = list(self.store.rows(1, 3))
+		self.assertEqual(len(rows), 2)
+		self.assertEqual(rows[0]['BeerTemp'], 19.01)
+		self.assertEqual(rows[0]['FridgeTemp'], None)
+		self.assertEqual(rows[0]['BeerAnn'], "started")
+		self.assertEqual(rows[1]['State'], 2)
+		self.assertEqual(rows[1]['Time'], self.startTime + 120)
+
+	def test_annotationsAreCommittedWithRows(self):
+		self.store.flush()
+		annotationFileName = os.path.join(self.dir, 'store', 'annotations.txt')
+		self.store.append(dict(sampleRow(10), BeerAnn='pending'), self.startTime + 600)
+		self.assertFalse('pending' in open(annotationFileName).read())
+		open(annotationFileName, 'ab').write('10\tBeerAnn\tleft by a crash\n')
+		reopened = TimeSeriesStore(os.path.join(self.dir, 'store'))
+		self.assertEqual(len(reopened), 10)
+		self.assertFalse('crash' in open(annotationFileName).read())
+		self.assertEqual(reopened.annotations.get(10), None)
+		reopened.close()
+
+	def test_invalidValuesAreStoredAsMissing(self):
+		for i, state in enumerate(['x', 300, 2.0, float('nan')]):
+			self.store.append(dict(sampleRow(0), State=state, BeerTemp='?'), self.startTime + 600 + i)
+		rows = list(self.store.rows(10))
+		self.assertEqual([row['State'] for row in rows], [None, None, 2, None])
+		self.assertEqual(rows[0]['BeerTemp'], None)
+
+	def test_rangeFindsRowsBetweenTimes(self):
+		self.assertEqual(self.store.range(self.startTime + 60, self.startTime + 180), (1, 4))
+		self.assertEqual(self.store.range(self.startTime + 61, None), (2, 10))
+		self.assertEqual(self.store.range(None, self.startTime - 1), (0, 0))
+
+	def test_readerSeesRowsAppendedLater(self):
+		reader = TimeSeriesStore(os.path.join(self.dir, 'store'), readOnly=True)
+		self.assertEqual(len(reader), 0)  # rows are committed to the header by flush
+		self.store.flush(sync=False)
+		self.assertEqual(len(reader), 10)
+		for i in range(10, 5000):
+			self.store.append(sampleRow(i), self.startTime + 60 * i)
+		self.assertEqual(len(reader), 10)
+		self.store.flush()
+		self.assertEqual(len(reader), 5000)
+		self.assertEqual(reader.column('BeerSet', 4998), [20.0, 20.0])
+		reader.close()
+
+	def test_exportJsonIsValidDataTable(self):
+		fileName = os.path.join(self.dir, 'export.json')
+		exportJson(self.store, fileName, 0, 3)
+		rows = json.load(open(fileName))['rows']
+		self.assertEqual(len(rows), 3)
+		self.assertEqual(rows[1]['c'][3]['v'], "started")
+
+	def test_exportCsvHasLinePerRow(self):
+		fileName = os.path.join(self.dir, 'export.csv')
+		exportCsv(self.store, fileName)
+		lines = open(fileName).readlines()
+		self.assertEqual(len(lines), 10)
+		self.assertEqual(lines[0].split(';')[1:], ['19.0', '20.0', 'None', 'None', '18.0', 'None', '0', '21.5\n'])
+
+if __name__ == '__main__':
+	unittest.main()